@@ -0,0 +1,174 @@
+from datetime import timedelta
+
+from app.models import ActuationLateness, AppSetting
+from app.control_planner import ControlPlanner
+from app.logger import log_device_event
+from app.utils.circuit_breaker import shelly_circuit_breaker
+from app.utils.rate_limiter import shelly_rate_limiter
+from app.utils.time_utils import TimeUtils
+
+
+class ActuationScheduler:
+    """
+    Orders the work of one control pass against its deadline, the next 15-minute boundary.
+    Relay commands for transitions run first, devices whose thermostat is below
+    min_temperature next, verification reads last. When a group is predicted to
+    overrun the deadline its lowest-value reads are deferred to the next pass.
+    Every pass records how late each device was actuated (ActuationLateness)
+    and the first pass of each UTC day removes the records older than the
+    retention period.
+    """
+
+    PRIORITY_TRANSITION = 0
+    PRIORITY_THERMOSTAT_CRITICAL = 1
+    PRIORITY_VERIFY = 2
+
+    PERIOD_MINUTES = 15
+    SAFETY_MARGIN_SECONDS = 30  # Stop starting reads this close to the boundary
+    LAN_REQUEST_SECONDS = 0.5  # Estimated cost of one LAN request
+    DEFAULT_RETENTION_DAYS = 14
+
+    def __init__(self, start_time, reasons: dict, now=None):
+        self.start_time = start_time
+        self.deadline = start_time + timedelta(minutes=self.PERIOD_MINUTES)
+        self.reasons = reasons  # device_id -> ControlPlanner reason
+        self.now = now or TimeUtils.now_utc()
+        self.priorities = {}  # device_id -> priority
+        self.group_of = {}  # device_id -> group key
+        self.request_seconds = {}  # group key -> estimated seconds per request
+        self.deferred = {}  # device_id -> device
+        self.completed = {}  # device_id -> finished_at
+
+    @staticmethod
+    def is_thermostat_critical(device) -> bool:
+        """True when the device's thermostat reads below its min_temperature."""
+        thermostat = device.thermostat_device
+        if not thermostat or not thermostat.temperature_updated_at:
+            return False
+        return thermostat.current_temperature < thermostat.min_temperature
+
+    def priority_for(self, device) -> int:
+        reason = self.reasons.get(device.device_id)
+        if reason in (ControlPlanner.REASON_TRANSITION, ControlPlanner.REASON_DRIFT):
+            return self.PRIORITY_TRANSITION
+        if self.is_thermostat_critical(device):
+            return self.PRIORITY_THERMOSTAT_CRITICAL
+        return self.PRIORITY_VERIFY
+
+    def _estimate_request_seconds(self, group_key: str, device_list: list, health: dict) -> float:
+        """Seconds per request for a group: the rate limiter pace or the observed latency."""
+        if device_list[0].local_host:
+            return self.LAN_REQUEST_SECONDS
+        latency_ms = (health.get(group_key) or {}).get("latency_avg_ms") or 0
+        return max(shelly_rate_limiter.base_delay, latency_ms / 1000)
+
+    def _predicted_requests(self, device_list: list) -> int:
+        """Commands cost one request each; cloud reads share one bulk status request."""
+        commands = sum(
+            1 for d in device_list if self.priorities[d.device_id] == self.PRIORITY_TRANSITION
+        )
+        reads = len(device_list) - commands
+        if reads > 1 and not device_list[0].local_host:
+            reads = 1
+        return commands + reads
+
+    def schedule(self, device_groups: dict) -> dict:
+        """Returns the groups ordered by priority, with reads dropped where they would overrun."""
+        health = shelly_circuit_breaker.stats()
+        budget = (self.deadline - self.now).total_seconds() - self.SAFETY_MARGIN_SECONDS
+
+        scheduled = {}
+        for group_key, device_list in device_groups.items():
+            for device in device_list:
+                self.priorities[device.device_id] = self.priority_for(device)
+                self.group_of[device.device_id] = group_key
+            ordered = sorted(device_list, key=lambda d: self.priorities[d.device_id])
+            seconds = self._estimate_request_seconds(group_key, ordered, health)
+            self.request_seconds[group_key] = seconds
+
+            while (
+                ordered
+                and self.priorities[ordered[-1].device_id] == self.PRIORITY_VERIFY
+                and self._predicted_requests(ordered) * seconds > budget
+            ):
+                device = ordered.pop()
+                self.deferred[device.device_id] = device
+
+            if ordered:
+                scheduled[group_key] = ordered
+        return scheduled
+
+    def should_defer(self, group_key: str, device) -> bool:
+        """Runtime check before a device is processed: skip reads that can no longer finish in time."""
+        if self.priorities.get(device.device_id) != self.PRIORITY_VERIFY:
+            return False
+        margin = timedelta(
+            seconds=self.SAFETY_MARGIN_SECONDS + self.request_seconds.get(group_key, 0)
+        )
+        if TimeUtils.now_utc() + margin <= self.deadline:
+            return False
+        self.deferred[device.device_id] = device
+        return True
+
+    @staticmethod
+    def get_retention_days() -> int:
+        """Returns how long lateness records are kept (AppSetting ACTUATION_LATENESS_RETENTION_DAYS)."""
+        setting = AppSetting.objects.filter(key="ACTUATION_LATENESS_RETENTION_DAYS").first()
+        try:
+            return int(setting.value) if setting else ActuationScheduler.DEFAULT_RETENTION_DAYS
+        except (TypeError, ValueError):
+            return ActuationScheduler.DEFAULT_RETENTION_DAYS
+
+    def prune(self) -> int:
+        """Deletes lateness records older than the retention period (0 or less keeps all)."""
+        days = self.get_retention_days()
+        if days <= 0:
+            return 0
+        deleted, _ = ActuationLateness.objects.filter(
+            period_start__lt=self.start_time - timedelta(days=days)
+        ).delete()
+        return deleted
+
+    def mark_done(self, device) -> None:
+        self.completed[device.device_id] = TimeUtils.now_utc()
+
+    def record_pass(self, devices: list) -> None:
+        """Stores actuation lateness for every scheduled device with one bulk insert."""
+        if self.start_time.hour == 0 and self.start_time.minute < self.PERIOD_MINUTES:
+            self.prune()
+        rows = []
+        missed = 0
+        for device in devices:
+            device_id = device.device_id
+            if device_id not in self.priorities:
+                continue
+            finished_at = self.completed.get(device_id)
+            deferred = device_id in self.deferred
+            deadline_missed = finished_at is not None and finished_at > self.deadline
+            missed += deadline_missed
+            rows.append(
+                ActuationLateness(
+                    device=device,
+                    period_start=self.start_time,
+                    reason=self.reasons.get(device_id, ""),
+                    priority=self.priorities[device_id],
+                    group_key=self.group_of.get(device_id, ""),
+                    lateness_seconds=(
+                        (finished_at - self.start_time).total_seconds() if finished_at else None
+                    ),
+                    deferred=deferred,
+                    deadline_missed=deadline_missed,
+                )
+            )
+        if not rows:
+            return
+        ActuationLateness.objects.bulk_create(rows)
+
+        latenesses = [r.lateness_seconds for r in rows if r.lateness_seconds is not None]
+        log_device_event(
+            None,
+            f"Actuation: {len(latenesses)} devices done, max lateness "
+            f"{max(latenesses) if latenesses else 0:.1f}s, {len(self.deferred)} reads deferred, "
+            f"{missed} past the deadline",
+            "WARN" if self.deferred or missed else "INFO",
+        )
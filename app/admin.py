@@ -9,12 +9,24 @@ from .models import (
     DeviceAssignment,
     AppSetting,
     UserProfile,
+    DeviceState,
+    ActuationLateness,
+    PriceBackfillChunk,
+    PriceFetchAttempt,
 )
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from app.utils.time_utils import TimeUtils
 import pytz
 
 
+def keep_local_password(obj, change):
+    """The password is never rendered back, so an empty field keeps the stored one."""
+    if change and not obj.local_password:
+        obj.local_password = (
+            type(obj).objects.filter(pk=obj.pk).values_list("local_password", flat=True).first() or ""
+        )
+
+
 ### SHELLY DEVICE ADMIN ###
 class ShellyDeviceAdmin(admin.ModelAdmin):
     list_display = (
@@ -33,6 +45,7 @@ class ShellyDeviceAdmin(admin.ModelAdmin):
         "last_contact",
         "relay_channel",
         "shelly_server",
+        "bidding_zone",
         "thermostat_device",
     )
 
@@ -54,6 +67,7 @@ class ShellyDeviceAdmin(admin.ModelAdmin):
         "device_id",
         "created_at",
         "updated_at",
+        "plan_version",
     )  # 'user' is editable for admins
 
     fields = (
@@ -65,13 +79,22 @@ class ShellyDeviceAdmin(admin.ModelAdmin):
         "day_transfer_price",
         "night_transfer_price",
         "auto_assign_price_threshold",
+        "schedule_mode",
+        "min_run_minutes",
+        "max_off_minutes",
+        "max_runs_per_plan",
+        "rated_power_w",
         "created_at",
         "updated_at",
+        "plan_version",
         "user",
         "status",
         "last_contact",
         "relay_channel",
         "shelly_server",
+        "local_host",
+        "local_password",
+        "bidding_zone",
         "thermostat_device",
     )
 
@@ -86,6 +109,7 @@ class ShellyDeviceAdmin(admin.ModelAdmin):
         """Ensure new devices are owned by the user who creates them if not set."""
         if not change and not request.user.is_superuser:
             obj.user = request.user
+        keep_local_password(obj, change)
         super().save_model(request, obj, form, change)
 
     def get_queryset(self, request):
@@ -116,6 +140,9 @@ class ShellyDeviceAdmin(admin.ModelAdmin):
         formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
         if db_field.name == "shelly_device_name":
             formfield.label = "Shelly device id"
+        if db_field.name == "local_password":
+            formfield.widget = forms.PasswordInput(render_value=False)
+            formfield.help_text = "Leave empty to keep the current password."
         return formfield
 
 
@@ -159,6 +186,8 @@ class ShellyTemperatureAdmin(admin.ModelAdmin):
         "updated_at",
         "user",
         "shelly_server",
+        "local_host",
+        "local_password",
     )
     ordering = ["-device_id"]
     formfield_overrides = {
@@ -176,6 +205,7 @@ class ShellyTemperatureAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not change and not request.user.is_superuser:
             obj.user = request.user
+        keep_local_password(obj, change)
         super().save_model(request, obj, form, change)
 
     def get_queryset(self, request):
@@ -194,6 +224,9 @@ class ShellyTemperatureAdmin(admin.ModelAdmin):
         formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
         if db_field.name == "shelly_device_name":
             formfield.label = "Shelly device id"
+        if db_field.name == "local_password":
+            formfield.widget = forms.PasswordInput(render_value=False)
+            formfield.help_text = "Leave empty to keep the current password."
         return formfield
 
 
@@ -207,13 +240,15 @@ class ElectricityPriceAdmin(admin.ModelAdmin):
         "get_start_time_user_tz",
         "get_end_time_user_tz",
         "get_price_c_kwh",
+        "bidding_zone",
+        "resolution_minutes",
         "get_price_with_vat",
         "get_created_at_user_tz",
     )
     search_fields = ("start_time", "end_time")
-    list_filter = ("start_time", "end_time")
+    list_filter = ("bidding_zone", "start_time", "end_time")
     ordering = ("-start_time",)
-    fields = ("start_time", "end_time", "price_kwh")  # Actual editable fields
+    fields = ("bidding_zone", "start_time", "end_time", "resolution_minutes", "price_kwh")  # Actual editable fields
     readonly_fields = (
         "get_start_time_user_tz",
         "get_end_time_user_tz",
@@ -308,6 +343,7 @@ class DeviceAssignmentAdmin(admin.ModelAdmin):
         "get_start_time_local",
         "get_end_time_local",
         "get_assigned_at_user_tz",
+        "source",
     )
     search_fields = (
         "user__username",
@@ -449,6 +485,34 @@ admin.site.register(DeviceAssignment, DeviceAssignmentAdmin)
 admin.site.register(AppSetting)
 
 
+### ACTUATION LATENESS ADMIN ###
+@admin.register(ActuationLateness)
+class ActuationLatenessAdmin(admin.ModelAdmin):
+    """Per-device actuation lateness of each control pass, for sizing devices per account."""
+
+    list_display = (
+        "device",
+        "period_start",
+        "reason",
+        "priority",
+        "lateness_seconds",
+        "deferred",
+        "deadline_missed",
+    )
+    list_filter = ("deferred", "deadline_missed", "reason", "group_key")
+    date_hierarchy = "period_start"
+
+
+### DEVICE STATE ADMIN ###
+@admin.register(DeviceState)
+class DeviceStateAdmin(admin.ModelAdmin):
+    """Read-only view of the cached device states."""
+
+    list_display = ("device", "channel", "output", "online", "power_w", "status_at", "command_at")
+    list_filter = ("output", "online")
+    readonly_fields = ("device", "channel", "output", "online", "power_w", "status_at", "command_at", "updated_at")
+
+
 ### USER PROFILE ADMIN ###
 class UserProfileInline(admin.StackedInline):
     """Inline admin for user profile."""
@@ -456,13 +520,13 @@ class UserProfileInline(admin.StackedInline):
     model = UserProfile
     can_delete = False
     verbose_name_plural = "Profile Settings"
-    fields = ("timezone",)
+    fields = ("timezone", "site_power_cap_w")
 
 
 class UserProfileAdmin(admin.ModelAdmin):
     """Standalone admin for user profiles."""
 
-    list_display = ("user", "timezone", "created_at", "updated_at")
+    list_display = ("user", "timezone", "site_power_cap_w", "created_at", "updated_at")
     list_filter = ("timezone",)
     search_fields = ("user__username", "user__email")
     readonly_fields = ("created_at", "updated_at")
@@ -485,3 +549,33 @@ class ExtendedUserAdmin(BaseUserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, ExtendedUserAdmin)
 admin.site.register(UserProfile, UserProfileAdmin)
+
+
+### PRICE BACKFILL ADMIN ###
+@admin.register(PriceBackfillChunk)
+class PriceBackfillChunkAdmin(admin.ModelAdmin):
+    """Checkpoints of the backfill_prices command; delete a row to fetch that month again."""
+
+    list_display = ("bidding_zone", "chunk_start", "chunk_end", "status", "rows", "attempts", "updated_at")
+    list_filter = ("status", "bidding_zone")
+    readonly_fields = ("error", "updated_at")
+    date_hierarchy = "chunk_start"
+
+
+### PRICE FETCH ATTEMPT ADMIN ###
+@admin.register(PriceFetchAttempt)
+class PriceFetchAttemptAdmin(admin.ModelAdmin):
+    """Scheduled price fetch attempts and how long after publication the data arrived."""
+
+    list_display = (
+        "delivery_day",
+        "attempt",
+        "outcome",
+        "expected_at",
+        "started_at",
+        "latency_to_data_seconds",
+        "missing_zones",
+        "duration_seconds",
+    )
+    list_filter = ("outcome",)
+    date_hierarchy = "delivery_day"
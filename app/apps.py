@@ -1,3 +1,5 @@
+import sys
+
 from django.apps import AppConfig
 
 
@@ -5,6 +7,9 @@ class AppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app"
 
+    # Management commands that run the price and control jobs themselves
+    NO_SCHEDULER_COMMANDS = {"backfill_prices", "replay_prices"}
+
     def ready(self):
         # Ensure required settings exist at startup
         from .models import AppSetting, DeviceLog
@@ -37,6 +42,30 @@ class AppConfig(AppConfig):
             if not AppSetting.objects.filter(key="CLEAR_LOGS_ON_STARTUP").exists():
                 AppSetting.objects.create(key="CLEAR_LOGS_ON_STARTUP", value="1")
 
+            # Ensure DEVICE_STATE_TTL_SECONDS exists (how long cached device states are trusted)
+            if not AppSetting.objects.filter(key="DEVICE_STATE_TTL_SECONDS").exists():
+                AppSetting.objects.create(key="DEVICE_STATE_TTL_SECONDS", value="3600")
+
+            # Ensure CONTROL_FULL_SWEEP_MINUTES exists (how often every device is read to catch manual overrides)
+            if not AppSetting.objects.filter(key="CONTROL_FULL_SWEEP_MINUTES").exists():
+                AppSetting.objects.create(key="CONTROL_FULL_SWEEP_MINUTES", value="60")
+
+            # Ensure ENTSOE_BIDDING_ZONES exists (comma separated zones fetched besides device zones)
+            if not AppSetting.objects.filter(key="ENTSOE_BIDDING_ZONES").exists():
+                AppSetting.objects.create(key="ENTSOE_BIDDING_ZONES", value="FI")
+
+            # Ensure PRICE_PUBLICATION_TIME exists (expected day-ahead publication, HH:MM market time CET)
+            if not AppSetting.objects.filter(key="PRICE_PUBLICATION_TIME").exists():
+                AppSetting.objects.create(key="PRICE_PUBLICATION_TIME", value="13:00")
+
+            # Ensure PRICE_SOURCE exists (entsoe, file or synthetic; file reads PRICE_SOURCE_FILE)
+            if not AppSetting.objects.filter(key="PRICE_SOURCE").exists():
+                AppSetting.objects.create(key="PRICE_SOURCE", value="entsoe")
+
+            # Ensure ACTUATION_LATENESS_RETENTION_DAYS exists (days of lateness records kept, 0 = keep all)
+            if not AppSetting.objects.filter(key="ACTUATION_LATENESS_RETENTION_DAYS").exists():
+                AppSetting.objects.create(key="ACTUATION_LATENESS_RETENTION_DAYS", value="14")
+
             # Clear all existing logs at startup (configurable)
             try:
                 clear_logs_setting = AppSetting.objects.filter(
@@ -56,6 +85,8 @@ class AppConfig(AppConfig):
             print(f"Warning: Could not initialize app settings (database not ready): {e}")
 
         # Start the APScheduler when Django starts
+        if len(sys.argv) > 1 and sys.argv[1] in self.NO_SCHEDULER_COMMANDS:
+            return
         try:
             from app.scheduler import start_scheduler
 
@@ -0,0 +1,103 @@
+from collections import Counter
+
+import pytz
+
+
+# Bidding zone code -> (ENTSO-E EIC area code, display name)
+BIDDING_ZONES = {
+    "FI": ("10YFI-1--------U", "Finland"),
+    "SE1": ("10Y1001A1001A44P", "Sweden SE1 (Luleå)"),
+    "SE2": ("10Y1001A1001A45N", "Sweden SE2 (Sundsvall)"),
+    "SE3": ("10Y1001A1001A46L", "Sweden SE3 (Stockholm)"),
+    "SE4": ("10Y1001A1001A47J", "Sweden SE4 (Malmö)"),
+    "NO1": ("10YNO-1--------2", "Norway NO1 (Oslo)"),
+    "NO2": ("10YNO-2--------T", "Norway NO2 (Kristiansand)"),
+    "NO3": ("10YNO-3--------J", "Norway NO3 (Trondheim)"),
+    "NO4": ("10YNO-4--------9", "Norway NO4 (Tromsø)"),
+    "NO5": ("10Y1001A1001A48H", "Norway NO5 (Bergen)"),
+    "DK1": ("10YDK-1--------W", "Denmark DK1 (West)"),
+    "DK2": ("10YDK-2--------M", "Denmark DK2 (East)"),
+    "EE": ("10Y1001A1001A39I", "Estonia"),
+    "LV": ("10YLV-1001A00074", "Latvia"),
+    "LT": ("10YLT-1001A0008Q", "Lithuania"),
+    "DE_LU": ("10Y1001A1001A82H", "Germany-Luxembourg"),
+    "NL": ("10YNL----------L", "Netherlands"),
+    "BE": ("10YBE----------2", "Belgium"),
+    "FR": ("10YFR-RTE------C", "France"),
+    "AT": ("10YAT-APG------L", "Austria"),
+    "PL": ("10YPL-AREA-----S", "Poland"),
+}
+
+# Local time zone of each bidding zone
+BIDDING_ZONE_TIMEZONES = {
+    "FI": "Europe/Helsinki",
+    "SE1": "Europe/Stockholm",
+    "SE2": "Europe/Stockholm",
+    "SE3": "Europe/Stockholm",
+    "SE4": "Europe/Stockholm",
+    "NO1": "Europe/Oslo",
+    "NO2": "Europe/Oslo",
+    "NO3": "Europe/Oslo",
+    "NO4": "Europe/Oslo",
+    "NO5": "Europe/Oslo",
+    "DK1": "Europe/Copenhagen",
+    "DK2": "Europe/Copenhagen",
+    "EE": "Europe/Tallinn",
+    "LV": "Europe/Riga",
+    "LT": "Europe/Vilnius",
+    "DE_LU": "Europe/Berlin",
+    "NL": "Europe/Amsterdam",
+    "BE": "Europe/Brussels",
+    "FR": "Europe/Paris",
+    "AT": "Europe/Vienna",
+    "PL": "Europe/Warsaw",
+}
+
+DEFAULT_BIDDING_ZONE = "FI"
+
+BIDDING_ZONE_CHOICES = [(code, name) for code, (_, name) in BIDDING_ZONES.items()]
+
+
+class BiddingZones:
+    """Lookups for the bidding zones prices are fetched for."""
+
+    @staticmethod
+    def eic(zone: str) -> str:
+        """ENTSO-E area code of a bidding zone."""
+        try:
+            return BIDDING_ZONES[zone][0]
+        except KeyError:
+            raise ValueError(f"Unknown bidding zone: {zone}")
+
+    @staticmethod
+    def timezone(zone: str):
+        """Local pytz time zone of a bidding zone."""
+        try:
+            return pytz.timezone(BIDDING_ZONE_TIMEZONES[zone])
+        except KeyError:
+            raise ValueError(f"Unknown bidding zone: {zone}")
+
+    @staticmethod
+    def configured() -> list:
+        """
+        Zones to fetch: AppSetting ENTSOE_BIDDING_ZONES (comma separated) plus
+        every zone a device is placed in. Unknown codes are ignored.
+        """
+        from app.models import AppSetting, ShellyDevice
+
+        setting = AppSetting.objects.filter(key="ENTSOE_BIDDING_ZONES").first()
+        zones = [
+            zone.strip().upper()
+            for zone in (setting.value if setting else DEFAULT_BIDDING_ZONE).split(",")
+            if zone.strip()
+        ]
+        zones += ShellyDevice.objects.values_list("bidding_zone", flat=True).distinct()
+        return sorted({zone for zone in zones if zone in BIDDING_ZONES})
+
+    @staticmethod
+    def for_user(user) -> str:
+        """The bidding zone most of the user's devices are in."""
+        from app.models import ShellyDevice
+
+        zones = Counter(ShellyDevice.objects.filter(user=user).values_list("bidding_zone", flat=True))
+        return zones.most_common(1)[0][0] if zones else DEFAULT_BIDDING_ZONE
@@ -0,0 +1,123 @@
+from decimal import ROUND_FLOOR, Decimal
+
+import numpy as np
+
+# Costs are integers in 1/100000 c/kWh: price_kwh has 5 decimal places and the
+# transfer prices and thresholds 1, so sums and threshold checks stay exact.
+UNITS_PER_CENT = 100000
+
+
+def to_units(value) -> int:
+    """c/kWh (Decimal, float or int) as integer cost units, rounded down."""
+    return int((Decimal(str(value)) * UNITS_PER_CENT).to_integral_value(rounding=ROUND_FLOOR))
+
+
+class PriceHorizon:
+    """
+    The upcoming prices of one bidding zone encoded once as arrays: price, period
+    length and the day/night mask in local time (07:00-22:00 is day time).
+    """
+
+    def __init__(self, start_times, prices_kwh, resolution_minutes, local_tz):
+        self.start_times = []
+        hours, minutes = [], []
+        for ts in start_times:
+            if ts.tzinfo is None:
+                ts = local_tz.localize(ts)
+            local_ts = ts.astimezone(local_tz)
+            self.start_times.append(ts)  # Keep the original tz for the caller
+            hours.append(local_ts.hour)
+            minutes.append(local_ts.minute)
+        hours = np.asarray(hours, dtype=np.int64)
+        minutes = np.asarray(minutes, dtype=np.int64)
+
+        self.prices = np.asarray([to_units(price) for price in prices_kwh], dtype=np.int64)
+        self.minutes = np.asarray(resolution_minutes, dtype=np.int64)
+        self.daytime = ((hours >= 7) & (hours < 22)) | ((hours == 22) & (minutes == 0))
+
+    @classmethod
+    def from_rows(cls, rows, local_tz) -> "PriceHorizon":
+        """From price dicts with start_time, price_kwh and optionally resolution_minutes."""
+        return cls(
+            [row["start_time"] for row in rows],
+            [row["price_kwh"] for row in rows],
+            [row.get("resolution_minutes", 15) for row in rows],
+            local_tz,
+        )
+
+    def __len__(self):
+        return len(self.start_times)
+
+
+class CheapestSlotPlanner:
+    """
+    Picks the cheapest periods for a whole fleet at once. Every device's day and
+    night transfer price is broadcast over the horizon into a (devices x periods)
+    cost matrix; each row takes the cheapest periods covering its run hours
+    (argpartition) plus every period at or below its auto-assign threshold.
+    """
+
+    @staticmethod
+    def cost_matrix(horizon: PriceHorizon, day_transfer_prices, night_transfer_prices) -> np.ndarray:
+        """Price plus the device's transfer price for every (device, period)."""
+        day = np.asarray([to_units(price) for price in day_transfer_prices], dtype=np.int64)
+        night = np.asarray([to_units(price) for price in night_transfer_prices], dtype=np.int64)
+        transfer = np.where(horizon.daytime[None, :], day[:, None], night[:, None])
+        return horizon.prices[None, :] + transfer
+
+    @staticmethod
+    def _cheapest(costs: np.ndarray, horizon: PriceHorizon, minutes_needed: np.ndarray) -> np.ndarray:
+        devices, periods = costs.shape
+        selected = np.zeros((devices, periods), dtype=bool)
+        rows = np.arange(devices)[:, None]
+        # Break ties by time, so replanning the same prices picks the same periods
+        costs = costs * periods + np.arange(periods)[None, :]
+
+        if periods and np.all(horizon.minutes == horizon.minutes[0]):
+            # One resolution: each device needs a fixed number of periods
+            counts = np.minimum(-(-minutes_needed // horizon.minutes[0]), periods)
+            kmax = int(counts.max(initial=0))
+            if kmax <= 0:
+                return selected
+            if kmax < periods:
+                candidates = np.argpartition(costs, kmax - 1, axis=1)[:, :kmax]
+            else:
+                candidates = np.broadcast_to(np.arange(periods), (devices, periods))
+            # Rank the kmax candidates so every device takes its own count of them
+            order = np.argsort(np.take_along_axis(costs, candidates, axis=1), axis=1)
+            ranked = np.take_along_axis(candidates, order, axis=1)
+            take = np.arange(kmax)[None, :] < counts[:, None]
+        else:
+            # Mixed resolutions (hourly history next to 15-minute prices): take
+            # the cheapest periods until they cover the run hours
+            ranked = np.argsort(costs, axis=1)
+            durations = horizon.minutes[ranked]
+            take = (np.cumsum(durations, axis=1) - durations) < minutes_needed[:, None]
+
+        selected[np.broadcast_to(rows, ranked.shape)[take], ranked[take]] = True
+        return selected
+
+    @staticmethod
+    def select(horizon: PriceHorizon, day_transfer_prices, night_transfer_prices, hours_needed,
+               price_thresholds) -> np.ndarray:
+        """
+        Boolean (devices x periods) matrix of the periods each device runs in.
+        The per-device sequences must have the same length; a threshold of None
+        forces no period.
+        """
+        costs = CheapestSlotPlanner.cost_matrix(horizon, day_transfer_prices, night_transfer_prices)
+        minutes_needed = np.asarray([int(hours or 0) * 60 for hours in hours_needed], dtype=np.int64)
+        selected = CheapestSlotPlanner._cheapest(costs, horizon, minutes_needed)
+        return selected | CheapestSlotPlanner.below_threshold(costs, price_thresholds)
+
+    @staticmethod
+    def below_threshold(costs: np.ndarray, price_thresholds) -> np.ndarray:
+        """Boolean matrix of the periods at or below each device's threshold (None: none)."""
+        has_threshold = np.asarray([threshold is not None for threshold in price_thresholds], dtype=bool)
+        if not has_threshold.any():
+            return np.zeros(costs.shape, dtype=bool)
+        thresholds = np.asarray(
+            [to_units(threshold) if threshold is not None else 0 for threshold in price_thresholds],
+            dtype=np.int64,
+        )
+        return has_threshold[:, None] & (costs <= thresholds[:, None])
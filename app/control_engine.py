@@ -0,0 +1,202 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from app.models import ShellyDevice
+from app.services.shelly_service import ShellyService
+from app.logger import log_device_event
+from app.device_state_manager import DeviceStateManager
+from app.utils.time_utils import TimeUtils
+
+
+class AsyncControlEngine:
+    """
+    Runs one control pass over all device groups with asyncio.
+    Every server+token group gets its own coroutine, so groups run concurrently
+    and are only limited by their own rate budget. Devices inside a group are
+    still processed one after another, paced by awaiting rate limiter slots.
+    """
+
+    # Threads doing the blocking ORM and HTTP work of the coroutines. A group
+    # waits on one blocking call at a time, so two threads per group leave room
+    # for its log writes. Each thread holds its own database connection and
+    # SQLite takes one writer at a time, so past 64 threads extra groups only add
+    # lock contention; groups beyond that share the pool and wait for a thread.
+    MAX_WORKER_THREADS = 64
+
+    def __init__(
+        self,
+        assigned_device_ids: set,
+        start_time,
+        device_states: dict = None,
+        state_ttl_seconds: int = 0,
+        scheduler=None,
+    ):
+        self.assigned_device_ids = assigned_device_ids  # Resolved once per control pass
+        self.start_time = start_time
+        self.device_states = device_states or {}  # device_id -> cached DeviceState
+        self.state_ttl_seconds = state_ttl_seconds
+        self.scheduler = scheduler  # Optional ActuationScheduler tracking the pass deadline
+        self.now = TimeUtils.now_utc()
+
+    def _cached_state(self, device: ShellyDevice):
+        """Returns the cached DeviceState when it is fresh enough to skip a status call."""
+        state = self.device_states.get(device.device_id)
+        if DeviceStateManager.is_fresh(state, self.state_ttl_seconds, self.now):
+            return state
+        return None
+
+    def run(self, device_groups: dict) -> None:
+        """Synchronous entry point so the APScheduler job can drive the engine."""
+        if not device_groups:
+            return
+
+        workers = min(self.MAX_WORKER_THREADS, len(device_groups) * 2)
+        executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="shelly-control"
+        )
+        try:
+            asyncio.run(self._run_groups(device_groups, executor))
+        finally:
+            executor.shutdown(wait=True)
+
+    async def _run_groups(self, device_groups: dict, executor: ThreadPoolExecutor) -> None:
+        asyncio.get_running_loop().set_default_executor(executor)
+
+        results = await asyncio.gather(
+            *(
+                self._run_group(group_key, device_list)
+                for group_key, device_list in device_groups.items()
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                await self._blocking(
+                    log_device_event,
+                    None,
+                    f"Error in device group processing: {str(result)}",
+                    "ERROR",
+                )
+
+    async def _run_group(self, group_key: str, device_list: list) -> None:
+        await self._blocking(
+            log_device_event,
+            None,
+            f"Processing group {group_key} with {len(device_list)} devices",
+            "INFO",
+        )
+
+        # One bulk status request per account instead of one request per device
+        account_statuses = {}
+        needs_status = [d for d in device_list if self._cached_state(d) is None]
+        if len(needs_status) > 1 and not device_list[0].local_host:
+            first = device_list[0]
+            bulk_status = await ShellyService.async_fetch_account_status(
+                first.shelly_server, first.shelly_api_key
+            )
+            if "error" in bulk_status:
+                await self._blocking(
+                    log_device_event,
+                    None,
+                    f"Bulk status failed for group {group_key}, falling back to per-device status: {bulk_status['error']}",
+                    "WARN",
+                )
+            else:
+                account_statuses = bulk_status["devices"]
+
+        for device in device_list:
+            if self.scheduler and self.scheduler.should_defer(group_key, device):
+                continue
+            try:
+                await self._process_device(
+                    device, account_statuses.get(device.shelly_device_name)
+                )
+                if self.scheduler:
+                    self.scheduler.mark_done(device)
+
+            except Exception as e:
+                await self._blocking(
+                    log_device_event,
+                    device,
+                    f"Error processing device in group: {str(e)}",
+                    "ERROR",
+                )
+
+    async def _process_device(self, device: ShellyDevice, device_status: dict = None) -> None:
+        """
+        Reads one device's state, from the cache, the bulk status or a status
+        call, and switches it when it differs from its assignment.
+        device_status may come from the group's bulk status fetch.
+        """
+        from app.tasks import DeviceController
+
+        assigned = device.device_id in self.assigned_device_ids
+        shelly_service = ShellyService.for_device(device)
+        cached_state = self._cached_state(device) if device_status is None else None
+
+        if cached_state is not None:
+            is_running = cached_state.output
+        else:
+            if device_status is None:
+                device_status = await shelly_service.async_get_device_status()
+            elif "error" not in device_status:
+                await self._blocking(
+                    DeviceStateManager.record_status, device, device_status, device.relay_channel
+                )
+
+            if "error" in device_status:
+                await self._blocking(
+                    log_device_event,
+                    device,
+                    f"Error fetching initial status: {device_status['error']}",
+                    "ERROR",
+                )
+                return
+
+            is_running = DeviceController.extract_output_state(device_status, device.relay_channel)
+
+        # An unknown output never matches the assignment, so the command is sent
+        current = "unknown" if is_running is None else "running" if is_running else "stopped"
+        await self._blocking(
+            log_device_event,
+            device,
+            f"Period {self.start_time.strftime('%Y-%m-%d %H:%M')} - "
+            f"Assignment: {assigned}, Current State: {current}"
+            f"{' (cached)' if cached_state is not None else ''}",
+            "INFO",
+        )
+
+        desired_state = "on" if assigned else "off"
+        if assigned == is_running:
+            await self._blocking(
+                log_device_event,
+                device,
+                f"No action needed. Current state matches desired state ({desired_state.upper()})",
+                "INFO",
+            )
+            return
+
+        await self._blocking(
+            log_device_event,
+            device,
+            f"State change needed. Setting to {desired_state.upper()}",
+            "INFO",
+        )
+        result = await shelly_service.async_set_device_output(state=desired_state)
+        await self._blocking(
+            DeviceController.log_toggle_result, device, desired_state, result
+        )
+
+    @staticmethod
+    async def _blocking(func, *args, **kwargs):
+        """Run ORM or other blocking work in the engine's thread pool."""
+
+        def call():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                close_old_connections()
+
+        return await asyncio.to_thread(call)
@@ -0,0 +1,121 @@
+from collections import Counter
+from datetime import timedelta
+
+from app.models import AppSetting, ElectricityPrice, DeviceAssignment
+from app.device_state_manager import DeviceStateManager
+from app.utils.time_utils import TimeUtils
+
+
+class ControlPlanner:
+    """
+    Decides which devices the control pass has to contact.
+    The desired on/off state for the current 15-minute period is compared with the
+    previous period and with the cached device state. Devices without a transition,
+    with a fresh cached state that matches the plan, are skipped. Every
+    CONTROL_FULL_SWEEP_MINUTES a full sweep reads every device again to catch
+    manual overrides.
+    """
+
+    DEFAULT_FULL_SWEEP_MINUTES = 60
+
+    REASON_TRANSITION = "transition"  # Desired state differs from the previous period
+    REASON_STALE = "stale"  # No cached state, or older than the TTL
+    REASON_DRIFT = "drift"  # Cached state disagrees with the plan
+    REASON_SWEEP = "sweep"  # Periodic full reconciliation
+
+    # Reasons that must read the device instead of trusting the cached state
+    LIVE_READ_REASONS = (REASON_STALE, REASON_SWEEP)
+
+    def __init__(self, start_time, now=None):
+        self.start_time = start_time
+        self.previous_start = start_time - timedelta(minutes=15)
+        self.now = now or TimeUtils.now_utc()
+        self.assigned_device_ids = set()  # Devices assigned to run in the current period
+
+    @staticmethod
+    def get_full_sweep_minutes() -> int:
+        """Returns the sweep interval (AppSetting CONTROL_FULL_SWEEP_MINUTES)."""
+        setting = AppSetting.objects.filter(key="CONTROL_FULL_SWEEP_MINUTES").first()
+        try:
+            return int(setting.value) if setting else ControlPlanner.DEFAULT_FULL_SWEEP_MINUTES
+        except (TypeError, ValueError):
+            return ControlPlanner.DEFAULT_FULL_SWEEP_MINUTES
+
+    def is_full_sweep(self, sweep_minutes: int = None) -> bool:
+        """True when this period starts on a sweep boundary (0 or less sweeps every pass)."""
+        if sweep_minutes is None:
+            sweep_minutes = self.get_full_sweep_minutes()
+        if sweep_minutes <= 0:
+            return True
+        minutes_since_midnight = self.start_time.hour * 60 + self.start_time.minute
+        return minutes_since_midnight % sweep_minutes == 0
+
+    def _period_price_ids(self) -> tuple:
+        """
+        Price ids covering the current and the previous period, with one query.
+        An hourly price covers both periods inside its hour and is in both lists.
+        """
+        current_ids, previous_ids = [], []
+        prices = ElectricityPrice.objects.overlapping(
+            self.previous_start, self.start_time + timedelta(minutes=15)
+        ).values_list("id", "start_time", "end_time")
+        for price_id, start_time, end_time in prices:
+            if start_time <= self.start_time < end_time:
+                current_ids.append(price_id)
+            if start_time <= self.previous_start < end_time:
+                previous_ids.append(price_id)
+        return current_ids, previous_ids
+
+    def desired_states(self, devices) -> tuple:
+        """
+        Returns (current, previous) sets of device ids that are assigned to run
+        in the current and in the previous period.
+        """
+        current_ids, previous_ids = self._period_price_ids()
+        current, previous = set(), set()
+        assignments = DeviceAssignment.objects.filter(
+            device__in=devices,
+            electricity_price_id__in=set(current_ids + previous_ids),
+        ).values_list("device_id", "electricity_price_id")
+        current_lookup, previous_lookup = set(current_ids), set(previous_ids)
+        for device_id, price_id in assignments:
+            if price_id in current_lookup:
+                current.add(device_id)
+            if price_id in previous_lookup:
+                previous.add(device_id)
+        return current, previous
+
+    def plan(self, devices, device_states: dict, ttl_seconds: int = None) -> dict:
+        """
+        Returns {device_id: reason} for every device that needs a network call.
+        Devices missing from the result keep their state and are not contacted.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = DeviceStateManager.get_ttl_seconds()
+        full_sweep = self.is_full_sweep()
+        current, previous = self.desired_states(devices)
+        self.assigned_device_ids = current
+
+        reasons = {}
+        for device in devices:
+            state = device_states.get(device.device_id)
+            desired = device.device_id in current
+            if not DeviceStateManager.is_fresh(state, ttl_seconds, self.now):
+                reasons[device.device_id] = self.REASON_STALE
+            elif desired != (device.device_id in previous):
+                reasons[device.device_id] = self.REASON_TRANSITION
+            elif state.output != desired:
+                reasons[device.device_id] = self.REASON_DRIFT
+            elif full_sweep:
+                reasons[device.device_id] = self.REASON_SWEEP
+        return reasons
+
+    @staticmethod
+    def summarize(reasons: dict, total: int) -> str:
+        """One log line describing the plan instead of one line per skipped device."""
+        counts = Counter(reasons.values())
+        details = ", ".join(f"{reason}={count}" for reason, count in sorted(counts.items()))
+        return (
+            f"Control plan: contacting {len(reasons)} of {total} devices"
+            f"{f' ({details})' if details else ''}, {total - len(reasons)} unchanged devices skipped"
+        )
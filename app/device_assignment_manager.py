@@ -34,6 +34,74 @@ class DeviceAssignmentManager:
                 electricity_price=electricity_price
             )
 
+    @staticmethod
+    def assign_prices(device_price_ids, source: str = DeviceAssignment.SOURCE_MANUAL) -> int:
+        """
+        Assigns devices to price periods with one query for the existing
+        assignments and one bulk insert, for any number of devices.
+        device_price_ids is an iterable of (device, [price ids]); assignments
+        belong to the device owner. Returns the number of new assignments.
+        """
+        wanted = DeviceAssignmentManager._wanted(device_price_ids)
+        if not wanted:
+            return 0
+
+        existing = set(
+            DeviceAssignment.objects.filter(
+                electricity_price_id__in={price_id for _, price_id in wanted}
+            ).values_list("device_id", "electricity_price_id")
+        )
+        return DeviceAssignmentManager._insert_missing(wanted, existing, source)
+
+    @staticmethod
+    def replace_planned(device_price_ids, since) -> tuple:
+        """
+        Makes the planner's assignments of the given devices from `since` on
+        exactly the given price ids: missing ones are inserted and planner
+        assignments that are no longer wanted are deleted. Manual and thermostat
+        assignments are kept. Returns (created, removed).
+        """
+        device_price_ids = list(device_price_ids)
+        wanted = DeviceAssignmentManager._wanted(device_price_ids)
+        device_ids = [device.device_id for device, _ in device_price_ids]
+        if not device_ids:
+            return 0, 0
+
+        existing, stale_ids = set(), []
+        for assignment_id, device_id, price_id, source in DeviceAssignment.objects.filter(
+            device_id__in=device_ids, electricity_price__start_time__gte=since
+        ).values_list("id", "device_id", "electricity_price_id", "source"):
+            existing.add((device_id, price_id))
+            if source == DeviceAssignment.SOURCE_PLANNER and (device_id, price_id) not in wanted:
+                stale_ids.append(assignment_id)
+
+        if stale_ids:
+            DeviceAssignment.objects.filter(id__in=stale_ids).delete()
+        created = DeviceAssignmentManager._insert_missing(wanted, existing, DeviceAssignment.SOURCE_PLANNER)
+        return created, len(stale_ids)
+
+    @staticmethod
+    def _wanted(device_price_ids) -> dict:
+        """(device_id, price_id) -> owner user id."""
+        wanted = {}
+        for device, price_ids in device_price_ids:
+            for price_id in price_ids:
+                wanted[(device.device_id, price_id)] = device.user_id
+        return wanted
+
+    @staticmethod
+    def _insert_missing(wanted: dict, existing: set, source: str) -> int:
+        new_assignments = [
+            DeviceAssignment(
+                user_id=user_id, device_id=device_id, electricity_price_id=price_id, source=source
+            )
+            for (device_id, price_id), user_id in wanted.items()
+            if (device_id, price_id) not in existing
+        ]
+        # ignore_conflicts covers a concurrent writer (unique device and price)
+        DeviceAssignment.objects.bulk_create(new_assignments, ignore_conflicts=True)
+        return len(new_assignments)
+
     def get_device_cheapest_hours(self, devices):
         """
         Fetch assigned cheapest hours for each device.
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from app.models import AppSetting, DeviceState
+from app.utils.time_utils import TimeUtils
+
+
+class DeviceStateManager:
+    """
+    Reads and writes the persistent device state cache.
+    Every status fetch and relay command updates the cache; the control loop and
+    the dashboard trust it for DEVICE_STATE_TTL_SECONDS before asking the device again.
+    """
+
+    DEFAULT_TTL_SECONDS = 3600
+
+    @staticmethod
+    def get_ttl_seconds() -> int:
+        """Returns the configured staleness TTL (AppSetting DEVICE_STATE_TTL_SECONDS)."""
+        setting = AppSetting.objects.filter(key="DEVICE_STATE_TTL_SECONDS").first()
+        try:
+            return max(0, int(setting.value)) if setting else DeviceStateManager.DEFAULT_TTL_SECONDS
+        except (TypeError, ValueError):
+            return DeviceStateManager.DEFAULT_TTL_SECONDS
+
+    @staticmethod
+    def parse_status(status: dict, channel: int = 0) -> dict:
+        """
+        Extracts output, online flag and power of one channel from a Shelly status
+        payload. A channel missing from the payload is unknown (None): another
+        channel's relay says nothing about it.
+        """
+        data = status.get("data", {})
+        device_status = data.get("device_status", {}) or {}
+        switch = device_status.get(f"switch:{channel}") or {}
+
+        output = switch.get("output")
+        power = switch.get("apower")
+        relays = device_status.get("relays")
+        if output is None and isinstance(relays, list) and len(relays) > channel:
+            output = relays[channel].get("ison")  # Gen1 payload
+        meters = device_status.get("meters")
+        if power is None and isinstance(meters, list) and len(meters) > channel:
+            power = meters[channel].get("power")  # Gen1 payload
+
+        return {
+            "output": bool(output) if output is not None else None,
+            "online": data.get("online"),
+            "power_w": float(power) if isinstance(power, (int, float)) else None,
+        }
+
+    @staticmethod
+    def record_status(device, status: dict, channel: int = 0) -> None:
+        """Stores the state reported by a successful status fetch."""
+        if device is None or "error" in status:
+            return
+        parsed = DeviceStateManager.parse_status(status, channel)
+        DeviceState.objects.update_or_create(
+            device=device,
+            channel=channel,
+            defaults={**parsed, "status_at": TimeUtils.now_utc()},
+        )
+
+    @staticmethod
+    def record_command(device, state: str, channel: int = 0) -> None:
+        """Stores the state set by a successful relay command."""
+        if device is None:
+            return
+        DeviceState.objects.update_or_create(
+            device=device,
+            channel=channel,
+            defaults={"output": state == "on", "command_at": TimeUtils.now_utc()},
+        )
+
+    @staticmethod
+    def get_states(devices, channel: int = 0) -> dict:
+        """Loads cached states for many devices with one query, keyed by device_id."""
+        return {
+            state.device_id: state
+            for state in DeviceState.objects.filter(device__in=devices, channel=channel)
+        }
+
+    @staticmethod
+    def get_state(device, channel: int = 0):
+        return DeviceState.objects.filter(device=device, channel=channel).first()
+
+    @staticmethod
+    def is_fresh(state, ttl_seconds: int = None, now=None) -> bool:
+        """True when the cached output is known and younger than the TTL."""
+        if state is None or state.output is None or state.observed_at is None:
+            return False
+        if ttl_seconds is None:
+            ttl_seconds = DeviceStateManager.get_ttl_seconds()
+        now = now or TimeUtils.now_utc()
+        return now - state.observed_at < timedelta(seconds=ttl_seconds)
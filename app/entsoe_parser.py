@@ -0,0 +1,239 @@
+import io
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+_DURATION = re.compile(r"^PT(?:(\d+)H)?(?:(\d+)M)?$")
+
+
+def resolution_minutes(resolution: str) -> int:
+    """Converts an ISO 8601 resolution such as PT15M or PT60M into minutes."""
+    match = _DURATION.match(resolution or "")
+    if not match or not any(match.groups()):
+        raise ValueError(f"Unsupported ENTSOE resolution: {resolution}")
+    hours, minutes = match.groups()
+    return int(hours or 0) * 60 + int(minutes or 0)
+
+
+def _parse_time(value: str) -> np.datetime64:
+    """ENTSO-E timestamps look like 2026-01-01T23:00Z."""
+    value = value.strip().replace("Z", "")
+    return np.datetime64(value, "s")
+
+
+class PriceSeries:
+    """Prices of one resolution as parallel NumPy arrays (UTC datetime64[s], EUR/MWh)."""
+
+    def __init__(self, minutes: int, timestamps: np.ndarray, prices: np.ndarray):
+        self.minutes = minutes
+        self.timestamps = timestamps
+        self.prices = prices
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def window(self, start, end) -> "PriceSeries":
+        """Periods starting in [start, end), given as aware datetimes."""
+        start64 = np.datetime64(start.astimezone(timezone.utc).replace(tzinfo=None), "s")
+        end64 = np.datetime64(end.astimezone(timezone.utc).replace(tzinfo=None), "s")
+        mask = (self.timestamps >= start64) & (self.timestamps < end64)
+        return PriceSeries(self.minutes, self.timestamps[mask], self.prices[mask])
+
+    def to_resolution(self, minutes: int) -> "PriceSeries":
+        """Splits every period into `minutes` long periods that repeat its price."""
+        if minutes == self.minutes:
+            return self
+        if self.minutes % minutes:
+            raise ValueError(f"Cannot split {self.minutes} min periods into {minutes} min periods")
+        repeat = self.minutes // minutes
+        offsets = np.arange(repeat) * np.timedelta64(minutes * 60, "s")
+        timestamps = (self.timestamps[:, None] + offsets[None, :]).ravel()
+        return PriceSeries(minutes, timestamps, np.repeat(self.prices, repeat))
+
+    def items(self):
+        """Yields (aware UTC datetime, float price) pairs."""
+        seconds = self.timestamps.astype("int64")
+        for ts, price in zip(seconds.tolist(), self.prices.tolist()):
+            yield datetime.fromtimestamp(ts, tz=timezone.utc), price
+
+
+class EntsoeDocument:
+    """Result of one streaming parse: price arrays per resolution plus a summary for logging."""
+
+    def __init__(self):
+        self.series = {}  # minutes -> PriceSeries
+        self.time_series = []  # Summary per TimeSeries period
+        self.reasons = []  # Acknowledgement or TimeSeries reasons
+
+    def preferred(self, resolutions=(15, 60, 30)):
+        """The first non-empty series in order of preference, or None."""
+        for minutes in resolutions:
+            series = self.series.get(minutes)
+            if series is not None and len(series):
+                return series
+        return None
+
+    def covering(self, resolutions=(15, 60, 30)) -> list:
+        """
+        Series of every resolution in order of preference, each without the
+        periods that overlap a period of a preferred one. Together they cover a
+        document whose resolution changes part way, such as the switch to a
+        15-minute market time unit, without storing a time twice.
+        """
+        starts = np.empty(0, dtype="datetime64[s]")
+        ends = np.empty(0, dtype="datetime64[s]")
+        covering = []
+        for minutes in resolutions:
+            series = self.series.get(minutes)
+            if series is None or not len(series):
+                continue
+            step = np.timedelta64(minutes * 60, "s")
+            if len(starts):
+                # Kept periods do not overlap, so only the last one starting before
+                # a period ends can overlap it
+                index = np.searchsorted(starts, series.timestamps + step) - 1
+                overlaps = (index >= 0) & (ends[np.maximum(index, 0)] > series.timestamps)
+                series = PriceSeries(minutes, series.timestamps[~overlaps], series.prices[~overlaps])
+                if not len(series):
+                    continue
+            covering.append(series)
+            starts = np.concatenate((starts, series.timestamps))
+            ends = np.concatenate((ends, series.timestamps + step))
+            order = np.argsort(starts, kind="stable")
+            starts, ends = starts[order], ends[order]
+        return covering
+
+    @property
+    def summary(self) -> dict:
+        return {
+            "time_series_count": len(self.time_series),
+            "series": self.time_series,
+            "reasons": self.reasons,
+        }
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _fill_period(curve_type, start, end, minutes, positions, values):
+    """
+    Builds timestamps and prices for one Period. With curve type A03 a missing
+    position repeats the previous value, so positions are filled up to the end
+    of the period interval.
+    """
+    order = np.argsort(positions, kind="stable")
+    positions = positions[order]
+    values = values[order]
+    step = np.timedelta64(minutes * 60, "s")
+
+    if curve_type == "A03" and end is not None:
+        count = int((end - start) // step)
+        wanted = np.arange(1, count + 1)
+        index = np.searchsorted(positions, wanted, side="right") - 1
+        valid = index >= 0  # Positions before the first point stay empty
+        positions = wanted[valid]
+        values = values[index[valid]]
+
+    return start + (positions - 1) * step, values
+
+
+def parse_day_ahead(content) -> EntsoeDocument:
+    """
+    Parses an ENTSO-E day-ahead price document with iterparse in one pass.
+    Returns an EntsoeDocument with one PriceSeries per resolution; periods from
+    several TimeSeries are merged, later ones winning on duplicate timestamps.
+    Raises xml.etree.ElementTree.ParseError for malformed documents.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    document = EntsoeDocument()
+    chunks = {}  # minutes -> list of (timestamps, prices)
+    curve_type = "A01"
+    period = None
+    point = None
+    reason = None
+    in_interval = False
+
+    for event, elem in ET.iterparse(io.BytesIO(content), events=("start", "end")):
+        name = _local_name(elem.tag)
+
+        if event == "start":
+            if name == "TimeSeries":
+                curve_type = "A01"
+            elif name == "Period":
+                period = {"start": None, "end": None, "resolution": None, "positions": [], "prices": []}
+            elif name == "timeInterval":
+                in_interval = True
+            elif name == "Point":
+                point = {}
+            elif name == "Reason":
+                reason = {"code": None, "text": None}
+            continue
+
+        text = elem.text
+        if name == "curveType":
+            curve_type = (text or "").strip()
+        elif name == "timeInterval":
+            in_interval = False
+        elif period is not None and in_interval and name in ("start", "end"):
+            period[name] = _parse_time(text)
+        elif period is not None and name == "resolution":
+            period["resolution"] = (text or "").strip()
+        elif point is not None and name == "position":
+            point["position"] = int(text)
+        elif point is not None and name == "price.amount":
+            point["price"] = float(text.replace(",", ""))
+        elif name == "Point":
+            if point and "position" in point and "price" in point and period is not None:
+                period["positions"].append(point["position"])
+                period["prices"].append(point["price"])
+            point = None
+        elif reason is not None and name in ("code", "text"):
+            reason[name] = text
+        elif name == "Reason":
+            document.reasons.append(reason)
+            reason = None
+        elif name == "Period":
+            positions = period["positions"]
+            document.time_series.append(
+                {
+                    "start": str(period["start"]) + "Z" if period["start"] is not None else None,
+                    "resolution": period["resolution"],
+                    "min_position": min(positions) if positions else None,
+                    "max_position": max(positions) if positions else None,
+                    "points": len(positions),
+                }
+            )
+            if positions and period["start"] is not None and period["resolution"]:
+                minutes = resolution_minutes(period["resolution"])
+                chunks.setdefault(minutes, []).append(
+                    _fill_period(
+                        curve_type,
+                        period["start"],
+                        period["end"],
+                        minutes,
+                        np.asarray(positions, dtype=np.int64),
+                        np.asarray(period["prices"], dtype=np.float64),
+                    )
+                )
+            period = None
+            elem.clear()
+        elif name == "TimeSeries":
+            elem.clear()  # Keep memory flat on multi-month documents
+
+    for minutes, parts in chunks.items():
+        timestamps = np.concatenate([p[0] for p in parts])
+        prices = np.concatenate([p[1] for p in parts])
+        # Sort by time and keep the last value for duplicate timestamps
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, prices = timestamps[order], prices[order]
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[:-1] = timestamps[1:] != timestamps[:-1]
+        document.series[minutes] = PriceSeries(minutes, timestamps[keep], prices[keep])
+
+    return document
@@ -5,6 +5,7 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from .models import ElectricityPrice, ShellyDevice, DeviceAssignment, ShellyTemperature, TemperatureReading
 from app.utils.time_utils import TimeUtils
+from .bidding_zones import BiddingZones
 from .views import get_version_info
 import json
 from decimal import Decimal
@@ -58,8 +59,9 @@ def graphs(request: HttpRequest):
 
     # Get all available historical data (flexible time period)
     # First, check what data we actually have
-    earliest_price = ElectricityPrice.objects.order_by("start_time").first()
-    latest_price = ElectricityPrice.objects.order_by("-start_time").first()
+    zone_prices = ElectricityPrice.objects.filter(bidding_zone=BiddingZones.for_user(selected_user))
+    earliest_price = zone_prices.order_by("start_time").first()
+    latest_price = zone_prices.order_by("-start_time").first()
 
     if earliest_price and latest_price:
         # Use actual data range instead of fixed 365 days
@@ -71,7 +73,7 @@ def graphs(request: HttpRequest):
         start_date = end_date - timedelta(days=365)
 
     # Fetch all available electricity prices
-    historical_prices = ElectricityPrice.objects.filter(
+    historical_prices = zone_prices.filter(
         start_time__gte=start_date, start_time__lte=end_date
     ).order_by("start_time")
 
@@ -187,8 +189,9 @@ def get_graph_data(request: HttpRequest):
 
     # Get all available historical data (flexible time period)
     # First, check what data we actually have
-    earliest_price = ElectricityPrice.objects.order_by("start_time").first()
-    latest_price = ElectricityPrice.objects.order_by("-start_time").first()
+    zone_prices = ElectricityPrice.objects.filter(bidding_zone=BiddingZones.for_user(selected_user))
+    earliest_price = zone_prices.order_by("start_time").first()
+    latest_price = zone_prices.order_by("-start_time").first()
 
     if earliest_price and latest_price:
         # Use actual data range instead of fixed 365 days
@@ -200,7 +203,7 @@ def get_graph_data(request: HttpRequest):
         start_date = end_date - timedelta(days=365)
 
     # Fetch all available electricity prices
-    historical_prices = ElectricityPrice.objects.filter(
+    historical_prices = zone_prices.filter(
         start_time__gte=start_date, start_time__lte=end_date
     ).order_by("start_time")
 
@@ -253,14 +256,6 @@ def calculate_cost_comparison(
         12: 1.32,  # December - Winter high
     }
     
-    # Detect period length from the first two price records
-    # This handles both legacy hourly data and new 15-minute data
-    period_minutes = 60  # Default to hourly
-    if len(historical_prices) >= 2:
-        time_diff = (historical_prices[1].start_time - historical_prices[0].start_time).total_seconds() / 60
-        if time_diff > 0:
-            period_minutes = int(time_diff)
-
     # Get user's device assignments to understand when devices were actually running
     if user.is_superuser:
         assignments = DeviceAssignment.objects.select_related(
@@ -302,8 +297,13 @@ def calculate_cost_comparison(
     # Calculate running percentage: If devices only run during assigned periods,
     # they need to consume at a higher rate to reach the yearly target
     # The percentage is calculated for the CURRENT data period, assuming same pattern continues
-    if not simulate_full_usage and len(historical_prices) > 0:
-        running_percentage = Decimal(str(len(assigned_periods) / len(historical_prices)))
+    # Each price keeps its own period length (hourly history, 15-minute prices)
+    total_minutes = sum(price.resolution_minutes for price in historical_prices)
+    if not simulate_full_usage and total_minutes > 0:
+        assigned_minutes = sum(
+            price.resolution_minutes for price in historical_prices if price.id in assigned_periods
+        )
+        running_percentage = Decimal(str(assigned_minutes / total_minutes))
         # Adjust multiplier: if devices run X% of time, they need target/X power when on
         # Example: 30% target, 27% running time = 30%/27% = 111% power when running
         effective_multiplier = shelly_multiplier / running_percentage if running_percentage > 0 else shelly_multiplier
@@ -335,7 +335,7 @@ def calculate_cost_comparison(
         # Calculate kWh consumption per period with seasonal adjustment
         # The effective_multiplier is adjusted so that running only during assigned periods
         # still reaches the yearly consumption target (e.g., 30% of 10,000 kWh = 3,000 kWh/year)
-        kwh_per_period_base = kwh_per_hour * (Decimal(str(period_minutes)) / 60) * seasonal_multiplier
+        kwh_per_period_base = kwh_per_hour * (Decimal(price.resolution_minutes) / 60) * seasonal_multiplier
         # Use effective multiplier to ensure yearly target is met despite part-time running
         kwh_per_period_controlled = kwh_per_period_base * effective_multiplier
 
@@ -0,0 +1,254 @@
+import hashlib
+
+import numpy as np
+
+from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon
+from app.device_assignment_manager import DeviceAssignmentManager
+from app.joint_optimizer import JointOptimizer
+from app.logger import log_device_event
+from app.models import ElectricityPrice, ShellyDevice, UserProfile
+from app.price_views import LOCAL_TZ
+from app.schedule_solver import ScheduleSolver
+from app.utils.security_utils import SecurityUtils
+from app.utils.time_utils import TimeUtils
+
+
+class PlanResult:
+    """Counts of one replanning run."""
+
+    def __init__(self):
+        self.planned = 0  # Devices whose plan was rebuilt
+        self.skipped = 0  # Devices whose fingerprint was unchanged
+        self.created = 0
+        self.removed = 0
+        self.moved = 0  # Periods moved to stay under a site power cap
+        self.dropped = 0  # Periods that found no room under a site power cap
+
+    def __str__(self):
+        text = (
+            f"{self.planned} devices replanned, {self.skipped} unchanged skipped, "
+            f"{self.created} assignments created, {self.removed} removed"
+        )
+        if self.moved or self.dropped:
+            text += f", {self.moved} moved and {self.dropped} dropped for power caps"
+        return text
+
+
+class IncrementalPlanner:
+    """
+    Replans only what an event affects. New prices replan the devices of the
+    changed bidding zones, a saved ShellyDevice replans that device. Each device
+    stores the fingerprint of the inputs its plan was made from (the version of
+    its zone's upcoming prices and its PLAN_FIELDS); devices whose fingerprint is
+    unchanged are skipped without building a plan.
+    """
+
+    @staticmethod
+    def prices_version(prices: list) -> str:
+        """
+        Version of a zone's upcoming prices, from the rows read for planning: the
+        last period and the latest write. Periods that pass do not change it.
+        """
+        if not prices:
+            return ""
+        latest_update = max(price["updated_at"] for price in prices)
+        return f"{prices[-1]['start_time'].isoformat()}:{latest_update.isoformat()}"
+
+    @staticmethod
+    def fingerprint(device: ShellyDevice, prices_version: str, site_power_cap_w=None) -> str:
+        params = "|".join(str(getattr(device, field)) for field in ShellyDevice.PLAN_FIELDS)
+        return hashlib.sha1(f"{prices_version}|{params}|{site_power_cap_w}".encode()).hexdigest()
+
+    @staticmethod
+    def _select(horizon: PriceHorizon, devices: list) -> np.ndarray:
+        """
+        Selection matrix of the devices: one selection for the cheapest-period
+        devices and one solve for the run-block devices.
+        """
+        selected = np.zeros((len(devices), len(horizon)), dtype=bool)
+        run_blocks = [device.schedule_mode == ShellyDevice.SCHEDULE_RUN_BLOCKS for device in devices]
+        cheapest_rows = [row for row, blocks in enumerate(run_blocks) if not blocks]
+        block_rows = [row for row, blocks in enumerate(run_blocks) if blocks]
+        if cheapest_rows:
+            cheapest = [devices[row] for row in cheapest_rows]
+            selected[cheapest_rows] = CheapestSlotPlanner.select(
+                horizon,
+                [device.day_transfer_price for device in cheapest],
+                [device.night_transfer_price for device in cheapest],
+                [device.run_hours_per_day for device in cheapest],
+                [device.auto_assign_price_threshold for device in cheapest],
+            )
+        if block_rows:
+            blocks = [devices[row] for row in block_rows]
+            selected[block_rows] = ScheduleSolver.select(
+                horizon,
+                [device.day_transfer_price for device in blocks],
+                [device.night_transfer_price for device in blocks],
+                [device.run_hours_per_day for device in blocks],
+                [device.auto_assign_price_threshold for device in blocks],
+                [device.min_run_minutes for device in blocks],
+                [device.max_off_minutes for device in blocks],
+                [device.max_runs_per_plan for device in blocks],
+            )
+        return selected
+
+    @staticmethod
+    def _fit_site(horizon: PriceHorizon, devices: list, selected: np.ndarray, cap_w: int, result: PlanResult):
+        """Repairs one site's plans to stay under its power cap; run blocks stay in place."""
+        costs = CheapestSlotPlanner.cost_matrix(
+            horizon,
+            [device.day_transfer_price for device in devices],
+            [device.night_transfer_price for device in devices],
+        )
+        fitted, moved, dropped = JointOptimizer.fit_to_cap(
+            costs,
+            selected,
+            [device.rated_power_w or 0 for device in devices],
+            cap_w,
+            [device.schedule_mode != ShellyDevice.SCHEDULE_RUN_BLOCKS for device in devices],
+            horizon.minutes,
+        )
+        result.moved += moved
+        result.dropped += dropped
+        if dropped:
+            log_device_event(
+                None,
+                f"Power cap of {cap_w} W for user {devices[0].user_id} leaves {dropped} planned periods unassigned",
+                "WARN",
+            )
+        return fitted
+
+    @staticmethod
+    def replan(zones=None, devices=None, force: bool = False) -> PlanResult:
+        """
+        Replans the devices of `zones` (all zones by default), or just `devices`,
+        over the upcoming prices. force rebuilds plans with unchanged fingerprints.
+        The devices of a user with a site power cap are planned together: one
+        changed device replans the whole site in its zone.
+        """
+        result = PlanResult()
+        now = TimeUtils.now_utc()
+        whole_zones = devices is None
+        if whole_zones:
+            devices = ShellyDevice.objects.all()
+            if zones is not None:
+                devices = devices.filter(bidding_zone__in=zones)
+        devices = list(devices)
+        if not devices:
+            return result
+
+        caps = IncrementalPlanner._site_caps(devices)
+        if caps and not whole_zones:
+            # Bring in the rest of each capped site
+            known = {device.pk for device in devices}
+            devices += [
+                device
+                for device in ShellyDevice.objects.filter(
+                    user_id__in=list(caps), bidding_zone__in={device.bidding_zone for device in devices}
+                )
+                if device.pk not in known
+            ]
+
+        devices_by_zone = {}
+        for device in devices:
+            devices_by_zone.setdefault(device.bidding_zone, []).append(device)
+
+        prices_by_zone = {}
+        for price in (
+            ElectricityPrice.objects.filter(bidding_zone__in=list(devices_by_zone), start_time__gte=now)
+            .order_by("start_time")
+            .values("id", "start_time", "resolution_minutes", "price_kwh", "updated_at", "bidding_zone")
+        ):
+            prices_by_zone.setdefault(price["bidding_zone"], []).append(price)
+
+        selections, planned = [], []
+        for zone, zone_devices in devices_by_zone.items():
+            prices = prices_by_zone.get(zone)
+            if not prices:
+                for device in zone_devices:
+                    log_device_event(
+                        device,
+                        f"No electricity prices for bidding zone {zone}. Skipping assignment.",
+                        "WARN",
+                    )
+                continue
+
+            version = IncrementalPlanner.prices_version(prices)
+            fingerprints = [
+                IncrementalPlanner.fingerprint(device, version, caps.get(device.user_id))
+                for device in zone_devices
+            ]
+            outdated = [
+                force or device.plan_fingerprint != fingerprint
+                for device, fingerprint in zip(zone_devices, fingerprints)
+            ]
+            # A capped site is planned jointly, so one changed device replans all of it
+            changed_sites = {
+                device.user_id for device, old in zip(zone_devices, outdated) if old and device.user_id in caps
+            }
+            stale = []
+            for device, fingerprint, old in zip(zone_devices, fingerprints, outdated):
+                if old or device.user_id in changed_sites:
+                    device.plan_fingerprint = fingerprint
+                    stale.append(device)
+            result.skipped += len(zone_devices) - len(stale)
+            if not stale:
+                continue
+
+            horizon = PriceHorizon.from_rows(prices, LOCAL_TZ)
+            selected = IncrementalPlanner._select(horizon, stale)
+            sites = {}
+            for row, device in enumerate(stale):
+                if device.user_id in caps:
+                    sites.setdefault(device.user_id, []).append(row)
+            for user_id, rows in sites.items():
+                selected[rows] = IncrementalPlanner._fit_site(
+                    horizon, [stale[row] for row in rows], selected[rows], caps[user_id], result
+                )
+
+            price_ids = [price["id"] for price in prices]
+            for device, device_selection in zip(stale, selected):
+                selections.append((device, [price_ids[index] for index in device_selection.nonzero()[0].tolist()]))
+                device.plan_version += 1
+            planned.extend(stale)
+
+        if planned:
+            result.created, result.removed = DeviceAssignmentManager.replace_planned(selections, since=now)
+            # bulk_update sends no post_save, so this does not trigger another replan
+            ShellyDevice.objects.bulk_update(planned, ["plan_fingerprint", "plan_version"])
+        result.planned = len(planned)
+        return result
+
+    @staticmethod
+    def _site_caps(devices: list) -> dict:
+        """user id -> site power cap (W) of the devices' owners that have one."""
+        return dict(
+            UserProfile.objects.filter(
+                user_id__in={device.user_id for device in devices}, site_power_cap_w__isnull=False
+            ).values_list("user_id", "site_power_cap_w")
+        )
+
+    @staticmethod
+    def replan_device(device_id) -> None:
+        """Replans one device after it was saved, logging instead of raising."""
+        try:
+            device = ShellyDevice.objects.filter(device_id=device_id).first()
+            if device is None:
+                return
+            result = IncrementalPlanner.replan(devices=[device])
+            if result.planned:
+                log_device_event(device, f"Device settings changed: {result}", "INFO")
+        except Exception as e:
+            safe_error = SecurityUtils.get_safe_error_message(e, "Error replanning device")
+            log_device_event(None, safe_error, "ERROR")
+
+    @staticmethod
+    def replan_site(user_id) -> None:
+        """Replans a user's devices after their profile was saved, logging instead of raising."""
+        try:
+            result = IncrementalPlanner.replan(devices=ShellyDevice.objects.filter(user_id=user_id))
+            if result.planned:
+                log_device_event(None, f"Site power cap of user {user_id} changed: {result}", "INFO")
+        except Exception as e:
+            safe_error = SecurityUtils.get_safe_error_message(e, "Error replanning site")
+            log_device_event(None, safe_error, "ERROR")
@@ -0,0 +1,83 @@
+import heapq
+
+import numpy as np
+
+from app.schedule_solver import INF
+
+
+class JointOptimizer:
+    """
+    Fits the plans of one site's devices under its power cap. Each device is
+    first planned on its own at its cheapest, then the plans are repaired
+    greedily: while a period draws more than the cap, the device in the most
+    overloaded period that is cheapest to move goes to its cheapest free
+    period of the same length that stays under the cap. A device with nowhere
+    to go gives up the period, largest load first.
+    """
+
+    @staticmethod
+    def fit_to_cap(costs: np.ndarray, selected: np.ndarray, power_w, cap_w: int, movable, minutes):
+        """
+        Returns (selected, moved, dropped): the repaired (devices x periods)
+        matrix and how many device periods were moved and dropped. power_w is
+        each device's rated power (0 when unknown: not counted) and movable
+        marks the devices whose periods may move; the others are a fixed load.
+        """
+        selected = selected.copy()
+        power = np.asarray(power_w, dtype=np.int64)
+        movable = np.asarray(movable, dtype=bool) & (power > 0)
+        minutes = np.asarray(minutes)
+        load = power @ selected
+        movable_count = selected[movable].sum(axis=0)
+        moved = dropped = 0
+
+        def cheapest_move(row, period):
+            """(extra cost, target) of moving row out of period, or None without room."""
+            free = ~selected[row] & (load + power[row] <= cap_w) & (minutes == minutes[period])
+            if not free.any():
+                return None
+            alternatives = np.where(free, costs[row], INF)
+            target = int(alternatives.argmin())
+            return int(alternatives[target] - costs[row, period]), target
+
+        while True:
+            # Periods over the cap only through fixed loads cannot be repaired
+            excess = np.where(movable_count > 0, load - cap_w, 0)
+            period = int(excess.argmax())
+            if excess[period] <= 0:
+                break
+
+            # Loads elsewhere only grow while this period is repaired, so a move
+            # never gets cheaper and a stale candidate is re-priced when popped
+            candidates = []
+            for row in np.nonzero(selected[:, period] & movable)[0].tolist():
+                JointOptimizer._push(candidates, row, cheapest_move(row, period))
+            while load[period] > cap_w and candidates:
+                _, target, row = heapq.heappop(candidates)
+                if load[target] + power[row] > cap_w:
+                    JointOptimizer._push(candidates, row, cheapest_move(row, period))
+                    continue
+                selected[row, target], selected[row, period] = True, False
+                load[target] += power[row]
+                load[period] -= power[row]
+                movable_count[target] += 1
+                movable_count[period] -= 1
+                moved += 1
+
+            # Without room elsewhere, the largest loads give up the period
+            rows = sorted(
+                np.nonzero(selected[:, period] & movable)[0].tolist(), key=lambda row: -power[row]
+            )
+            for row in rows:
+                if load[period] <= cap_w:
+                    break
+                selected[row, period] = False
+                load[period] -= power[row]
+                movable_count[period] -= 1
+                dropped += 1
+        return selected, moved, dropped
+
+    @staticmethod
+    def _push(candidates: list, row: int, move) -> None:
+        if move is not None:
+            heapq.heappush(candidates, (move[0], move[1], row))
@@ -1,7 +1,11 @@
 from .models import DeviceLog
 from .utils.security_utils import SecurityUtils
+from .utils.db_utils import with_db_retries
 
 
+# Price fetch and backfill workers log from several threads; SQLite may briefly
+# refuse a write while another thread holds the lock
+@with_db_retries(max_attempts=5, delay=0.05)
 def log_device_event(device, message, status="INFO"):
     """
     Logs events related to a Shelly device in the DeviceLog model.
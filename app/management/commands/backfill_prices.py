@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.bidding_zones import BIDDING_ZONES, BiddingZones
+from app.price_backfill import PriceBackfill
+from app.price_views import get_entsoe_api_key
+from app.utils.time_utils import TimeUtils
+
+
+def _utc_date(value):
+    try:
+        return TimeUtils.to_utc(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills historical day-ahead prices in month-sized chunks. Progress is "
+        "checkpointed, so running the same command again resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", required=True, help="First day to backfill (YYYY-MM-DD, UTC)")
+        parser.add_argument("--end", help="Day to stop before (YYYY-MM-DD, UTC). Defaults to today.")
+        parser.add_argument(
+            "--zone",
+            action="append",
+            dest="zones",
+            help="Bidding zone to backfill, may be repeated. Defaults to the configured zones.",
+        )
+        parser.add_argument("--workers", type=int, default=4, help="Chunks downloaded in parallel")
+        parser.add_argument(
+            "--skip-failed", action="store_true", help="Do not retry chunks that failed in an earlier run"
+        )
+
+    def handle(self, *args, **options):
+        api_key = get_entsoe_api_key()
+        if not api_key:
+            raise CommandError("ENTSO-E API key not set in admin settings.")
+
+        start = _utc_date(options["start"])
+        if options["end"]:
+            end = _utc_date(options["end"])
+        else:
+            end = TimeUtils.now_utc().replace(hour=0, minute=0, second=0, microsecond=0)
+        if start >= end:
+            raise CommandError("--start must be before --end")
+
+        zones = [zone.upper() for zone in options["zones"]] if options["zones"] else BiddingZones.configured()
+        unknown = [zone for zone in zones if zone not in BIDDING_ZONES]
+        if unknown:
+            raise CommandError(f"Unknown bidding zone(s): {', '.join(unknown)}")
+
+        def report(chunk, progress):
+            style = self.style.ERROR if chunk.error else self.style.SUCCESS
+            status = chunk.error or f"{chunk.rows} rows"
+            self.stdout.write(f"{chunk.bidding_zone} {chunk.chunk_start:%Y-%m}: {style(status)} | {progress}")
+
+        self.stdout.write(
+            f"Backfilling {', '.join(zones)} from {start:%Y-%m-%d} to {end:%Y-%m-%d} "
+            f"with {options['workers']} workers"
+        )
+        progress = PriceBackfill.run(
+            api_key,
+            zones,
+            start,
+            end,
+            workers=options["workers"],
+            retry_failed=not options["skip_failed"],
+            on_progress=report,
+        )
+        if not progress.total_chunks:
+            self.stdout.write(self.style.SUCCESS("Nothing to backfill, every chunk is done."))
+        elif progress.failed:
+            self.stdout.write(self.style.WARNING(f"Finished with failures: {progress}. Run again to retry."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Backfill complete: {progress}"))
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.price_replay import PriceReplay
+from app.price_sources import PriceSources
+from app.price_views import get_entsoe_api_key
+from app.utils.time_utils import TimeUtils
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays prices from a price source through ingestion, set_cheapest_hours and "
+        "device control on a simulated clock. Control is a dry run unless --live-control "
+        "is given. Writes prices, assignments and device states to the configured "
+        "database, so run it against a copy (DJANGO_SQLITE_PATH)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=["entsoe", "file", "synthetic"],
+            help="Price source, defaults to AppSetting PRICE_SOURCE",
+        )
+        parser.add_argument("--file", help="CSV or Parquet file for the file source")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic source")
+        parser.add_argument("--start", required=True, help="First simulated day (YYYY-MM-DD, UTC)")
+        parser.add_argument("--days", type=int, default=365, help="Number of days to replay")
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=0,
+            help="Simulated seconds per wall-clock second (0 runs as fast as possible)",
+        )
+        parser.add_argument(
+            "--live-control", action="store_true", help="Contact the real devices instead of a dry run"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start = TimeUtils.to_utc(datetime.strptime(options["start"], "%Y-%m-%d"))
+        except ValueError:
+            raise CommandError("--start must be YYYY-MM-DD")
+        if options["days"] <= 0:
+            raise CommandError("--days must be positive")
+        end = start + timedelta(days=options["days"])
+
+        try:
+            if options["source"]:
+                source = PriceSources.build(
+                    options["source"],
+                    path=options["file"] or "",
+                    seed=options["seed"],
+                    api_key=get_entsoe_api_key(),
+                )
+            else:
+                source = PriceSources.configured()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        def report(simulated_now, stats):
+            self.stdout.write(f"{simulated_now:%Y-%m-%d}: {stats}")
+
+        mode = "live control" if options["live_control"] else "dry-run control"
+        self.stdout.write(f"Replaying {source} prices from {start:%Y-%m-%d} for {options['days']} days ({mode})")
+        stats = PriceReplay.run(
+            source,
+            start,
+            end,
+            speed=options["speed"],
+            live_control=options["live_control"],
+            on_day=report,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Replay complete: {stats}"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_adjust_transfer_price_precision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shellydevice',
+            name='local_host',
+            field=models.CharField(blank=True, default='', help_text='Optional LAN IP or host name for direct Gen2 RPC control (cloud is used as fallback)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='shellydevice',
+            name='local_password',
+            field=models.CharField(blank=True, default='', help_text="Optional password for Gen2 digest authentication (user 'admin')", max_length=255),
+        ),
+        migrations.AddField(
+            model_name='shellytemperature',
+            name='local_host',
+            field=models.CharField(blank=True, default='', help_text='Optional LAN IP or host name for direct Gen2 RPC reads (cloud is used as fallback)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='shellytemperature',
+            name='local_password',
+            field=models.CharField(blank=True, default='', help_text="Optional password for Gen2 digest authentication (user 'admin')", max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='shellydevice',
+            name='status',
+            field=models.IntegerField(default=1),
+        ),
+    ]
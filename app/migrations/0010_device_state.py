@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_shelly_local_transport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.IntegerField(default=0)),
+                ('output', models.BooleanField(blank=True, null=True)),
+                ('online', models.BooleanField(blank=True, null=True)),
+                ('power_w', models.FloatField(blank=True, null=True)),
+                ('status_at', models.DateTimeField(blank=True, null=True)),
+                ('command_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='app.shellydevice')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'channel'), name='unique_device_state_channel')],
+            },
+        ),
+    ]
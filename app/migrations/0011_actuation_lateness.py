@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_device_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActuationLateness',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(db_index=True)),
+                ('reason', models.CharField(max_length=20)),
+                ('priority', models.IntegerField()),
+                ('group_key', models.CharField(blank=True, default='', max_length=255)),
+                ('lateness_seconds', models.FloatField(blank=True, null=True)),
+                ('deferred', models.BooleanField(default=False)),
+                ('deadline_missed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actuation_lateness', to='app.shellydevice')),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+def dedupe_prices(apps, schema_editor):
+    """Keep the newest price per start_time and move assignments of the duplicates onto it."""
+    ElectricityPrice = apps.get_model("app", "ElectricityPrice")
+    DeviceAssignment = apps.get_model("app", "DeviceAssignment")
+
+    duplicate_starts = (
+        ElectricityPrice.objects.values("start_time")
+        .annotate(count=models.Count("id"))
+        .filter(count__gt=1)
+        .values_list("start_time", flat=True)
+    )
+    for start_time in list(duplicate_starts):
+        ids = list(
+            ElectricityPrice.objects.filter(start_time=start_time)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        keep, duplicates = ids[0], ids[1:]
+        DeviceAssignment.objects.filter(electricity_price_id__in=duplicates).update(
+            electricity_price_id=keep
+        )
+        ElectricityPrice.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0011_actuation_lateness"),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_prices, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="electricityprice",
+            constraint=models.UniqueConstraint(
+                fields=("start_time",), name="unique_electricity_price_start_time"
+            ),
+        ),
+    ]
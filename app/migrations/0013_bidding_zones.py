@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_electricityprice_unique_start_time'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='electricityprice',
+            name='unique_electricity_price_start_time',
+        ),
+        migrations.AddField(
+            model_name='electricityprice',
+            name='bidding_zone',
+            field=models.CharField(choices=[('FI', 'Finland'), ('SE1', 'Sweden SE1 (Luleå)'), ('SE2', 'Sweden SE2 (Sundsvall)'), ('SE3', 'Sweden SE3 (Stockholm)'), ('SE4', 'Sweden SE4 (Malmö)'), ('NO1', 'Norway NO1 (Oslo)'), ('NO2', 'Norway NO2 (Kristiansand)'), ('NO3', 'Norway NO3 (Trondheim)'), ('NO4', 'Norway NO4 (Tromsø)'), ('NO5', 'Norway NO5 (Bergen)'), ('DK1', 'Denmark DK1 (West)'), ('DK2', 'Denmark DK2 (East)'), ('EE', 'Estonia'), ('LV', 'Latvia'), ('LT', 'Lithuania'), ('DE_LU', 'Germany-Luxembourg'), ('NL', 'Netherlands'), ('BE', 'Belgium'), ('FR', 'France'), ('AT', 'Austria'), ('PL', 'Poland')], default='FI', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='shellydevice',
+            name='bidding_zone',
+            field=models.CharField(choices=[('FI', 'Finland'), ('SE1', 'Sweden SE1 (Luleå)'), ('SE2', 'Sweden SE2 (Sundsvall)'), ('SE3', 'Sweden SE3 (Stockholm)'), ('SE4', 'Sweden SE4 (Malmö)'), ('NO1', 'Norway NO1 (Oslo)'), ('NO2', 'Norway NO2 (Kristiansand)'), ('NO3', 'Norway NO3 (Trondheim)'), ('NO4', 'Norway NO4 (Tromsø)'), ('NO5', 'Norway NO5 (Bergen)'), ('DK1', 'Denmark DK1 (West)'), ('DK2', 'Denmark DK2 (East)'), ('EE', 'Estonia'), ('LV', 'Latvia'), ('LT', 'Lithuania'), ('DE_LU', 'Germany-Luxembourg'), ('NL', 'Netherlands'), ('BE', 'Belgium'), ('FR', 'France'), ('AT', 'Austria'), ('PL', 'Poland')], default='FI', help_text='Electricity market bidding zone whose spot prices drive this device', max_length=16),
+        ),
+        migrations.AddConstraint(
+            model_name='electricityprice',
+            constraint=models.UniqueConstraint(fields=('bidding_zone', 'start_time'), name='unique_electricity_price_zone_start_time'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_bidding_zones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceBackfillChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bidding_zone', models.CharField(choices=[('FI', 'Finland'), ('SE1', 'Sweden SE1 (Luleå)'), ('SE2', 'Sweden SE2 (Sundsvall)'), ('SE3', 'Sweden SE3 (Stockholm)'), ('SE4', 'Sweden SE4 (Malmö)'), ('NO1', 'Norway NO1 (Oslo)'), ('NO2', 'Norway NO2 (Kristiansand)'), ('NO3', 'Norway NO3 (Trondheim)'), ('NO4', 'Norway NO4 (Tromsø)'), ('NO5', 'Norway NO5 (Bergen)'), ('DK1', 'Denmark DK1 (West)'), ('DK2', 'Denmark DK2 (East)'), ('EE', 'Estonia'), ('LV', 'Latvia'), ('LT', 'Lithuania'), ('DE_LU', 'Germany-Luxembourg'), ('NL', 'Netherlands'), ('BE', 'Belgium'), ('FR', 'France'), ('AT', 'Austria'), ('PL', 'Poland')], max_length=16)),
+                ('chunk_start', models.DateTimeField()),
+                ('chunk_end', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('rows', models.IntegerField(default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bidding_zone', 'chunk_start'), name='unique_price_backfill_chunk')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_price_backfill_chunks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceFetchAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_day', models.DateField(db_index=True)),
+                ('attempt', models.IntegerField()),
+                ('expected_at', models.DateTimeField()),
+                ('scheduled_for', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField()),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('outcome', models.CharField(choices=[('published', 'Published'), ('not_published', 'Not published yet'), ('up_to_date', 'Up to date'), ('error', 'Error')], max_length=20)),
+                ('missing_zones', models.CharField(blank=True, default='', max_length=255)),
+                ('latency_to_data_seconds', models.FloatField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
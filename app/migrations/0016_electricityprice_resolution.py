@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+def set_resolution(apps, schema_editor):
+    """Derive the resolution of existing prices from their period length."""
+    ElectricityPrice = apps.get_model("app", "ElectricityPrice")
+
+    for price in ElectricityPrice.objects.only("id", "start_time", "end_time").iterator():
+        minutes = int((price.end_time - price.start_time).total_seconds() // 60)
+        if minutes > 0 and minutes != 15:
+            ElectricityPrice.objects.filter(id=price.id).update(resolution_minutes=minutes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_price_fetch_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electricityprice',
+            name='resolution_minutes',
+            field=models.PositiveSmallIntegerField(default=15),
+        ),
+        migrations.RunPython(set_resolution, reverse_code=migrations.RunPython.noop),
+    ]
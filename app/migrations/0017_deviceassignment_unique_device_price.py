@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def dedupe_assignments(apps, schema_editor):
+    """Keep the oldest assignment per device and price period."""
+    DeviceAssignment = apps.get_model("app", "DeviceAssignment")
+
+    duplicates = (
+        DeviceAssignment.objects.values("device_id", "electricity_price_id")
+        .annotate(count=models.Count("id"), keep=models.Min("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in list(duplicates):
+        DeviceAssignment.objects.filter(
+            device_id=duplicate["device_id"],
+            electricity_price_id=duplicate["electricity_price_id"],
+        ).exclude(id=duplicate["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_electricityprice_resolution'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_assignments, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='deviceassignment',
+            constraint=models.UniqueConstraint(fields=('device', 'electricity_price'), name='unique_device_assignment_device_price'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0017_deviceassignment_unique_device_price"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="shellydevice",
+            name="plan_fingerprint",
+            field=models.CharField(blank=True, default="", editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name="shellydevice",
+            name="plan_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="electricityprice",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # Existing assignments do not record who made them, and neither the old
+        # auto-assign nor the views logged which ones they created, so they all
+        # stay manual and no replan removes them. A stale pre-upgrade planner
+        # assignment is at most one planning horizon ahead and simply passes.
+        migrations.AddField(
+            model_name="deviceassignment",
+            name="source",
+            field=models.CharField(
+                choices=[("manual", "Manual"), ("planner", "Planner"), ("thermostat", "Thermostat")],
+                default="manual",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:28
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_incremental_replanning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shellydevice',
+            name='max_off_minutes',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Run blocks: longest time off before the first run and between two runs (minutes, empty for no limit)', null=True),
+        ),
+        migrations.AddField(
+            model_name='shellydevice',
+            name='max_runs_per_plan',
+            field=models.PositiveSmallIntegerField(default=4, help_text='Run blocks: most times the device is switched on in one plan, which covers all upcoming published prices (up to about a day and a half)', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='shellydevice',
+            name='min_run_minutes',
+            field=models.PositiveSmallIntegerField(default=60, help_text='Run blocks: shortest run once the device is switched on (minutes)'),
+        ),
+        migrations.AddField(
+            model_name='shellydevice',
+            name='schedule_mode',
+            field=models.CharField(choices=[('cheapest', 'Cheapest periods'), ('run_blocks', 'Run blocks')], default='cheapest', help_text='Cheapest periods picks the cheapest periods one by one; run blocks plans contiguous runs within the limits below, switching the device less often', max_length=16),
+        ),
+    ]
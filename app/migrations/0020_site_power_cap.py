@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_shellydevice_run_blocks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shellydevice',
+            name='rated_power_w',
+            field=models.PositiveIntegerField(blank=True, help_text="Power the device draws when on (W); counted against the owner's site power cap", null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='site_power_cap_w',
+            field=models.PositiveIntegerField(blank=True, help_text="Most power the user's devices may draw at once (W), e.g. the main fuse or capacity tariff limit; empty for no cap", null=True),
+        ),
+    ]
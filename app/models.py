@@ -1,6 +1,10 @@
+from datetime import timedelta
+
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.contrib.auth.models import User
 from app.utils.time_utils import TimeUtils
+from app.bidding_zones import BIDDING_ZONE_CHOICES, DEFAULT_BIDDING_ZONE
 from django.conf import settings
 import pytz
 from django.db.models.signals import post_save
@@ -80,6 +84,27 @@ class ShellyDevice(models.Model):
         help_text="Base URL of the Shelly server used for device communication",
     )
 
+    local_host = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        help_text="Optional LAN IP or host name for direct Gen2 RPC control (cloud is used as fallback)",
+    )
+
+    local_password = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        help_text="Optional password for Gen2 digest authentication (user 'admin')",
+    )
+
+    bidding_zone = models.CharField(
+        max_length=16,
+        choices=BIDDING_ZONE_CHOICES,
+        default=DEFAULT_BIDDING_ZONE,
+        help_text="Electricity market bidding zone whose spot prices drive this device",
+    )
+
     thermostat_device = models.ForeignKey(
         "ShellyTemperature",
         on_delete=models.SET_NULL,
@@ -89,6 +114,69 @@ class ShellyDevice(models.Model):
         help_text="Optional default thermostat device for this Shelly device",
     )
 
+    SCHEDULE_CHEAPEST = "cheapest"
+    SCHEDULE_RUN_BLOCKS = "run_blocks"
+    SCHEDULE_MODE_CHOICES = [
+        (SCHEDULE_CHEAPEST, "Cheapest periods"),
+        (SCHEDULE_RUN_BLOCKS, "Run blocks"),
+    ]
+
+    schedule_mode = models.CharField(
+        max_length=16,
+        choices=SCHEDULE_MODE_CHOICES,
+        default=SCHEDULE_CHEAPEST,
+        help_text=(
+            "Cheapest periods picks the cheapest periods one by one; run blocks plans "
+            "contiguous runs within the limits below, switching the device less often"
+        ),
+    )
+
+    min_run_minutes = models.PositiveSmallIntegerField(
+        default=60, help_text="Run blocks: shortest run once the device is switched on (minutes)"
+    )
+
+    max_off_minutes = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text=(
+            "Run blocks: longest time off before the first run and between two runs "
+            "(minutes, empty for no limit)"
+        ),
+    )
+
+    max_runs_per_plan = models.PositiveSmallIntegerField(
+        default=4,
+        validators=[MinValueValidator(1)],
+        help_text=(
+            "Run blocks: most times the device is switched on in one plan, which covers "
+            "all upcoming published prices (up to about a day and a half)"
+        ),
+    )
+
+    rated_power_w = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Power the device draws when on (W); counted against the owner's site power cap",
+    )
+
+    # Inputs of the device's plan; saving a change to one replans the device
+    PLAN_FIELDS = (
+        "bidding_zone",
+        "run_hours_per_day",
+        "day_transfer_price",
+        "night_transfer_price",
+        "auto_assign_price_threshold",
+        "schedule_mode",
+        "min_run_minutes",
+        "max_off_minutes",
+        "max_runs_per_plan",
+        "rated_power_w",
+    )
+
+    # Fingerprint of (prices version, PLAN_FIELDS) the current plan was made from
+    plan_fingerprint = models.CharField(max_length=40, blank=True, default="", editable=False)
+    plan_version = models.PositiveIntegerField(default=0, editable=False)  # Replans so far
+
     def __str__(self):
         return self.familiar_name
 
@@ -111,6 +199,18 @@ class ShellyTemperature(models.Model):
         default="https://yourapiaddress.shelly.cloud",
         help_text="Base URL of the Shelly server used for device communication",
     )
+    local_host = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        help_text="Optional LAN IP or host name for direct Gen2 RPC reads (cloud is used as fallback)",
+    )
+    local_password = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        help_text="Optional password for Gen2 digest authentication (user 'admin')",
+    )
     min_temperature = models.DecimalField(
         max_digits=5,
         decimal_places=2,
@@ -146,12 +246,43 @@ class ShellyTemperature(models.Model):
         return self.familiar_name
 
 
+class ElectricityPriceQuerySet(models.QuerySet):
+    """Lookups over periods of mixed length (15-minute and legacy hourly prices)."""
+
+    # Longest period stored; bounds the start_time range scanned by covering()
+    MAX_RESOLUTION_MINUTES = 60
+
+    def covering(self, moment):
+        """Prices whose period contains moment (at most one per bidding zone)."""
+        return self.filter(
+            start_time__gt=moment - timedelta(minutes=self.MAX_RESOLUTION_MINUTES),
+            start_time__lte=moment,
+            end_time__gt=moment,
+        )
+
+    def overlapping(self, start, end):
+        """Prices whose period overlaps [start, end)."""
+        return self.filter(
+            start_time__gt=start - timedelta(minutes=self.MAX_RESOLUTION_MINUTES),
+            start_time__lt=end,
+            end_time__gt=start,
+        )
+
+
 class ElectricityPrice(models.Model):
     id = models.AutoField(primary_key=True)  # Explicit ID field
     start_time = models.DateTimeField(default=TimeUtils.now_utc)  # Store in UTC
     end_time = models.DateTimeField(default=TimeUtils.now_utc)  # Store in UTC
+    # Native length of the period (15 or 60); hourly prices are stored as one row
+    resolution_minutes = models.PositiveSmallIntegerField(default=15)
     price_kwh = models.DecimalField(max_digits=12, decimal_places=5)
+    bidding_zone = models.CharField(
+        max_length=16, choices=BIDDING_ZONE_CHOICES, default=DEFAULT_BIDDING_ZONE
+    )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Part of the planner's prices version
+
+    objects = ElectricityPriceQuerySet.as_manager()
 
     def __str__(self):
         # Handle case where price is not set yet
@@ -160,6 +291,14 @@ class ElectricityPrice(models.Model):
         # The prices are already stored in c/kWh format, not €/MWh
         return f"{float(self.price_kwh):.3f} c/kWh from {self.start_time} to {self.end_time}"
 
+    class Meta:
+        constraints = [
+            # Also serves as the (zone, start_time) index for zone-specific series
+            models.UniqueConstraint(
+                fields=["bidding_zone", "start_time"], name="unique_electricity_price_zone_start_time"
+            )
+        ]
+
 
 class TemperatureReading(models.Model):
     thermostat = models.ForeignKey(
@@ -195,15 +334,150 @@ class DeviceLog(models.Model):
         return f"Log for {self.device.familiar_name if self.device else 'System'} - {self.status}"
 
 
+class DeviceState(models.Model):
+    """Last known relay state of one Shelly device channel, kept up to date by status reads and relay commands."""
+
+    device = models.ForeignKey(
+        ShellyDevice, on_delete=models.CASCADE, related_name="states"
+    )
+    channel = models.IntegerField(default=0)
+    output = models.BooleanField(null=True, blank=True)  # None = unknown
+    online = models.BooleanField(null=True, blank=True)
+    power_w = models.FloatField(null=True, blank=True)
+    status_at = models.DateTimeField(null=True, blank=True)  # Last status read
+    command_at = models.DateTimeField(null=True, blank=True)  # Last relay command
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def observed_at(self):
+        """Most recent moment the state was confirmed by a read or a command."""
+        times = [t for t in (self.status_at, self.command_at) if t is not None]
+        return max(times) if times else None
+
+    def __str__(self):
+        state = "unknown" if self.output is None else ("on" if self.output else "off")
+        return f"{self.device.familiar_name} switch:{self.channel} {state}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device", "channel"], name="unique_device_state_channel"
+            )
+        ]
+
+
+class ActuationLateness(models.Model):
+    """How long after the period boundary a control pass reached one device."""
+
+    device = models.ForeignKey(
+        ShellyDevice, on_delete=models.CASCADE, related_name="actuation_lateness"
+    )
+    period_start = models.DateTimeField(db_index=True)
+    reason = models.CharField(max_length=20)  # ControlPlanner reason
+    priority = models.IntegerField()  # ActuationScheduler priority, lower runs first
+    group_key = models.CharField(max_length=255, blank=True, default="")
+    lateness_seconds = models.FloatField(null=True, blank=True)  # None when deferred
+    deferred = models.BooleanField(default=False)  # Dropped to meet the deadline
+    deadline_missed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        if self.deferred:
+            return f"{self.device.familiar_name} deferred at {self.period_start}"
+        return f"{self.device.familiar_name} +{self.lateness_seconds:.1f}s at {self.period_start}"
+
+
+class PriceBackfillChunk(models.Model):
+    """Checkpoint of one month-sized chunk of a historical price backfill."""
+
+    STATUS_PENDING = "pending"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    bidding_zone = models.CharField(max_length=16, choices=BIDDING_ZONE_CHOICES)
+    chunk_start = models.DateTimeField()  # UTC, inclusive
+    chunk_end = models.DateTimeField()  # UTC, exclusive
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    rows = models.IntegerField(default=0)  # Price rows parsed from the chunk
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bidding_zone", "chunk_start"], name="unique_price_backfill_chunk"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.bidding_zone} {self.chunk_start:%Y-%m} {self.status}"
+
+
+class PriceFetchAttempt(models.Model):
+    """One scheduled day-ahead price fetch and how long after publication the data arrived."""
+
+    OUTCOME_PUBLISHED = "published"  # This attempt stored the missing prices
+    OUTCOME_NOT_PUBLISHED = "not_published"  # Still missing, retried with backoff
+    OUTCOME_UP_TO_DATE = "up_to_date"  # Nothing missing, no API call
+    OUTCOME_ERROR = "error"
+    OUTCOME_CHOICES = [
+        (OUTCOME_PUBLISHED, "Published"),
+        (OUTCOME_NOT_PUBLISHED, "Not published yet"),
+        (OUTCOME_UP_TO_DATE, "Up to date"),
+        (OUTCOME_ERROR, "Error"),
+    ]
+
+    delivery_day = models.DateField(db_index=True)  # Market (CET) day the prices are for
+    attempt = models.IntegerField()  # 1 for the first attempt of the delivery day
+    expected_at = models.DateTimeField()  # Expected publication time
+    scheduled_for = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField()
+    duration_seconds = models.FloatField(default=0)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    missing_zones = models.CharField(max_length=255, blank=True, default="")  # After the attempt
+    latency_to_data_seconds = models.FloatField(null=True, blank=True)  # Set when published
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"{self.delivery_day} #{self.attempt} {self.outcome}"
+
+
 class DeviceAssignment(models.Model):
+    SOURCE_MANUAL = "manual"
+    SOURCE_PLANNER = "planner"  # Replaced when the device is replanned
+    SOURCE_THERMOSTAT = "thermostat"
+    SOURCE_CHOICES = [
+        (SOURCE_MANUAL, "Manual"),
+        (SOURCE_PLANNER, "Planner"),
+        (SOURCE_THERMOSTAT, "Thermostat"),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     device = models.ForeignKey(ShellyDevice, on_delete=models.CASCADE)
     electricity_price = models.ForeignKey(ElectricityPrice, on_delete=models.CASCADE)
     assigned_at = models.DateTimeField(auto_now_add=True)  # Timestamp of assignment
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default=SOURCE_MANUAL)
 
     def __str__(self):
         return f"{self.device.familiar_name} assigned at {self.electricity_price.start_time} by {self.user.username}"
 
+    class Meta:
+        constraints = [
+            # One assignment per device and period; also indexes the control pass lookup
+            models.UniqueConstraint(
+                fields=["device", "electricity_price"], name="unique_device_assignment_device_price"
+            )
+        ]
+
 
 class UserProfile(models.Model):
     """Extended user profile with timezone and other preferences."""
@@ -236,6 +510,14 @@ class UserProfile(models.Model):
         default="Europe/Helsinki",
         help_text="User's preferred timezone for displaying dates and times",
     )
+    site_power_cap_w = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=(
+            "Most power the user's devices may draw at once (W), e.g. the main fuse "
+            "or capacity tariff limit; empty for no cap"
+        ),
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -318,3 +600,25 @@ def create_or_update_user_profile_and_group(sender, instance, created, **kwargs)
         else:
             # Create profile if it doesn't exist (for existing users)
             UserProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=ShellyDevice)
+def replan_device_on_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Replans a saved device once the save is committed (skipped when its plan inputs are unchanged)."""
+    if raw or (update_fields is not None and not set(update_fields) & set(ShellyDevice.PLAN_FIELDS)):
+        return
+    from django.db import transaction
+    from app.incremental_planner import IncrementalPlanner
+
+    transaction.on_commit(lambda: IncrementalPlanner.replan_device(instance.pk))
+
+
+@receiver(post_save, sender=UserProfile)
+def replan_site_on_change(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """Replans the user's devices once a profile save is committed (skipped when the cap is unchanged)."""
+    if raw or created or (update_fields is not None and "site_power_cap_w" not in update_fields):
+        return
+    from django.db import transaction
+    from app.incremental_planner import IncrementalPlanner
+
+    transaction.on_commit(lambda: IncrementalPlanner.replan_site(instance.user_id))
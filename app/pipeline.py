@@ -0,0 +1,152 @@
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.dispatch import Signal, receiver
+
+from app.logger import log_device_event
+from app.utils.security_utils import SecurityUtils
+
+# Sent with zones=[...] after a price fetch stored new or changed prices
+prices_changed = Signal()
+
+
+class PipelineStage:
+    """
+    One step of the price and control pipeline, with its own trigger and time
+    budget. A stage never runs twice at the same time: a scheduled run() that
+    finds the previous run still going is skipped, while an event-triggered
+    start() is queued and runs once more when the current run finishes.
+    """
+
+    # Run every stage synchronously in the caller's thread (offline replay)
+    inline = False
+
+    def __init__(self, name: str, timeout_seconds: float):
+        self.name = name
+        self.timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+        self._busy = False
+        self._queued = None  # (func, args, kwargs) started while busy
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self._busy:
+                return False
+            self._busy = True
+            return True
+
+    def _call(self, func, args, kwargs) -> None:
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            safe_error = SecurityUtils.get_safe_error_message(e, f"Pipeline stage {self.name} failed")
+            log_device_event(None, safe_error, "ERROR")
+
+    def _work(self, func, args, kwargs, done: threading.Event) -> None:
+        try:
+            while True:
+                self._call(func, args, kwargs)
+                with self._lock:
+                    if self._queued is None:
+                        self._busy = False
+                        break
+                    func, args, kwargs = self._queued
+                    self._queued = None
+        finally:
+            close_old_connections()
+            done.set()
+
+    def _supervise(self, func, args, kwargs) -> bool:
+        done = threading.Event()
+        threading.Thread(
+            target=self._work,
+            args=(func, args, kwargs, done),
+            name=f"pipeline-{self.name}",
+            daemon=True,
+        ).start()
+        if done.wait(self.timeout_seconds):
+            return True
+        log_device_event(
+            None,
+            f"Pipeline stage {self.name} exceeded its {self.timeout_seconds:.0f}s budget; "
+            f"it keeps running and later triggers are skipped until it finishes",
+            "ERROR",
+        )
+        return False
+
+    def run(self, func, *args, **kwargs) -> bool:
+        """
+        Runs func and waits at most the stage timeout. Returns True when it
+        finished in time, False when it overran or the stage was already running.
+        """
+        if PipelineStage.inline:
+            self._call(func, args, kwargs)
+            return True
+        if not self._claim():
+            log_device_event(None, f"Pipeline stage {self.name} is still running; trigger skipped", "WARN")
+            return False
+        return self._supervise(func, args, kwargs)
+
+    def start(self, func, *args, **kwargs) -> None:
+        """Runs func in the background without blocking the caller."""
+        if PipelineStage.inline:
+            self._call(func, args, kwargs)
+            return
+        with self._lock:
+            if self._busy:
+                self._queued = (func, args, kwargs)
+                return
+            self._busy = True
+        threading.Thread(
+            target=self._supervise,
+            args=(func, args, kwargs),
+            name=f"pipeline-{self.name}-watch",
+            daemon=True,
+        ).start()
+
+
+class PricePipeline:
+    """
+    Price fetching, replanning and device control run as independent stages.
+    The control pass runs on its own quarter-hour trigger from the stored
+    assignments, whatever the fetch does; a fetch that stores new or changed
+    prices sends prices_changed, which starts replanning in the background.
+    """
+
+    FETCH = PipelineStage("price_fetch", timeout_seconds=300)
+    REPLAN = PipelineStage("replan", timeout_seconds=300)
+    CONTROL = PipelineStage("control", timeout_seconds=14 * 60)  # Finish inside the period
+
+    @staticmethod
+    def run_fetch(scheduled_for=None) -> None:
+        """Scheduler entry point of the fetch stage."""
+        from app.price_fetch_planner import PriceFetchPlanner
+        from app.utils.time_utils import TimeUtils
+
+        if not PricePipeline.FETCH.run(PriceFetchPlanner.run_attempt, scheduled_for=scheduled_for):
+            # Skipped or overran: queue a later attempt so the fetch job is never lost;
+            # a still running attempt replaces it when it finishes
+            PriceFetchPlanner.schedule_next(
+                TimeUtils.now_utc() + timedelta(minutes=PriceFetchPlanner.RETRY_BASE_MINUTES)
+            )
+
+    @staticmethod
+    def run_control() -> None:
+        """Scheduler entry point of the quarter-hourly control stage."""
+        from app.tasks import DeviceController
+
+        PricePipeline.CONTROL.run(DeviceController.control_shelly_devices)
+
+    @staticmethod
+    def replan(zones=()) -> None:
+        """Reassigns the cheapest periods of the devices in the changed zones."""
+        from app.price_views import set_cheapest_hours
+
+        log_device_event(None, f"Prices changed for {','.join(zones)}. Updating cheapest hours.", "INFO")
+        set_cheapest_hours(zones=list(zones) or None)
+
+
+@receiver(prices_changed)
+def replan_on_price_change(sender, zones=(), **kwargs):
+    PricePipeline.REPLAN.start(PricePipeline.replan, zones=list(zones))
@@ -0,0 +1,183 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+import requests
+from django.db import close_old_connections
+from entsoe.exceptions import NoMatchingDataError
+
+from app.bidding_zones import BiddingZones
+from app.entsoe_parser import parse_day_ahead
+from app.logger import log_device_event
+from app.models import PriceBackfillChunk
+from app.price_store import PriceStore
+from app.price_views import fetch_day_ahead_xml
+from app.utils.rate_limiter import entsoe_rate_limiter
+from app.utils.security_utils import SecurityUtils
+from app.utils.time_utils import TimeUtils
+
+ENTSOE_API_URL = "https://web-api.tp.entsoe.eu/api"
+
+
+class BackfillProgress:
+    """Running totals of one backfill run, reported in rows per second."""
+
+    def __init__(self, total_chunks: int):
+        self.total_chunks = total_chunks
+        self.done = 0
+        self.failed = 0
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.started = time.monotonic()
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.done + self.failed}/{self.total_chunks} chunks, {self.rows} rows "
+            f"(inserted={self.inserted}, updated={self.updated}, failed chunks={self.failed}), "
+            f"{self.rows_per_second:.0f} rows/s"
+        )
+
+
+class PriceBackfill:
+    """
+    Backfills historical day-ahead prices in month-sized chunks.
+    Chunks are downloaded and parsed in a thread pool behind the shared ENTSO-E
+    rate limiter, while the calling thread writes them with the bulk upsert and
+    checkpoints each one in PriceBackfillChunk, so an interrupted run resumes
+    with the chunks that are not done yet.
+    """
+
+    MAX_ATTEMPTS = 3  # Tries per chunk within one run
+
+    @staticmethod
+    def month_chunks(start: datetime, end: datetime):
+        """Yields (chunk_start, chunk_end) UTC month windows covering [start, end)."""
+        chunk_start = TimeUtils.to_utc(start)
+        end = TimeUtils.to_utc(end)
+        while chunk_start < end:
+            if chunk_start.month == 12:
+                next_month = chunk_start.replace(year=chunk_start.year + 1, month=1, day=1)
+            else:
+                next_month = chunk_start.replace(month=chunk_start.month + 1, day=1)
+            next_month = next_month.replace(hour=0, minute=0, second=0, microsecond=0)
+            chunk_end = min(next_month, end)
+            yield chunk_start, chunk_end
+            chunk_start = chunk_end
+
+    @staticmethod
+    def plan(zones, start: datetime, end: datetime, retry_failed: bool = True) -> list:
+        """
+        Creates the checkpoints of every chunk (existing ones are kept) and returns
+        those still to do, oldest first.
+        """
+        windows = list(PriceBackfill.month_chunks(start, end))
+        PriceBackfillChunk.objects.bulk_create(
+            [
+                PriceBackfillChunk(bidding_zone=zone, chunk_start=chunk_start, chunk_end=chunk_end)
+                for zone in zones
+                for chunk_start, chunk_end in windows
+            ],
+            ignore_conflicts=True,
+        )
+        statuses = [PriceBackfillChunk.STATUS_PENDING]
+        if retry_failed:
+            statuses.append(PriceBackfillChunk.STATUS_FAILED)
+        return list(
+            PriceBackfillChunk.objects.filter(
+                bidding_zone__in=zones,
+                chunk_start__gte=TimeUtils.to_utc(start),
+                chunk_start__lt=TimeUtils.to_utc(end),
+                status__in=statuses,
+            ).order_by("chunk_start", "bidding_zone")
+        )
+
+    @staticmethod
+    def fetch_chunk(api_key: str, zone: str, chunk_start: datetime, chunk_end: datetime):
+        """
+        Downloads and parses one chunk into (start_time, end_time, price_kwh) rows
+        in the resolution each period was published in, preferring 15-minute
+        periods where resolutions overlap. Request errors are retried behind the
+        rate limiter up to MAX_ATTEMPTS.
+        """
+        area_code = BiddingZones.eic(zone)
+        attempts = 0
+        while True:
+            attempts += 1
+            entsoe_rate_limiter.wait_if_needed(ENTSOE_API_URL, api_key)
+            try:
+                raw_response = fetch_day_ahead_xml(
+                    api_key, area_code, pd.Timestamp(chunk_start), pd.Timestamp(chunk_end)
+                )
+            except NoMatchingDataError:
+                entsoe_rate_limiter.record_success(ENTSOE_API_URL, api_key)
+                return []
+            except requests.RequestException as e:
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("Retry-After") if response is not None else None
+                entsoe_rate_limiter.record_failure(ENTSOE_API_URL, api_key, retry_after)
+                if attempts >= PriceBackfill.MAX_ATTEMPTS:
+                    raise
+                continue
+            entsoe_rate_limiter.record_success(ENTSOE_API_URL, api_key)
+
+            # A month can change resolution part way, so every resolution is kept
+            rows = []
+            for series in parse_day_ahead(raw_response).covering((15, 60, 30)):
+                rows.extend(PriceStore.rows_from_series(series.window(chunk_start, chunk_end)))
+            return rows
+
+    @staticmethod
+    def _fetch_in_thread(api_key, chunk):
+        try:
+            return PriceBackfill.fetch_chunk(api_key, chunk.bidding_zone, chunk.chunk_start, chunk.chunk_end)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def run(api_key: str, zones, start: datetime, end: datetime, workers: int = 4,
+            retry_failed: bool = True, on_progress=None) -> BackfillProgress:
+        """
+        Backfills every pending chunk of the zones between start and end.
+        on_progress(chunk, progress) is called after each chunk is checkpointed.
+        """
+        chunks = PriceBackfill.plan(zones, start, end, retry_failed)
+        progress = BackfillProgress(len(chunks))
+        if not chunks:
+            return progress
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="backfill") as pool:
+            futures = {pool.submit(PriceBackfill._fetch_in_thread, api_key, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    rows = future.result()
+                    result = PriceStore.upsert_prices(rows, bidding_zone=chunk.bidding_zone)
+                except Exception as e:
+                    chunk.status = PriceBackfillChunk.STATUS_FAILED
+                    chunk.error = SecurityUtils.sanitize_message(
+                        SecurityUtils.get_safe_error_message(e, "Price backfill chunk failed")
+                    )
+                    progress.failed += 1
+                    log_device_event(None, f"Price backfill {chunk} failed: {chunk.error}", "ERROR")
+                else:
+                    chunk.status = PriceBackfillChunk.STATUS_DONE
+                    chunk.rows = len(rows)
+                    chunk.error = ""
+                    progress.done += 1
+                    progress.rows += len(rows)
+                    progress.inserted += result.inserted
+                    progress.updated += result.updated
+                chunk.attempts += 1
+                chunk.save(update_fields=["status", "attempts", "rows", "error", "updated_at"])
+                if on_progress:
+                    on_progress(chunk, progress)
+
+        log_device_event(None, f"Price backfill finished: {progress}", "INFO")
+        return progress
@@ -0,0 +1,204 @@
+import logging
+from datetime import datetime, time, timedelta
+
+import pytz
+from django.http import JsonResponse
+
+from app.bidding_zones import BiddingZones
+from app.logger import log_device_event
+from app.models import AppSetting, ElectricityPrice, PriceFetchAttempt
+from app.utils.security_utils import SecurityUtils
+from app.utils.time_utils import TimeUtils
+
+logger = logging.getLogger(__name__)
+
+
+class PriceFetchPlanner:
+    """
+    Schedules day-ahead price fetches around the auction publication instead of
+    polling every hour. The SDAC auction publishes every zone at the same moment
+    in market time (CET); the first attempt runs at the expected publication time,
+    attempts that find no data are retried with exponential backoff, and once every
+    configured zone has the next delivery day the planner sleeps until the next
+    publication.
+    """
+
+    MARKET_TZ = pytz.timezone("Europe/Brussels")  # SDAC market time (CET/CEST)
+    DEFAULT_PUBLICATION_TIME = "13:00"  # When prices are normally on the ENTSO-E platform
+    RETRY_BASE_MINUTES = 5
+    RETRY_MAX_MINUTES = 60
+
+    @staticmethod
+    def get_publication_time() -> time:
+        """Expected publication in market time, from AppSetting PRICE_PUBLICATION_TIME (HH:MM)."""
+        setting = AppSetting.objects.filter(key="PRICE_PUBLICATION_TIME").first()
+        value = setting.value if setting else PriceFetchPlanner.DEFAULT_PUBLICATION_TIME
+        try:
+            return datetime.strptime(value.strip(), "%H:%M").time()
+        except (AttributeError, ValueError):
+            return datetime.strptime(PriceFetchPlanner.DEFAULT_PUBLICATION_TIME, "%H:%M").time()
+
+    @staticmethod
+    def publication_at(delivery_day, publication_time: time = None) -> datetime:
+        """UTC time the prices of a delivery day are expected (the market day before)."""
+        publication_time = publication_time or PriceFetchPlanner.get_publication_time()
+        local = PriceFetchPlanner.MARKET_TZ.localize(
+            datetime.combine(delivery_day - timedelta(days=1), publication_time)
+        )
+        return TimeUtils.to_utc(local)
+
+    @staticmethod
+    def expected_local(zone: str, delivery_day, publication_time: time = None) -> datetime:
+        """Expected publication of a delivery day in the zone's local time."""
+        return PriceFetchPlanner.publication_at(delivery_day, publication_time).astimezone(
+            BiddingZones.timezone(zone)
+        )
+
+    @staticmethod
+    def delivery_day_start(delivery_day) -> datetime:
+        """UTC start of a delivery day (market midnight)."""
+        return TimeUtils.to_utc(
+            PriceFetchPlanner.MARKET_TZ.localize(datetime.combine(delivery_day, time(0, 0)))
+        )
+
+    @staticmethod
+    def target_day(now: datetime, publication_time: time = None):
+        """The delivery day whose prices are published next (or were published last)."""
+        publication_time = publication_time or PriceFetchPlanner.get_publication_time()
+        market_now = now.astimezone(PriceFetchPlanner.MARKET_TZ)
+        if market_now.time() >= publication_time:
+            return market_now.date() + timedelta(days=1)
+        return market_now.date()
+
+    @staticmethod
+    def missing_zones(zones, delivery_day) -> list:
+        """Zones without any price in the delivery day, with one query."""
+        present = set(
+            ElectricityPrice.objects.filter(
+                bidding_zone__in=zones,
+                start_time__gte=PriceFetchPlanner.delivery_day_start(delivery_day),
+            )
+            .values_list("bidding_zone", flat=True)
+            .distinct()
+        )
+        return [zone for zone in zones if zone not in present]
+
+    @staticmethod
+    def retry_delay(failures: int) -> timedelta:
+        """Exponential backoff after `failures` attempts without data."""
+        minutes = PriceFetchPlanner.RETRY_BASE_MINUTES * 2 ** max(0, failures - 1)
+        return timedelta(minutes=min(minutes, PriceFetchPlanner.RETRY_MAX_MINUTES))
+
+    @staticmethod
+    def next_run_at(now: datetime = None, zones=None) -> datetime:
+        """When the next attempt should run."""
+        now = now or TimeUtils.now_utc()
+        zones = zones if zones is not None else BiddingZones.configured()
+        publication_time = PriceFetchPlanner.get_publication_time()
+        day = PriceFetchPlanner.target_day(now, publication_time)
+
+        if not PriceFetchPlanner.missing_zones(zones, day):
+            # Sleep until the next delivery day is published
+            return PriceFetchPlanner.publication_at(day + timedelta(days=1), publication_time)
+
+        failed = PriceFetchAttempt.objects.filter(delivery_day=day).exclude(
+            outcome=PriceFetchAttempt.OUTCOME_UP_TO_DATE
+        )
+        last = failed.order_by("-started_at").first()
+        if last is None:
+            return max(now, PriceFetchPlanner.publication_at(day, publication_time))
+        return max(now, last.started_at + PriceFetchPlanner.retry_delay(failed.count()))
+
+    @staticmethod
+    def schedule_next(not_before: datetime = None) -> None:
+        """
+        Queues the next attempt, never earlier than not_before. When the next
+        attempt cannot be planned (e.g. the database is locked) it is retried after
+        RETRY_BASE_MINUTES, so the fetch job is never left unscheduled.
+        """
+        from app.scheduler import schedule_price_fetch
+
+        try:
+            run_at = PriceFetchPlanner.next_run_at()
+        except Exception as e:
+            logger.error(SecurityUtils.get_safe_error_message(e, "Planning the next price fetch failed"))
+            run_at = TimeUtils.now_utc() + timedelta(minutes=PriceFetchPlanner.RETRY_BASE_MINUTES)
+        if not_before is not None:
+            run_at = max(run_at, not_before)
+        schedule_price_fetch(run_at)
+
+    @staticmethod
+    def run_attempt(scheduled_for: datetime = None) -> PriceFetchAttempt:
+        """
+        Fetches prices if the target delivery day is missing for any configured zone,
+        records the attempt and schedules the next one, also when the attempt fails.
+        """
+        recorded = False
+        try:
+            attempt = PriceFetchPlanner._attempt(scheduled_for)
+            recorded = True
+            return attempt
+        finally:
+            # A failed attempt may not be recorded, so keep its retry from running at once
+            PriceFetchPlanner.schedule_next(
+                None
+                if recorded
+                else TimeUtils.now_utc() + timedelta(minutes=PriceFetchPlanner.RETRY_BASE_MINUTES)
+            )
+
+    @staticmethod
+    def _attempt(scheduled_for: datetime = None) -> PriceFetchAttempt:
+        from app.price_views import call_fetch_prices  # Keeps this module light for the scheduler
+
+        started_at = TimeUtils.now_utc()
+        zones = BiddingZones.configured()
+        publication_time = PriceFetchPlanner.get_publication_time()
+        day = PriceFetchPlanner.target_day(started_at, publication_time)
+        expected_at = PriceFetchPlanner.publication_at(day, publication_time)
+        attempt = PriceFetchAttempt(
+            delivery_day=day,
+            attempt=PriceFetchAttempt.objects.filter(delivery_day=day).count() + 1,
+            expected_at=expected_at,
+            scheduled_for=scheduled_for,
+            started_at=started_at,
+        )
+
+        missing = PriceFetchPlanner.missing_zones(zones, day)
+        if not missing:
+            attempt.outcome = PriceFetchAttempt.OUTCOME_UP_TO_DATE
+        else:
+            try:
+                response = call_fetch_prices(None)
+                if isinstance(response, JsonResponse) and response.status_code >= 500:
+                    attempt.error = SecurityUtils.sanitize_message(response.content.decode()[:500])
+            except Exception as e:
+                attempt.error = SecurityUtils.get_safe_error_message(e, "Price fetch attempt failed")
+            missing = PriceFetchPlanner.missing_zones(zones, day)
+            if not missing:
+                attempt.outcome = PriceFetchAttempt.OUTCOME_PUBLISHED
+            elif attempt.error:
+                attempt.outcome = PriceFetchAttempt.OUTCOME_ERROR
+            else:
+                attempt.outcome = PriceFetchAttempt.OUTCOME_NOT_PUBLISHED
+
+        finished_at = TimeUtils.now_utc()
+        attempt.duration_seconds = (finished_at - started_at).total_seconds()
+        attempt.missing_zones = ",".join(missing)
+        if attempt.outcome == PriceFetchAttempt.OUTCOME_PUBLISHED:
+            attempt.latency_to_data_seconds = (finished_at - expected_at).total_seconds()
+        attempt.save()
+
+        expected_local = ", ".join(
+            f"{zone} {PriceFetchPlanner.expected_local(zone, day, publication_time):%H:%M %Z}"
+            for zone in zones
+        )
+        log_device_event(
+            None,
+            f"Price fetch for {day} attempt {attempt.attempt}: {attempt.outcome}"
+            + (f", missing {attempt.missing_zones}" if missing else "")
+            + (f", {attempt.latency_to_data_seconds:.0f}s after expected publication"
+               if attempt.latency_to_data_seconds is not None else "")
+            + f" (expected {expected_local})",
+            "ERROR" if attempt.outcome == PriceFetchAttempt.OUTCOME_ERROR else "INFO",
+        )
+        return attempt
@@ -0,0 +1,201 @@
+import csv
+import threading
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.models import AppSetting
+
+# numpy, pandas and the ENTSO-E client are imported inside the providers, so
+# importing this module from the web views stays cheap (see WorkerImportTest).
+
+
+class PriceSource:
+    """
+    Provides day-ahead prices for a bidding zone. fetch() returns a PriceSeries at
+    the source's native resolution in EUR/MWh covering [start, end) (aware
+    datetimes), or None when the source has no prices for the window.
+    """
+
+    name = ""
+
+    def fetch(self, zone: str, start: datetime, end: datetime):
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.name
+
+
+class EntsoePriceSource(PriceSource):
+    """Prices from the ENTSO-E Transparency Platform (with the on-disk response cache)."""
+
+    name = "entsoe"
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    def fetch(self, zone, start, end):
+        from app.price_views import fetch_zone_prices
+
+        return fetch_zone_prices(self.api_key, zone, start, end)
+
+
+class FilePriceSource(PriceSource):
+    """
+    Prices recorded in a CSV or Parquet file with the columns start_time (ISO 8601,
+    naive means UTC), price (EUR/MWh) and optionally bidding_zone. Rows without a
+    zone apply to every zone. The resolution is inferred per zone from the spacing
+    of the timestamps, and the file is read once per source.
+    """
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._series = None  # zone (None for all zones) -> PriceSeries
+        self._lock = threading.Lock()
+
+    def _read_rows(self):
+        if self.path.suffix.lower() == ".parquet":
+            import pandas as pd
+
+            frame = pd.read_parquet(self.path)
+            columns = ["start_time", "price"] + (["bidding_zone"] if "bidding_zone" in frame else [])
+            for record in frame[columns].to_dict("records"):
+                start_time = record["start_time"]
+                if hasattr(start_time, "to_pydatetime"):
+                    start_time = start_time.to_pydatetime()
+                yield start_time, float(record["price"]), record.get("bidding_zone") or None
+            return
+
+        with self.path.open(newline="", encoding="utf-8-sig") as handle:
+            for row in csv.DictReader(handle):
+                yield (
+                    datetime.fromisoformat(row["start_time"].strip().replace("Z", "+00:00")),
+                    float(row["price"]),
+                    (row.get("bidding_zone") or "").strip() or None,
+                )
+
+    def _load(self) -> dict:
+        import numpy as np
+        from app.entsoe_parser import PriceSeries
+
+        with self._lock:
+            if self._series is not None:
+                return self._series
+            rows = {}
+            for start_time, price, zone in self._read_rows():
+                if start_time.tzinfo is not None:
+                    start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+                rows.setdefault(zone, ([], []))
+                rows[zone][0].append(np.datetime64(start_time, "s"))
+                rows[zone][1].append(price)
+
+            series = {}
+            for zone, (timestamps, prices) in rows.items():
+                timestamps = np.asarray(timestamps, dtype="datetime64[s]")
+                prices = np.asarray(prices, dtype=np.float64)
+                order = np.argsort(timestamps, kind="stable")
+                timestamps, prices = timestamps[order], prices[order]
+                steps = np.diff(timestamps).astype("int64")
+                steps = steps[steps > 0]
+                minutes = int(steps.min() // 60) if len(steps) else 60
+                series[zone] = PriceSeries(minutes, timestamps, prices)
+            self._series = series
+            return series
+
+    def fetch(self, zone, start, end):
+        series = self._load()
+        zone_series = series.get(zone, series.get(None))
+        if zone_series is None:
+            return None
+        return zone_series.window(start, end)
+
+
+class SyntheticPriceSource(PriceSource):
+    """
+    Deterministic generated prices with a morning and an evening peak, a cheaper
+    weekend and per-day noise. The same (seed, zone, day) always gives the same
+    prices, so overlapping windows agree.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, seed: int = 0, base: float = 60.0, amplitude: float = 40.0, noise: float = 15.0):
+        self.seed = seed
+        self.base = base
+        self.amplitude = amplitude
+        self.noise = noise
+
+    def fetch(self, zone, start, end):
+        import numpy as np
+        from app.entsoe_parser import PriceSeries
+
+        start64 = np.datetime64(start.astimezone(timezone.utc).replace(tzinfo=None), "m")
+        end64 = np.datetime64(end.astimezone(timezone.utc).replace(tzinfo=None), "m")
+        start64 = start64 - (start64.astype("int64") % 15)  # Align to the 15-minute grid
+        timestamps = np.arange(start64, end64, np.timedelta64(15, "m")).astype("datetime64[s]")
+        if not len(timestamps):
+            return None
+
+        minutes = timestamps.astype("int64") // 60
+        hours = (minutes % 1440) / 60.0
+        days = minutes // 1440
+        shape = (
+            np.exp(-((hours - 7.0) ** 2) / 4.0)
+            + 1.2 * np.exp(-((hours - 17.0) ** 2) / 6.0)
+            - 0.6 * np.exp(-((hours - 3.0) ** 2) / 5.0)
+        )
+        weekend = ((days + 3) % 7) >= 5  # 1970-01-01 was a Thursday
+        zone_key = zlib.crc32(zone.encode())
+        noise = np.empty(len(timestamps))
+        quarter = (minutes % 1440) // 15
+        for day in np.unique(days):
+            mask = days == day
+            # Draw the whole day so a partial window gets the same values
+            rng = np.random.default_rng([self.seed, zone_key, int(day)])
+            noise[mask] = rng.normal(0.0, self.noise, 96)[quarter[mask]]
+        prices = self.base + self.amplitude * shape - np.where(weekend, 15.0, 0.0) + noise
+        return PriceSeries(15, timestamps, np.round(prices, 2))
+
+
+class PriceSources:
+    """Selects the deployment's price source from AppSetting PRICE_SOURCE."""
+
+    DEFAULT = EntsoePriceSource.name
+
+    @staticmethod
+    def _setting(key: str, default: str = "") -> str:
+        setting = AppSetting.objects.filter(key=key).first()
+        return (setting.value or "").strip() if setting else default
+
+    @staticmethod
+    def build(kind: str, path: str = "", seed: int = 0, api_key: str = None) -> PriceSource:
+        """Builds a source by name; raises ValueError for unknown or incomplete settings."""
+        kind = (kind or PriceSources.DEFAULT).strip().lower()
+        if kind == EntsoePriceSource.name:
+            if not api_key:
+                raise ValueError("ENTSO-E API key not set in admin settings.")
+            return EntsoePriceSource(api_key)
+        if kind == FilePriceSource.name:
+            if not path:
+                raise ValueError("PRICE_SOURCE_FILE is required for the file price source.")
+            return FilePriceSource(path)
+        if kind == SyntheticPriceSource.name:
+            return SyntheticPriceSource(seed=seed)
+        raise ValueError(f"Unknown price source: {kind}")
+
+    @staticmethod
+    def configured() -> PriceSource:
+        """
+        The source configured for this deployment: PRICE_SOURCE is entsoe (default),
+        file (reads PRICE_SOURCE_FILE) or synthetic.
+        """
+        from app.price_views import get_entsoe_api_key
+
+        kind = PriceSources._setting("PRICE_SOURCE", PriceSources.DEFAULT)
+        return PriceSources.build(
+            kind,
+            path=PriceSources._setting("PRICE_SOURCE_FILE"),
+            api_key=get_entsoe_api_key() if kind.lower() in ("", EntsoePriceSource.name) else None,
+        )
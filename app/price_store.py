@@ -0,0 +1,175 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+
+from app.models import DeviceAssignment, ElectricityPrice
+from app.bidding_zones import DEFAULT_BIDDING_ZONE
+
+
+class PriceUpsertResult:
+    """Counts of one bulk price upsert."""
+
+    def __init__(self, inserted: int = 0, updated: int = 0, unchanged: int = 0, removed: int = 0):
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+        self.removed = removed  # Stored periods replaced by a period of another resolution
+
+    @property
+    def changed(self) -> bool:
+        """True when any price was inserted, modified or removed."""
+        return bool(self.inserted or self.updated or self.removed)
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "removed": self.removed,
+        }
+
+    def __str__(self):
+        return (
+            f"inserted={self.inserted}, updated={self.updated}, "
+            f"unchanged={self.unchanged}, removed={self.removed}"
+        )
+
+
+class PriceStore:
+    """
+    Persists electricity prices with one read and one bulk upsert per batch,
+    inside a single transaction, instead of one update_or_create per period.
+    Prices keep the resolution they were published in: an hourly price is one
+    row with resolution_minutes=60, not four forward-filled 15-minute rows.
+    """
+
+    PRICE_QUANTUM = Decimal("0.00001")  # ElectricityPrice.price_kwh has 5 decimal places
+
+    @staticmethod
+    def rows_from_series(series, conversion_factor: Decimal = Decimal("0.1")):
+        """
+        Yields (start_time, end_time, price_kwh) rows from a parsed PriceSeries.
+        The default factor converts EUR/MWh into cents/kWh.
+        """
+        step = timedelta(minutes=series.minutes)
+        for start_time, price in series.items():
+            yield start_time, start_time + step, Decimal(repr(price)) * conversion_factor
+
+    @staticmethod
+    def upsert_prices(rows, bidding_zone: str = DEFAULT_BIDDING_ZONE) -> PriceUpsertResult:
+        """
+        Inserts or updates the prices of one bidding zone keyed by start_time.
+        rows is an iterable of (start_time, end_time, price_kwh) with UTC datetimes.
+        Rows whose stored end_time and price already match are left untouched, and
+        stored periods that overlap an incoming period of another resolution are
+        removed. Their assignments move to the incoming periods they overlap, so
+        the assignment history used by the cost comparison survives a backfill.
+        """
+        incoming = {}
+        for start_time, end_time, price_kwh in rows:
+            incoming[start_time] = (
+                end_time,
+                Decimal(price_kwh).quantize(PriceStore.PRICE_QUANTUM),
+            )
+        result = PriceUpsertResult()
+        if not incoming:
+            return result
+
+        starts = sorted(incoming)
+        with transaction.atomic():
+            existing = {
+                start_time: (price_id, end_time, price_kwh)
+                for price_id, start_time, end_time, price_kwh in ElectricityPrice.objects.filter(
+                    bidding_zone=bidding_zone
+                )
+                .overlapping(starts[0], max(end_time for end_time, _ in incoming.values()))
+                .values_list("id", "start_time", "end_time", "price_kwh")
+            }
+
+            superseded = []
+            reshaped = []  # Stored periods whose span changes, whose assignments move
+            for start_time, (price_id, end_time, _) in existing.items():
+                if start_time in incoming:
+                    if incoming[start_time][0] != end_time:
+                        reshaped.append((price_id, start_time, end_time))
+                    continue
+                # Incoming periods do not overlap each other, so only the last one
+                # starting before this period ends can overlap it
+                index = bisect_left(starts, end_time) - 1
+                if index >= 0 and incoming[starts[index]][0] > start_time:
+                    superseded.append((price_id, start_time, end_time))
+
+            to_write = []
+            for start_time, (end_time, price_kwh) in incoming.items():
+                stored = existing.get(start_time)
+                if stored is None:
+                    result.inserted += 1
+                elif stored[1] != end_time or stored[2] != price_kwh:
+                    result.updated += 1
+                else:
+                    result.unchanged += 1
+                    continue
+                to_write.append(
+                    ElectricityPrice(
+                        bidding_zone=bidding_zone,
+                        start_time=start_time,
+                        end_time=end_time,
+                        resolution_minutes=int((end_time - start_time).total_seconds() // 60),
+                        price_kwh=price_kwh,
+                    )
+                )
+
+            if to_write:
+                ElectricityPrice.objects.bulk_create(
+                    to_write,
+                    update_conflicts=True,
+                    unique_fields=["bidding_zone", "start_time"],
+                    update_fields=["end_time", "resolution_minutes", "price_kwh", "updated_at"],
+                )
+            if superseded or reshaped:
+                PriceStore._move_assignments(bidding_zone, incoming, starts, superseded + reshaped)
+            if superseded:
+                result.removed = len(superseded)
+                ElectricityPrice.objects.filter(id__in=[price_id for price_id, _, _ in superseded]).delete()
+        return result
+
+    @staticmethod
+    def _move_assignments(bidding_zone: str, incoming: dict, starts: list, superseded: list) -> None:
+        """
+        Assigns the devices of every replaced or reshaped stored period to the
+        incoming periods that overlap its old span, keeping the assignment
+        source. The incoming rows must already be written.
+        """
+        assignments = list(
+            DeviceAssignment.objects.filter(
+                electricity_price_id__in=[price_id for price_id, _, _ in superseded]
+            ).values_list("user_id", "device_id", "electricity_price_id", "source")
+        )
+        if not assignments:
+            return
+        price_ids = dict(
+            ElectricityPrice.objects.filter(
+                bidding_zone=bidding_zone, start_time__range=(starts[0], starts[-1])
+            ).values_list("start_time", "id")
+        )
+        periods = {price_id: (start_time, end_time) for price_id, start_time, end_time in superseded}
+
+        moved = []
+        for user_id, device_id, price_id, source in assignments:
+            start_time, end_time = periods[price_id]
+            # The incoming period holding start_time, if any, and the ones up to end_time
+            first = max(bisect_right(starts, start_time) - 1, 0)
+            for new_start in starts[first:bisect_left(starts, end_time)]:
+                if incoming[new_start][0] <= start_time:
+                    continue
+                moved.append(
+                    DeviceAssignment(
+                        user_id=user_id,
+                        device_id=device_id,
+                        electricity_price_id=price_ids[new_start],
+                        source=source,
+                    )
+                )
+        DeviceAssignment.objects.bulk_create(moved, ignore_conflicts=True)
@@ -1,28 +1,32 @@
 ﻿from django.http import JsonResponse
-from decimal import Decimal, InvalidOperation
-from datetime import datetime, timedelta, timezone
+from django.db import close_old_connections
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone
 from .models import (
     ElectricityPrice,
-    ShellyDevice,
-    DeviceLog,
-    DeviceAssignment,
     AppSetting,
 )
-import pandas as pd
-from entsoe import EntsoeRawClient
-from entsoe.parsers import parse_prices
 from django.shortcuts import render
 from django.utils.timezone import now
 from datetime import timedelta
 from .logger import log_device_event
-from .device_assignment_manager import DeviceAssignmentManager  # Import the class
+from .price_store import PriceStore
+from .pipeline import prices_changed
+from .bidding_zones import BiddingZones, DEFAULT_BIDDING_ZONE
+from .price_sources import PriceSources
 from app.utils.time_utils import TimeUtils
 from app.utils.security_utils import SecurityUtils
 from app.utils.db_utils import with_db_retries
+from app.utils.entsoe_cache import entsoe_response_cache
 import pytz  # pip install pytz
 import xml.etree.ElementTree as ET
 
+# pandas, numpy (via app.entsoe_parser) and entsoe are imported inside the ingestion
+# functions: web workers import this module for get_cheapest_hours and would otherwise
+# pay their import time and memory on every cold start. See the README for numbers.
+
 LOCAL_TZ = pytz.timezone("Europe/Helsinki")  # change if needed
+MAX_CONCURRENT_ZONE_FETCHES = 4  # Parallel ENTSO-E downloads when several zones are configured
 
 
 def get_entsoe_api_key():
@@ -54,357 +58,320 @@ def _format_entsoe_series_preview(series, limit=3):
 
 
 def _summarize_entsoe_xml(raw_xml):
+    from .entsoe_parser import parse_day_ahead
+
     try:
-        root = ET.fromstring(raw_xml)
-    except ET.ParseError as e:
+        return parse_day_ahead(raw_xml).summary
+    except (ET.ParseError, ValueError) as e:
         return {"parse_error": str(e)}
 
-    def local_name(tag):
-        return tag.split("}")[-1] if "}" in tag else tag
-
-    time_series_count = 0
-    time_series = []
-    reasons = []
-    for elem in root.iter():
-        name = local_name(elem.tag)
-        if name == "TimeSeries":
-            time_series_count += 1
-            ts_info = {}
-            for child in list(elem):
-                child_name = local_name(child.tag)
-                if child_name == "Period":
-                    period = child
-                    start = None
-                    resolution = None
-                    positions = []
-                    for pchild in list(period):
-                        pchild_name = local_name(pchild.tag)
-                        if pchild_name == "timeInterval":
-                            for tchild in list(pchild):
-                                tchild_name = local_name(tchild.tag)
-                                if tchild_name == "start":
-                                    start = tchild.text
-                        elif pchild_name == "resolution":
-                            resolution = pchild.text
-                        elif pchild_name == "Point":
-                            pos = None
-                            for point_child in list(pchild):
-                                point_child_name = local_name(point_child.tag)
-                                if point_child_name == "position":
-                                    try:
-                                        pos = int(point_child.text)
-                                    except (TypeError, ValueError):
-                                        pos = None
-                            if pos is not None:
-                                positions.append(pos)
-                    ts_info = {
-                        "start": start,
-                        "resolution": resolution,
-                        "min_position": min(positions) if positions else None,
-                        "max_position": max(positions) if positions else None,
-                        "points": len(positions),
-                    }
-            if ts_info:
-                time_series.append(ts_info)
-        if name == "Reason":
-            code = None
-            text = None
-            for child in list(elem):
-                child_name = local_name(child.tag)
-                if child_name == "code":
-                    code = child.text
-                elif child_name == "text":
-                    text = child.text
-            reasons.append({"code": code, "text": text})
-
-    return {"time_series_count": time_series_count, "series": time_series, "reasons": reasons}
-
-
-def call_fetch_prices(request):
-    api_key = get_entsoe_api_key()
-    if not api_key:
-        return JsonResponse(
-            {"error": "ENTSO-E API key not set in admin settings."}, status=400
+
+def fetch_day_ahead_xml(api_key, area_code, start, end):
+    """
+    Returns the raw day-ahead XML for a window, downloading it only when the
+    on-disk cache has no valid copy, so each publication window costs one API call.
+    """
+    cached = entsoe_response_cache.get(area_code, start, end)
+    if cached is not None:
+        log_device_event(
+            None,
+            f"ENTSOE response served from cache: area={area_code}, start={start}, end={end}",
+            "DEBUG",
         )
-    area_code = "10YFI-1--------U"  # Finland, modify as needed
+        return cached
 
-    # Use ENTSO-E publication window: 14:00 local time forward 25 hours
-    now_utc = TimeUtils.now_utc()
-    now_local = now_utc.astimezone(LOCAL_TZ)
-    publication_local = now_local.replace(hour=14, minute=0, second=0, microsecond=0)
-    if now_local < publication_local:
-        start_local = publication_local - timedelta(days=1)
-    else:
-        start_local = publication_local
-    end_local = start_local + timedelta(hours=25)
+    from entsoe import EntsoeRawClient
 
-    future_cutoff = now_utc + timedelta(hours=12)
+    raw_client = EntsoeRawClient(api_key=api_key)
+    raw_response = raw_client.query_day_ahead_prices(
+        country_code=area_code, start=start, end=end
+    )
+    try:
+        entsoe_response_cache.put(area_code, start, end, raw_response)
+    except OSError as e:
+        # A read-only or full disk must not break the price fetch
+        log_device_event(
+            None, SecurityUtils.get_safe_error_message(e, "ENTSOE cache write failed"), "WARN"
+        )
+    return raw_response
 
-    future_prices_exist = ElectricityPrice.objects.filter(
-        start_time__gt=future_cutoff
-    ).exists()
-    if future_prices_exist:
-        print(f"Skipping fetch: Prices already exist beyond {future_cutoff}.")
-        return JsonResponse({"message": "Prices already up-to-date."}, status=200)
 
-    # Convert to Pandas Timestamp (ensuring UTC consistency)
-    start = pd.Timestamp(start_local)
-    end = pd.Timestamp(end_local)
+def _log_entsoe_failure(error, area_code, start, end, raw_response):
+    """Logs why a zone fetch failed, diagnosing the document we already have if any."""
+    from .entsoe_parser import parse_day_ahead
 
     try:
+        # Diagnose the document we already have instead of downloading it again
+        if raw_response is None:
+            raw_response = entsoe_response_cache.get(area_code, start, end)
+        if raw_response is None:
+            raise ValueError("No ENTSOE response available for diagnostics")
+        raw_text = SecurityUtils.sanitize_message(str(raw_response))
+        preview = raw_text[:500]
         log_device_event(
             None,
-            f"ENTSOE debug: now_utc={now_utc.isoformat()}, now_local={now_local.isoformat()}, tz={LOCAL_TZ}",
+            f"ENTSOE raw response preview: length={len(raw_text)} preview={preview}",
             "DEBUG",
         )
+        xml_summary = _summarize_entsoe_xml(raw_text)
         log_device_event(
             None,
-            f"ENTSOE debug: api_key_present={'yes' if api_key else 'no'}",
+            f"ENTSOE raw response summary: {xml_summary}",
             "DEBUG",
         )
+        try:
+            parsed = parse_day_ahead(raw_text)
+            parsed_summary = {
+                f"PT{minutes}M": {
+                    "count": len(series),
+                    "start": str(series.timestamps[0]) + "Z" if len(series) else None,
+                    "end": str(series.timestamps[-1]) + "Z" if len(series) else None,
+                }
+                for minutes, series in parsed.series.items()
+            }
+            log_device_event(
+                None,
+                f"ENTSOE parsed price summary: {parsed_summary}",
+                "DEBUG",
+            )
+        except Exception as parse_error:
+            parse_error_safe = SecurityUtils.get_safe_error_message(
+                parse_error, "ENTSOE parse failed"
+            )
+            log_device_event(None, parse_error_safe, "ERROR")
+    except Exception as raw_error:
+        raw_error_safe = SecurityUtils.get_safe_error_message(
+            raw_error, "ENTSOE raw response fetch failed"
+        )
+        log_device_event(None, raw_error_safe, "ERROR")
+    # Sanitize error to hide API key and other sensitive information
+    safe_error = SecurityUtils.get_safe_error_message(
+        error, "ENTSOE price fetch failed"
+    )
+    safe_error = SecurityUtils.sanitize_message(safe_error)
+    error_type = type(error).__name__
+    if safe_error.endswith(":"):
+        safe_error = f"{safe_error} {error_type}"
+    else:
+        safe_error = f"{safe_error} (type={error_type})"
+    log_device_event(
+        None,
+        f"ENTSOE request failed for area={area_code}, start={start}, end={end}",
+        "ERROR",
+    )
+    log_device_event(None, safe_error, "ERROR")
+
+
+def fetch_zone_prices(api_key, zone, start_local, end_local):
+    """
+    Downloads (or reads from the on-disk cache) and parses the day-ahead prices of
+    one bidding zone. Returns the PriceSeries at its native resolution, or None when
+    ENTSO-E has no prices for the window yet; raises when the fetch failed.
+    Safe to run in a worker thread; persistence is left to the caller.
+    """
+    import pandas as pd
+    from entsoe.exceptions import NoMatchingDataError
+    from .entsoe_parser import parse_day_ahead
+
+    area_code = BiddingZones.eic(zone)
+    # Convert to Pandas Timestamp (ensuring UTC consistency)
+    start = pd.Timestamp(start_local)
+    end = pd.Timestamp(end_local)
+    raw_response = None
+
+    try:
         log_device_event(
             None,
-            f"ENTSOE request: area={area_code}, start={start}, end={end}",
+            f"ENTSOE request: zone={zone}, area={area_code}, start={start}, end={end}",
             "INFO",
         )
-        raw_client = EntsoeRawClient(api_key=api_key)
-        raw_response = raw_client.query_day_ahead_prices(
-            country_code=area_code, start=start, end=end
-        )
-
-        parsed = parse_prices(raw_response)
-        preferred_keys = ("15min", "15T", "60min", "60T", "30min", "30T")
-        price_series = None
-        selected_resolution = None
-        for key in preferred_keys:
-            series = parsed.get(key)
-            if series is not None and len(series) > 0:
-                price_series = series
-                selected_resolution = key
-                break
+        raw_response = fetch_day_ahead_xml(api_key, area_code, start, end)
 
+        # One streaming pass yields NumPy arrays per resolution (A03 gaps already filled)
+        document = parse_day_ahead(raw_response)
+        price_series = document.preferred((15, 60, 30))
         if price_series is None:
             raise ValueError("Parsed ENTSOE price series is empty")
 
-        if price_series.index.tz is None:
-            price_series = price_series.tz_localize(pytz.UTC)
-
         start_utc = TimeUtils.to_utc(start_local)
         end_utc = TimeUtils.to_utc(end_local)
-        price_series = price_series.loc[(price_series.index >= start_utc) & (price_series.index < end_utc)]
+        price_series = price_series.window(start_utc, end_utc)
 
         log_device_event(
             None,
-            f"ENTSOE parsed resolution: {selected_resolution}",
+            f"ENTSOE parsed resolution for {zone}: PT{price_series.minutes}M",
             "DEBUG",
         )
 
         log_device_event(
             None,
-            f"ENTSOE raw result preview: {_format_entsoe_series_preview(price_series)}",
+            f"ENTSOE raw result preview for {zone}: {_format_entsoe_series_preview(price_series)}",
             "DEBUG",
         )
-        
-        # Resample to 15-minute intervals using forward fill (each 15-min gets same price as the hour)
-        price_series = price_series.resample('15min').ffill()
+        # Stored at its native resolution; consumers expand it in memory when needed
+        return price_series
 
-        log_device_event(
-            None,
-            f"ENTSOE resampled preview: {_format_entsoe_series_preview(price_series)}",
-            "DEBUG",
-        )
-        
+    except NoMatchingDataError:
+        # The acknowledgement ENTSO-E sends before the auction results are published
+        log_device_event(None, f"ENTSOE has no prices yet for {zone} ({start} - {end})", "INFO")
+        return None
     except Exception as e:
+        _log_entsoe_failure(e, area_code, start, end, raw_response)
+        raise
+
+
+def _fetch_from_source(source, zone, start_local, end_local):
+    """
+    Fetches one zone from a price source. Returns (series, failed): series is None
+    both when the source has no prices yet and when it failed, which is logged.
+    """
+    try:
+        return source.fetch(zone, start_local, end_local), False
+    except Exception as e:
+        safe_error = SecurityUtils.get_safe_error_message(e, f"Price source {source} failed")
+        log_device_event(None, f"{safe_error} (zone={zone})", "ERROR")
+        return None, True
+
+
+def _fetch_zone_in_thread(source, zone, start_local, end_local):
+    try:
+        return _fetch_from_source(source, zone, start_local, end_local)
+    finally:
+        close_old_connections()
+
+
+def call_fetch_prices(request, source=None):
+    """
+    Fetches the current publication window for every configured bidding zone from
+    the price source (AppSetting PRICE_SOURCE unless one is passed in), stores it
+    and updates the cheapest hours when anything changed.
+    """
+    if source is None:
         try:
-            raw_client = EntsoeRawClient(api_key=api_key)
-            raw_response = raw_client.query_day_ahead_prices(
-                country_code=area_code, start=start, end=end
-            )
-            raw_text = SecurityUtils.sanitize_message(str(raw_response))
-            preview = raw_text[:500]
-            log_device_event(
-                None,
-                f"ENTSOE raw response preview: length={len(raw_text)} preview={preview}",
-                "DEBUG",
-            )
-            xml_summary = _summarize_entsoe_xml(raw_text)
-            log_device_event(
-                None,
-                f"ENTSOE raw response summary: {xml_summary}",
-                "DEBUG",
-            )
-            try:
-                parsed = parse_prices(raw_text)
-                parsed_summary = {
-                    key: {
-                        "count": len(series),
-                        "start": series.index.min().isoformat() if len(series) else None,
-                        "end": series.index.max().isoformat() if len(series) else None,
-                    }
-                    for key, series in parsed.items()
-                }
-                log_device_event(
-                    None,
-                    f"ENTSOE parsed price summary: {parsed_summary}",
-                    "DEBUG",
-                )
-            except Exception as parse_error:
-                parse_error_safe = SecurityUtils.get_safe_error_message(
-                    parse_error, "ENTSOE parse_prices failed"
-                )
-                log_device_event(None, parse_error_safe, "ERROR")
-        except Exception as raw_error:
-            raw_error_safe = SecurityUtils.get_safe_error_message(
-                raw_error, "ENTSOE raw response fetch failed"
+            source = PriceSources.configured()
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    zones = BiddingZones.configured()
+
+    # Use ENTSO-E publication window: 14:00 local time forward 25 hours
+    now_utc = TimeUtils.now_utc()
+    now_local = now_utc.astimezone(LOCAL_TZ)
+    publication_local = now_local.replace(hour=14, minute=0, second=0, microsecond=0)
+    if now_local < publication_local:
+        start_local = publication_local - timedelta(days=1)
+    else:
+        start_local = publication_local
+    end_local = start_local + timedelta(hours=25)
+
+    future_cutoff = now_utc + timedelta(hours=12)
+
+    # Zones that already have prices beyond the cutoff are skipped (one query)
+    up_to_date = set(
+        ElectricityPrice.objects.filter(bidding_zone__in=zones, start_time__gt=future_cutoff)
+        .values_list("bidding_zone", flat=True)
+        .distinct()
+    )
+    pending_zones = [zone for zone in zones if zone not in up_to_date]
+    if not pending_zones:
+        print(f"Skipping fetch: Prices already exist beyond {future_cutoff}.")
+        return JsonResponse({"message": "Prices already up-to-date."}, status=200)
+
+    log_device_event(
+        None,
+        f"ENTSOE debug: now_utc={now_utc.isoformat()}, now_local={now_local.isoformat()}, tz={LOCAL_TZ}",
+        "DEBUG",
+    )
+    log_device_event(
+        None,
+        f"Price fetch: source={source}, zones={','.join(pending_zones)}",
+        "DEBUG",
+    )
+
+    # Zones are downloaded and parsed concurrently; each zone has its own cache entry
+    if len(pending_zones) == 1:
+        zone_fetches = {
+            pending_zones[0]: _fetch_from_source(source, pending_zones[0], start_local, end_local)
+        }
+    else:
+        workers = min(MAX_CONCURRENT_ZONE_FETCHES, len(pending_zones))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="entsoe") as pool:
+            futures = {
+                zone: pool.submit(_fetch_zone_in_thread, source, zone, start_local, end_local)
+                for zone in pending_zones
+            }
+            zone_fetches = {zone: future.result() for zone, future in futures.items()}
+
+    fetched = {
+        zone: series
+        for zone, (series, _) in zone_fetches.items()
+        if series is not None and len(series) > 0
+    }
+    if not fetched:
+        if any(failed for _, failed in zone_fetches.values()):
+            return JsonResponse(
+                {"error": f"Failed to fetch electricity prices from {source}"}, status=500
             )
-            log_device_event(None, raw_error_safe, "ERROR")
-        # Sanitize error to hide API key and other sensitive information
-        safe_error = SecurityUtils.get_safe_error_message(
-            e, "ENTSOE price fetch failed"
-        )
-        safe_error = SecurityUtils.sanitize_message(safe_error)
-        error_type = type(e).__name__
-        if safe_error.endswith(":"):
-            safe_error = f"{safe_error} {error_type}"
-        else:
-            safe_error = f"{safe_error} (type={error_type})"
-        log_device_event(
-            None,
-            f"ENTSOE request failed for area={area_code}, start={start}, end={end}",
-            "ERROR",
-        )
-        log_device_event(None, safe_error, "ERROR")
+        # Not an error: the day-ahead auction results are not published yet
         return JsonResponse(
-            {"error": "Failed to fetch electricity prices from ENTSOE"}, status=500
+            {"message": f"No prices published yet for {','.join(pending_zones)}."}, status=404
         )
 
-    # **Ensure price_series is not empty before proceeding**
-    if price_series.empty:
-        return JsonResponse({"error": "Price series is empty"}, status=400)
-
-    # Get the first timestamp from the price series
-    period_start = TimeUtils.to_utc(price_series.index[0])
-
-    # Convert `period_start` to string format for database saving
-    period_start_str = period_start.strftime("%Y%m%d%H%M")
-
-    # Save prices directly from the resampled series
-    conversion_factor = Decimal("0.1")  # Convert from EUR/MWh to cents/kWh
-    new_entries_added = False
-    
-    for timestamp, price in price_series.items():
-        start_time = TimeUtils.to_utc(timestamp)
-        end_time = TimeUtils.to_utc(timestamp + pd.Timedelta(minutes=15))
-        price_c_per_kwh = Decimal(str(price)) * conversion_factor
-        
-        _, created = ElectricityPrice.objects.update_or_create(
-            start_time=start_time,
-            end_time=end_time,
-            defaults={"price_kwh": price_c_per_kwh},
+    # Save prices directly from the parsed arrays with one bulk upsert per zone
+    zone_results = {}
+    for zone, price_series in fetched.items():
+        zone_results[zone] = PriceStore.upsert_prices(
+            PriceStore.rows_from_series(price_series), bidding_zone=zone
         )
-        if created:
-            new_entries_added = True
-            
-    # Update cheapest hours if new prices were added
-    if new_entries_added:
-        log_device_event(None, "New electricity prices fetched. Updating cheapest hours.", "INFO")
-        set_cheapest_hours()
-        
-    # Import here to avoid circular import
-    from app.tasks import DeviceController
-    
-    # Always run device control at the hour mark, regardless of new prices
-    log_device_event(None, "Running scheduled device control check.", "INFO")
-    DeviceController.control_shelly_devices()
+        log_device_event(None, f"Electricity prices stored for {zone}: {zone_results[zone]}", "INFO")
+
+    # Replanning is its own pipeline stage, started only if prices were added or
+    # changed; the quarter-hourly control pass never waits for this fetch
+    changed_zones = [zone for zone, result in zone_results.items() if result.changed]
+    if changed_zones:
+        prices_changed.send(sender=PriceStore, zones=changed_zones)
 
     # Convert price timestamps to UTC formatted strings
-    prices_dict = {
-        TimeUtils.to_utc(ts).strftime("%Y-%m-%dT%H:%M:%SZ"): price
-        for ts, price in price_series.items()
+    zones_payload = {
+        zone: {
+            "prices": {
+                ts.strftime("%Y-%m-%dT%H:%M:%SZ"): price for ts, price in fetched[zone].items()
+            },
+            "stored": zone_results[zone].as_dict(),
+        }
+        for zone in fetched
     }
+    primary_zone = DEFAULT_BIDDING_ZONE if DEFAULT_BIDDING_ZONE in fetched else next(iter(fetched))
 
     # Return the raw prices as JSON (converted to a dict)
-    return JsonResponse({"prices": prices_dict})
+    return JsonResponse(
+        {
+            "prices": zones_payload[primary_zone]["prices"],
+            "stored": zones_payload[primary_zone]["stored"],
+            "zones": zones_payload,
+        }
+    )
 
 
 
 @with_db_retries(max_attempts=3, delay=1)
-def set_cheapest_hours():
-    """Assigns devices to the cheapest hours for the next 24 hours."""
+def set_cheapest_hours(zones=None):
+    """
+    Assigns devices to the cheapest periods of the upcoming prices, for the
+    given bidding zones (all by default). Devices whose prices and settings are
+    unchanged since their last plan are skipped (see IncrementalPlanner).
+    """
     try:
         # Get current UTC time
         current_time = TimeUtils.now_utc()
         print("Current Time:", current_time)
 
-        print("Fetching electricity prices...")
-        # Fetch electricity prices starting from the current time
-        prices = list(
-            ElectricityPrice.objects.filter(start_time__gte=current_time)
-            .order_by("start_time")
-            .values("start_time", "price_kwh", "id")
-        )
+        # Numpy is loaded here, on the replanning path, not when a web worker starts
+        from app.incremental_planner import IncrementalPlanner
 
-        print("Found", len(prices), "prices.")
-
-        if not prices:
-            log_device_event(
-                None, "No electricity prices available. Skipping assignment.", "WARN"
-            )
-            return
-
-        devices = ShellyDevice.objects.all()
-        print("Found", len(devices), "devices.")
-
-        for device in devices:
-            print(f"Processing device: {device.device_id} ({device.familiar_name})")
-
-            # Get cheapest hours for this device
-            cheapest_hours = get_cheapest_hours(
-                prices,
-                device.day_transfer_price,
-                device.night_transfer_price,
-                device.run_hours_per_day,
-                device.auto_assign_price_threshold,
-            )
-
-            # Create an assignment manager for the device's user
-            assignment_manager = DeviceAssignmentManager(device.user)
-
-            for hour in cheapest_hours:
-                # Normalize both timestamps to ensure minute-level matching
-                price_entry = next(
-                    (
-                        p
-                        for p in prices
-                        if TimeUtils.to_utc(p["start_time"]).strftime("%Y-%m-%d %H:%M")
-                        == TimeUtils.to_utc(hour).strftime("%Y-%m-%d %H:%M")
-                    ),
-                    None,
-                )
-
-                if price_entry:
-                    # Fetch assignments for the next 24 hours
-                    assignments = assignment_manager.get_assignments_next_24h(device)
-
-                    # Ensure assignments is a valid queryset before filtering
-                    if assignments is not None and hasattr(assignments, "filter"):
-                        existing_assignment = assignments.filter(
-                            electricity_price_id=price_entry["id"]
-                        ).exists()
-                    else:
-                        print(
-                            f"Error: `get_assignments_next_24h(device)` returned invalid data for device {device.device_id}"
-                        )
-                        existing_assignment = False
-
-                    if not existing_assignment:
-                        assignment_manager.log_assignment(
-                            device, ElectricityPrice.objects.get(id=price_entry["id"])
-                        )
-
-        print("Assignments successfully updated at", current_time)
+        result = IncrementalPlanner.replan(zones=zones)
+        print("Assignments successfully updated at", current_time, result)
         log_device_event(
-            None, f"Assignments successfully updated at {current_time}", "INFO"
+            None, f"Assignments successfully updated at {current_time}: {result}", "INFO"
         )
 
     except Exception as e:
@@ -424,37 +391,15 @@ def get_cheapest_hours(
     price_threshold: float | None = None,
     local_tz: timezone = LOCAL_TZ,
 ):
-
-    day_tp = Decimal(str(day_transfer_price))
-    night_tp = Decimal(str(night_transfer_price))
-    threshold = Decimal(str(price_threshold)) if price_threshold is not None else None
-
-    enriched: list[tuple[Decimal, datetime]] = []
-    forced_slots: list[datetime] = []
-
-    for entry in prices:
-        ts: datetime = entry["start_time"]
-
-        # 1️⃣  Make the timestamp timezone-aware *in local time*
-        if ts.tzinfo is None:
-            ts = local_tz.localize(ts)
-        local_ts = ts.astimezone(local_tz)  # guarantees local clock time
-
-        # 2️⃣  Day or night in *local* clock (7:00-21:59 is day time)
-        is_daytime = (7 <= local_ts.hour < 22) or (local_ts.hour == 22 and local_ts.minute == 0)
-        transfer = day_tp if is_daytime else night_tp
-
-        # 3️⃣  Total price using Decimal to avoid rounding surprises
-        total = Decimal(str(entry["price_kwh"])) + transfer
-
-        enriched.append((total, ts))  # keep original tz for caller
-        if threshold is not None and total <= threshold:
-            forced_slots.append(ts)
-
-    # 4️⃣  Pick the N cheapest 15-minute periods (hours_needed * 4)
-    enriched.sort(key=lambda x: x[0])
-    periods_needed = hours_needed * 4  # Convert hours to 15-minute periods
-    cheapest_slots = [slot for _, slot in enriched[:periods_needed]]
-    cheapest_set = set(cheapest_slots)
-    forced_extras = [slot for slot in forced_slots if slot not in cheapest_set]
-    return cheapest_slots + forced_extras
+    """
+    Start times of the periods one device runs in: the cheapest periods (price
+    plus day/night transfer) covering hours_needed, plus every period at or
+    below price_threshold. set_cheapest_hours plans the whole fleet at once.
+    """
+    from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon
+
+    horizon = PriceHorizon.from_rows(prices, local_tz)
+    selected = CheapestSlotPlanner.select(
+        horizon, [day_transfer_price], [night_transfer_price], [hours_needed], [price_threshold]
+    )[0]
+    return [horizon.start_times[index] for index in selected.nonzero()[0].tolist()]
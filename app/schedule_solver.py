@@ -0,0 +1,172 @@
+import numpy as np
+
+from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon
+
+# Cost of infeasible plans; small enough that adding a few never overflows int64
+INF = np.iinfo(np.int64).max // 4
+
+
+class ScheduleSolver:
+    """
+    Plans devices that run in contiguous blocks instead of the individually
+    cheapest periods, to limit relay switching and Shelly API calls.
+
+    A device's run hours are split into as many runs as its run limit and
+    minimum run allow (earlier runs one step longer when the time does not
+    divide evenly). Like the run hours, the run limit applies to the whole
+    horizon. The first run starts at most max_off minutes into the horizon and
+    consecutive runs are at most max_off minutes apart. A dynamic program
+    places the runs: layer b holds, for every (device, end step), the cheapest
+    cost of runs 0..b with run b ending there, linked to layer b-1 by a range
+    minimum over the allowed gap. Each layer is a few passes over
+    (devices x steps) arrays, so a fleet is solved together.
+    """
+
+    # Devices solved per pass, to bound the memory of the range-minimum tables
+    CHUNK_DEVICES = 1024
+
+    @staticmethod
+    def _runs(steps, step_minutes, hours_needed, min_run_minutes, max_off_minutes, max_runs):
+        """Per device: number of runs, steps per run, runs one step longer and the largest gap."""
+        needed = np.asarray(
+            [-(-int(hours or 0) * 60 // step_minutes) for hours in hours_needed], dtype=np.int64
+        )
+        min_run = np.asarray(
+            [max(-(-int(minutes or 0) // step_minutes), 1) for minutes in min_run_minutes], dtype=np.int64
+        )
+        limit = np.asarray([max(int(runs), 1) for runs in max_runs], dtype=np.int64)
+        gaps = np.asarray(
+            [steps if minutes is None else int(minutes) // step_minutes for minutes in max_off_minutes],
+            dtype=np.int64,
+        )
+
+        # Once on, a device runs at least min_run, even past its run hours
+        total = np.where(needed > 0, np.minimum(np.maximum(needed, min_run), steps), 0)
+        min_run = np.minimum(min_run, np.maximum(total, 1))
+        runs = np.where(total > 0, np.maximum(np.minimum(limit, total // min_run), 1), 0)
+        divisor = np.maximum(runs, 1)
+        return runs, total // divisor, total % divisor, gaps
+
+    @staticmethod
+    def _gap_min(values: np.ndarray, gaps: np.ndarray):
+        """
+        Minimum of values[row, max(0, i - gaps[row]) .. i] and its index for
+        every (row, i): a running minimum for rows without a gap limit, and a
+        sparse table of power-of-two window minimums for the others.
+        """
+        rows, size = values.shape
+        index = np.arange(size)
+        minimum = np.minimum.accumulate(values, axis=1)
+        # The last index holding the running minimum is where it was reached
+        argmin = np.maximum.accumulate(np.where(values == minimum, index, 0), axis=1)
+
+        limited = np.nonzero(gaps < size - 1)[0]
+        if not len(limited):
+            return minimum, argmin
+        values, gaps = values[limited], gaps[limited]
+        low = np.maximum(index[None, :] - gaps[:, None], 0)
+        level = np.log2(index[None, :] - low + 1).astype(np.int64)  # Exact for these sizes
+
+        levels = int(level.max()) + 1
+        table = np.full((levels,) + values.shape, INF, dtype=np.int64)
+        arg = np.zeros((levels,) + values.shape, dtype=np.int64)
+        table[0], arg[0] = values, index
+        for k in range(1, levels):
+            span = 1 << (k - 1)
+            left, right = table[k - 1, :, :-span], table[k - 1, :, span:]
+            take_right = right < left
+            table[k, :, :-span] = np.where(take_right, right, left)
+            arg[k, :, :-span] = np.where(take_right, arg[k - 1, :, span:], arg[k - 1, :, :-span])
+
+        row = np.arange(len(limited))[:, None]
+        high = index[None, :] - (1 << level) + 1
+        left_min, right_min = table[level, row, low], table[level, row, high]
+        take_right = right_min < left_min  # Ties keep the earlier end
+        minimum[limited] = np.where(take_right, right_min, left_min)
+        argmin[limited] = np.where(take_right, arg[level, row, high], arg[level, row, low])
+        return minimum, argmin
+
+    @staticmethod
+    def _solve(costs: np.ndarray, runs, base, longer, gaps) -> np.ndarray:
+        """Boolean (devices x steps) matrix of the cheapest runs for each device."""
+        devices, steps = costs.shape
+        prefix = np.zeros((devices, steps + 1), dtype=np.int64)
+        np.cumsum(costs, axis=1, out=prefix[:, 1:])
+        ends = np.arange(steps + 1)
+
+        final_end = np.zeros(devices, dtype=np.int64)
+        layers = []  # (rows, run length, best previous end per end) of every run
+        rows = np.nonzero(runs > 0)[0]
+        best = None
+        for run in range(int(runs.max(initial=0))):
+            if best is not None:
+                done = runs[rows] == run
+                final_end[rows[done]] = best[done].argmin(axis=1)
+                rows, best = rows[~done], best[~done]
+
+            length = base[rows] + (run < longer[rows])
+            starts = ends[None, :] - length[:, None]
+            fits = starts >= 0
+            if best is None:
+                # The device is off from the start of the horizon until its first run
+                fits &= starts <= gaps[rows][:, None]
+            starts = np.maximum(starts, 0)
+            row_prefix = prefix[rows]
+            cost = row_prefix - np.take_along_axis(row_prefix, starts, axis=1)
+
+            choice = None
+            if best is not None:
+                previous, previous_end = ScheduleSolver._gap_min(best, gaps[rows])
+                cost += np.take_along_axis(previous, starts, axis=1)
+                choice = np.take_along_axis(previous_end, starts, axis=1)
+            best = np.minimum(np.where(fits, cost, INF), INF)
+            layers.append((rows, length, choice))
+        if best is not None:
+            final_end[rows] = best.argmin(axis=1)
+
+        # Walk back from the last run of every device
+        selected = np.zeros((devices, steps), dtype=bool)
+        step_index = np.arange(steps)
+        end = final_end
+        for rows, length, choice in reversed(layers):
+            run_end = end[rows]
+            selected[rows] |= (step_index[None, :] >= (run_end - length)[:, None]) & (
+                step_index[None, :] < run_end[:, None]
+            )
+            if choice is not None:
+                end[rows] = choice[np.arange(len(rows)), run_end]
+        return selected
+
+    @staticmethod
+    def select(horizon: PriceHorizon, day_transfer_prices, night_transfer_prices, hours_needed,
+               price_thresholds, min_run_minutes, max_off_minutes, max_runs) -> np.ndarray:
+        """
+        Boolean (devices x periods) matrix of the periods each device runs in,
+        planned as runs of at least min_run_minutes and at most max_runs runs
+        over the whole horizon, with at most max_off_minutes before the first run
+        and between runs (None: no limit). Periods at or below a device's
+        auto-assign threshold are added as in the cheapest mode.
+        """
+        costs = CheapestSlotPlanner.cost_matrix(horizon, day_transfer_prices, night_transfer_prices)
+        if not len(horizon):
+            return np.zeros(costs.shape, dtype=bool)
+
+        # Plan on a grid of the shortest resolution, an hourly period being 4 steps
+        step_minutes = int(np.gcd.reduce(horizon.minutes))
+        repeats = horizon.minutes // step_minutes
+        step_costs = np.repeat(costs, repeats, axis=1)
+        runs, base, longer, gaps = ScheduleSolver._runs(
+            step_costs.shape[1], step_minutes, hours_needed, min_run_minutes, max_off_minutes, max_runs
+        )
+
+        selected_steps = np.zeros(step_costs.shape, dtype=bool)
+        for first in range(0, len(costs), ScheduleSolver.CHUNK_DEVICES):
+            chunk = slice(first, first + ScheduleSolver.CHUNK_DEVICES)
+            selected_steps[chunk] = ScheduleSolver._solve(
+                step_costs[chunk], runs[chunk], base[chunk], longer[chunk], gaps[chunk]
+            )
+
+        # A period runs when any of its steps does
+        offsets = np.concatenate(([0], np.cumsum(repeats)[:-1]))
+        selected = np.logical_or.reduceat(selected_steps, offsets, axis=1)
+        return selected | CheapestSlotPlanner.below_threshold(costs, price_thresholds)
@@ -1,6 +1,8 @@
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from django.db import connection
-from app.tasks import DeviceController
+from app.pipeline import PricePipeline
+from app.price_fetch_planner import PriceFetchPlanner
 from app.thermostat_manager import ThermostatAssignmentManager
 from app.thermostat_manager import ThermostatAssignmentManager
 from app.scheduler_config import get_scheduler
@@ -8,7 +10,36 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_scheduler = None  # Set by start_scheduler, used to reschedule the price fetch
+
+
+def schedule_price_fetch(run_at):
+    """(Re)schedules the single pending price fetch attempt."""
+    if _scheduler is None:
+        logger.warning("Scheduler not running; next price fetch at %s not scheduled.", run_at)
+        return
+    _scheduler.add_job(
+        PricePipeline.run_fetch,
+        trigger=DateTrigger(run_date=run_at),
+        kwargs={"scheduled_for": run_at},
+        id="fetch_prices",
+        max_instances=1,
+        misfire_grace_time=None,  # A late attempt still runs; a dropped one would stop fetching
+        replace_existing=True,
+    )
+    logger.info("Next price fetch scheduled at %s.", run_at)
+
+
+def ensure_price_fetch_scheduled():
+    """Safety net: re-adds the price fetch job if it was lost."""
+    if _scheduler is not None and _scheduler.get_job("fetch_prices") is None:
+        logger.warning("Price fetch job missing; rescheduling it.")
+        PriceFetchPlanner.schedule_next()
+
+
 def start_scheduler():
+    global _scheduler
+
     # Check if the APScheduler tables exist before starting the scheduler
     with connection.cursor() as cursor:
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='django_apscheduler_djangojob';")
@@ -19,21 +50,31 @@ def start_scheduler():
     # Get the optimized scheduler configuration
     scheduler = get_scheduler()
 
-    # Schedule the fetch electricity prices task (Every hour at HH:00 and HH:03)
-    # HH:00 for regular updates, HH:03 as a backup in case the first attempt fails
+    # Price fetches follow the day-ahead publication: one attempt at the expected
+    # publication time, retries with backoff until the data is there, then the next day.
+    # Fetch, replanning (started by prices_changed) and control are independent stages.
     scheduler.add_job(
-        DeviceController.fetch_electricity_prices,
-        trigger=CronTrigger(hour="*", minute="0,5"),
+        PricePipeline.run_fetch,
+        trigger=DateTrigger(run_date=PriceFetchPlanner.next_run_at()),
         id="fetch_prices",
         max_instances=1,
+        misfire_grace_time=None,
+        replace_existing=True,
+    )
+
+    # Hourly check that the self-rescheduling price fetch is still queued
+    scheduler.add_job(
+        ensure_price_fetch_scheduled,
+        trigger=CronTrigger(minute="7"),
+        id="ensure_price_fetch",
+        max_instances=1,
         replace_existing=True,
     )
 
-    # Schedule device control for 15-minute periods with slight offset to avoid conflicts
-    # Adding 1-minute delay after the period starts to ensure price data is available
+    # Schedule device control for every 15-minute period, from the stored assignments
     scheduler.add_job(
-        DeviceController.control_shelly_devices,
-        trigger=CronTrigger(minute="15,30,45"),  # Skip minute 0 as price fetch handles it
+        PricePipeline.run_control,
+        trigger=CronTrigger(minute="0,15,30,45"),
         id="control_shelly",
         max_instances=1,
         replace_existing=True,
@@ -57,5 +98,6 @@ def start_scheduler():
         replace_existing=True,
     )
 
+    _scheduler = scheduler
     logger.info("APScheduler started successfully.")
     scheduler.start()
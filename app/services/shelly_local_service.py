@@ -0,0 +1,79 @@
+import threading
+
+from requests.auth import HTTPDigestAuth
+
+from ..utils.http_session_pool import HttpSessionPool
+
+
+# LAN devices answer in milliseconds; fail fast so the cloud fallback kicks in quickly
+local_session_pool = HttpSessionPool(pool_maxsize=2, connect_retries=0)
+
+
+class ShellyLocalTransport:
+    """
+    Direct Gen2 RPC transport for a Shelly device on the LAN.
+    Responses are reshaped like Shelly Cloud /device/status payloads so callers can
+    treat both transports the same. Errors are raised as requests.RequestException
+    so the caller can fall back to the cloud.
+    """
+
+    MAX_CONCURRENT_REQUESTS = 16  # All LAN requests from this process
+    MAX_REQUESTS_PER_HOST = 2  # Gen2 devices handle only a few parallel HTTP requests
+    TIMEOUT = (1.5, 3.0)  # Connect and read timeout in seconds
+
+    _global_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+    _host_slots = {}
+    _host_slots_lock = threading.Lock()
+
+    def __init__(self, host: str, password: str = ""):
+        host = host.strip().rstrip("/")
+        self.base_url = host if host.startswith(("http://", "https://")) else f"http://{host}"
+        self.password = password or ""
+
+    @classmethod
+    def _slots_for(cls, base_url: str) -> threading.BoundedSemaphore:
+        with cls._host_slots_lock:
+            slots = cls._host_slots.get(base_url)
+            if slots is None:
+                slots = threading.BoundedSemaphore(cls.MAX_REQUESTS_PER_HOST)
+                cls._host_slots[base_url] = slots
+            return slots
+
+    def _rpc(self, method: str, params: dict) -> dict:
+        """Calls one RPC method over HTTP GET and returns its JSON result."""
+        auth = HTTPDigestAuth("admin", self.password) if self.password else None
+        session = local_session_pool.get_session(self.base_url)
+        with self._global_slots, self._slots_for(self.base_url):
+            response = session.get(
+                f"{self.base_url}/rpc/{method}",
+                params=params,
+                auth=auth,
+                timeout=self.TIMEOUT,
+            )
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _as_status(component: str, result: dict) -> dict:
+        return {
+            "isok": True,
+            "transport": "local",
+            "data": {"online": True, "device_status": {component: result}},
+        }
+
+    def get_switch_status(self, channel: int = 0) -> dict:
+        """Switch.GetStatus for one relay channel."""
+        result = self._rpc("Switch.GetStatus", {"id": channel})
+        return self._as_status(f"switch:{channel}", result)
+
+    def set_switch(self, channel: int, state: str) -> dict:
+        """Switch.Set for one relay channel, state is 'on' or 'off'."""
+        result = self._rpc(
+            "Switch.Set", {"id": channel, "on": "true" if state == "on" else "false"}
+        )
+        return {"isok": True, "transport": "local", "data": result}
+
+    def get_temperature_status(self, sensor_id: int = 0) -> dict:
+        """Temperature.GetStatus for one temperature sensor."""
+        result = self._rpc("Temperature.GetStatus", {"id": sensor_id})
+        return self._as_status(f"temperature:{sensor_id}", result)
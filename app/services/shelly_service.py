@@ -1,3 +1,5 @@
+import asyncio
+import time
 import requests
 from ..models import (
     ShellyDevice,
@@ -6,15 +8,115 @@ from ..models import (
 )  # Import the ShellyDevice model and AppSetting
 from ..utils.security_utils import SecurityUtils
 from ..utils.rate_limiter import shelly_rate_limiter
-import time
+from ..utils.http_session_pool import shelly_session_pool
+from ..utils.circuit_breaker import shelly_circuit_breaker
+from .shelly_local_service import ShellyLocalTransport
+from ..device_state_manager import DeviceStateManager
 from decimal import Decimal
 
 
+CIRCUIT_OPEN_ERROR = "Shelly Cloud account is unhealthy (circuit open), request skipped."
+
+
+class RateLimitExceeded(requests.RequestException):
+    """429 responses persisted through every retry; not a health failure of the account."""
+
+
+def circuit_open_error(base_cloud_url, auth_key):
+    """Returns the fail-fast error while the circuit is open, so callers skip rate limiter waits."""
+    if auth_key and shelly_circuit_breaker.is_open(base_cloud_url, auth_key):
+        return {"error": CIRCUIT_OPEN_ERROR}
+    return None
+
+
+def shelly_cloud_request(
+    method,
+    base_cloud_url,
+    auth_key,
+    path,
+    params=None,
+    data=None,
+    error_context="Shelly API request failed",
+    slot_reserved=False,
+):
+    """
+    Sends one Shelly Cloud request with rate limiting and retries.
+    Returns the parsed JSON response, or {"error": ...} with a sanitized message.
+    slot_reserved=True means the caller already awaited a rate limiter slot.
+    """
+    # Fail fast while the circuit for this server+token combination is open
+    if not shelly_circuit_breaker.allow_request(base_cloud_url, auth_key):
+        return {"error": CIRCUIT_OPEN_ERROR}
+
+    url = f"{base_cloud_url}{path}"
+    params = dict(params or {}, auth_key=auth_key)  #  API Key from DB
+    session = shelly_session_pool.get_session(base_cloud_url)
+
+    max_retries = 3
+    retry_count = 0
+
+    while retry_count < max_retries:
+        started = time.monotonic()
+        try:
+            # Wait if needed to comply with rate limits (per server+token combination)
+            if not slot_reserved:
+                shelly_rate_limiter.wait_if_needed(base_cloud_url, auth_key)
+            slot_reserved = False
+
+            started = time.monotonic()
+            response = session.request(
+                method, url, params=params, data=data, timeout=15
+            )
+
+            if response.status_code == 429:  # Too Many Requests
+                shelly_rate_limiter.record_failure(
+                    base_cloud_url,
+                    auth_key,
+                    retry_after=response.headers.get("Retry-After"),
+                )
+                retry_count += 1
+                if retry_count < max_retries:
+                    continue
+                raise RateLimitExceeded("Rate limit exceeded after retries")
+
+            response.raise_for_status()
+            payload = response.json()
+
+            # Record successful request
+            shelly_rate_limiter.record_success(base_cloud_url, auth_key)
+            shelly_circuit_breaker.record_success(
+                base_cloud_url, auth_key, time.monotonic() - started
+            )
+            return payload
+
+        except requests.RequestException as e:
+            if not isinstance(e, RateLimitExceeded):
+                shelly_circuit_breaker.record_failure(
+                    base_cloud_url, auth_key, time.monotonic() - started
+                )
+            # Check if we should retry (not once the circuit has opened)
+            if retry_count < max_retries - 1 and not shelly_circuit_breaker.is_open(
+                base_cloud_url, auth_key
+            ):
+                shelly_rate_limiter.record_failure(base_cloud_url, auth_key)
+                retry_count += 1
+                continue
+
+            # Sanitize error message to hide sensitive information
+            safe_error = SecurityUtils.get_safe_error_message(e, error_context)
+            return {"error": safe_error}
+
+
 class ShellyService:
-    def __init__(self, device_id):
-        """Initialize ShellyService with the correct auth_key and device_name based on device_id."""
+    def __init__(self, device_id, shelly_device=None):
+        """
+        Initialize ShellyService with the correct auth_key and device_name based on device_id.
+        Pass an already loaded shelly_device to skip the database lookup.
+        """
         # Fetch Shelly device data dynamically
-        shelly_device = ShellyDevice.objects.filter(device_id=device_id).first()
+        if shelly_device is None:
+            shelly_device = ShellyDevice.objects.filter(device_id=device_id).first()
+        self.device = shelly_device
 
         if shelly_device:
             self.auth_key = shelly_device.shelly_api_key  #  Fetch API key from DB
@@ -23,73 +125,150 @@ class ShellyService:
                 shelly_device.shelly_server
             )  # Fetch Configured API Server
             self.relay_channel = shelly_device.relay_channel or 0
+            self.local_transport = (
+                ShellyLocalTransport(shelly_device.local_host, shelly_device.local_password)
+                if shelly_device.local_host
+                else None
+            )
         else:
             self.auth_key = None
             self.device_name = "Unknown Device"
             self.base_cloud_url = "Unknown"
             self.relay_channel = 0
+            self.local_transport = None
+        self.local_error = None  # Last LAN error that caused a cloud fallback
 
-    def get_device_status(self):
+    @classmethod
+    def for_device(cls, shelly_device):
+        """Builds the service from a loaded ShellyDevice without querying the database."""
+        return cls(shelly_device.device_id, shelly_device=shelly_device)
+
+    def _try_local(self, call):
+        """Runs a LAN transport call, returning None when the device is unreachable."""
+        if not self.local_transport:
+            return None
+        try:
+            return call(self.local_transport)
+        except (requests.RequestException, ValueError) as e:
+            self.local_error = SecurityUtils.get_safe_error_message(e, "Local RPC failed")
+            return None
+
+    def get_device_status(self, slot_reserved=False):
+        """
+        Fetches the status of a Shelly device, over the LAN when configured and
+        otherwise (or when the device is unreachable locally) through Shelly Cloud.
+        slot_reserved=True means the caller already awaited a rate limiter slot.
+        """
+        local_status = self._get_local_status()
+        if local_status is not None:
+            return local_status
+        return self._get_cloud_status(slot_reserved=slot_reserved)
+
+    def _get_local_status(self):
+        """Reads the relay state over the LAN, returning None when not configured or unreachable."""
+        local_status = self._try_local(lambda t: t.get_switch_status(self.relay_channel))
+        if local_status is not None:
+            local_status["shelly_device_name"] = self.device_name
+            DeviceStateManager.record_status(self.device, local_status, self.relay_channel)
+        return local_status
+
+    def _get_cloud_status(self, slot_reserved=False):
         """Fetches the status of a Shelly device using its auth_key and device_name."""
         if not self.auth_key:
             return {"error": "Auth key is required for cloud requests."}
         if not self.device_name:
             return {"error": "Device name is missing for status request."}
 
-        url = f"{self.base_cloud_url}/device/status"
-        params = {
-            "id": self.device_name,  #  Use `device_name` for status request
-            "auth_key": self.auth_key,  #  API Key from DB
-        }
-
-        max_retries = 3
-        retry_count = 0
-        
-        while retry_count < max_retries:
-            try:
-                # Wait if needed to comply with rate limits (per server+token combination)
-                shelly_rate_limiter.wait_if_needed(self.base_cloud_url, self.auth_key)
-                
-                response = requests.get(url, params=params, timeout=15)  # Further increased timeout
-                
-                if response.status_code == 429:  # Too Many Requests
-                    shelly_rate_limiter.record_failure(self.base_cloud_url, self.auth_key)
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        continue
-                    else:
-                        raise requests.RequestException("Rate limit exceeded after retries")
-                
-                response.raise_for_status()
-                status_data = response.json()
-                
-                # Record successful request
-                shelly_rate_limiter.record_success(self.base_cloud_url, self.auth_key)
-
-                # Extract the correct Shelly Cloud ID from the status response
-                self.shelly_cloud_id = status_data.get("data", {}).get(
-                    "id"
-                )  #  Fetch correct ID
-
-                # Add additional details for consistency
-                status_data["shelly_device_name"] = self.device_name
-                return status_data
-                
-            except requests.RequestException as e:
-                # Check if we should retry
-                if retry_count < max_retries - 1:
-                    shelly_rate_limiter.record_failure(self.base_cloud_url, self.auth_key)
-                    retry_count += 1
-                    continue
-                    
-                # Sanitize error message to hide sensitive information
-                safe_error = SecurityUtils.get_safe_error_message(
-                    e, "Shelly API request failed"
-                )
-                return {"error": safe_error}
+        status_data = shelly_cloud_request(
+            "GET",
+            self.base_cloud_url,
+            self.auth_key,
+            "/device/status",
+            params={"id": self.device_name},  #  Use `device_name` for status request
+            error_context="Shelly API request failed",
+            slot_reserved=slot_reserved,
+        )
+        if "error" in status_data:
+            return status_data
+
+        # Extract the correct Shelly Cloud ID from the status response
+        self.shelly_cloud_id = status_data.get("data", {}).get("id")  #  Fetch correct ID
+
+        # Add additional details for consistency
+        status_data["shelly_device_name"] = self.device_name
+        DeviceStateManager.record_status(self.device, status_data, self.relay_channel)
+        return status_data
+
+    async def async_get_device_status(self):
+        """Awaitable variant of get_device_status for the asyncio control engine."""
+        if self.local_transport:
+            local_status = await asyncio.to_thread(self._get_local_status)
+            if local_status is not None:
+                return local_status
+        open_error = circuit_open_error(self.base_cloud_url, self.auth_key)
+        if open_error:
+            return open_error
+        if self.auth_key:
+            await shelly_rate_limiter.async_wait_if_needed(self.base_cloud_url, self.auth_key)
+        return await asyncio.to_thread(self._get_cloud_status, slot_reserved=True)
+
+    @staticmethod
+    def fetch_account_status(base_cloud_url, auth_key, slot_reserved=False):
+        """
+        Fetches the status of every device on one Shelly Cloud account in a single request.
+        Returns {"devices": {shelly_device_name: status}} where each status has the same
+        shape as a /device/status response, or {"error": ...}.
+        """
+        if not auth_key:
+            return {"error": "Auth key is required for cloud requests."}
 
-    def set_device_output(self, state, channel=None):
-        """Sets the output state of a Shelly device to 'on' or 'off'."""
+        payload = shelly_cloud_request(
+            "POST",
+            base_cloud_url,
+            auth_key,
+            "/device/all_status",
+            error_context="Shelly bulk status request failed",
+            slot_reserved=slot_reserved,
+        )
+        if "error" in payload:
+            return payload
+        if not payload.get("isok", True):
+            return {"error": f"Shelly bulk status request rejected: {payload.get('errors')}"}
+
+        devices = {}
+        devices_status = payload.get("data", {}).get("devices_status", {}) or {}
+        for device_name, device_status in devices_status.items():
+            dev_info = device_status.get("_dev_info", {}) if isinstance(device_status, dict) else {}
+            devices[device_name] = {
+                "isok": True,
+                "data": {
+                    "online": dev_info.get("online", True),
+                    "device_status": device_status,
+                },
+                "shelly_device_name": device_name,
+            }
+        return {"devices": devices}
+
+    @staticmethod
+    async def async_fetch_account_status(base_cloud_url, auth_key):
+        """Awaitable variant of fetch_account_status for the asyncio control engine."""
+        open_error = circuit_open_error(base_cloud_url, auth_key)
+        if open_error:
+            return open_error
+        if auth_key:
+            await shelly_rate_limiter.async_wait_if_needed(base_cloud_url, auth_key)
+        return await asyncio.to_thread(
+            ShellyService.fetch_account_status,
+            base_cloud_url,
+            auth_key,
+            slot_reserved=True,
+        )
+
+    def set_device_output(self, state, channel=None, slot_reserved=False):
+        """
+        Sets the output state of a Shelly device to 'on' or 'off'.
+        slot_reserved=True means the caller already awaited a rate limiter slot.
+        """
 
         # Check if REST debugging is enabled (blocks all REST calls when value is "1")
         try:
@@ -107,62 +286,49 @@ class ShellyService:
             # If there's an issue checking the setting, log it but don't block the call
             print(f"Warning: Could not check SHELLY_STOP_REST_DEBUG setting: {e}")
 
+        channel = channel if channel is not None else self.relay_channel
+        result = self._try_local(lambda t: t.set_switch(channel, state))
+        if result is None:
+            result = self._set_cloud_output(state, channel, slot_reserved=slot_reserved)
+        if "error" not in result and result.get("isok", True):
+            DeviceStateManager.record_command(self.device, state, channel)
+        return result
+
+    def _set_cloud_output(self, state, channel, slot_reserved=False):
+        """Sets the output state of a Shelly device through Shelly Cloud."""
         if not self.auth_key:
             return {"error": "Auth key is required for cloud requests."}
         if not self.device_name:
             return {"error": "Device name is missing for status request."}
 
-        url = f"{self.base_cloud_url}/device/relay/control"
-
-        # Parameters for the API request
-        params = {
-            "id": self.device_name,  #  Use `device_name` for status request
-            "auth_key": self.auth_key,  #  API Key from DB
-        }
         data = {
             "turn": state,  # 'on' or 'off'
-            "channel": (
-                channel if channel is not None else self.relay_channel
-            ),  # Use device's default if not passed
+            "channel": channel,  # Device's default if not passed
         }
 
-        max_retries = 3
-        retry_count = 0
-        
-        while retry_count < max_retries:
-            try:
-                # Wait if needed to comply with rate limits (per server+token combination)
-                shelly_rate_limiter.wait_if_needed(self.base_cloud_url, self.auth_key)
-                
-                response = requests.post(url, params=params, data=data, timeout=15)
-                
-                if response.status_code == 429:  # Too Many Requests
-                    shelly_rate_limiter.record_failure(self.base_cloud_url, self.auth_key)
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        continue
-                    else:
-                        raise requests.RequestException("Rate limit exceeded after retries")
-                
-                response.raise_for_status()
-                
-                # Record successful request
-                shelly_rate_limiter.record_success(self.base_cloud_url, self.auth_key)
-                
-                return response.json()  # Parse JSON response
-                
-            except requests.RequestException as e:
-                # Check if we should retry
-                if retry_count < max_retries - 1:
-                    shelly_rate_limiter.record_failure(self.base_cloud_url, self.auth_key)
-                    retry_count += 1
-                    continue
-                    
-                # Sanitize error message to hide sensitive information
-                safe_error = SecurityUtils.get_safe_error_message(
-                    e, "Shelly device control failed"
-                )
-                return {"error": safe_error}
+        return shelly_cloud_request(
+            "POST",
+            self.base_cloud_url,
+            self.auth_key,
+            "/device/relay/control",
+            params={"id": self.device_name},  #  Use `device_name` for status request
+            data=data,
+            error_context="Shelly device control failed",
+            slot_reserved=slot_reserved,
+        )
+
+    async def async_set_device_output(self, state, channel=None):
+        """Awaitable variant of set_device_output for the asyncio control engine."""
+        # LAN devices do not need a cloud rate limiter slot
+        if self.auth_key and not self.local_transport:
+            open_error = circuit_open_error(self.base_cloud_url, self.auth_key)
+            if open_error:
+                return open_error
+            await shelly_rate_limiter.async_wait_if_needed(self.base_cloud_url, self.auth_key)
+            return await asyncio.to_thread(
+                self.set_device_output, state, channel, slot_reserved=True
+            )
+        return await asyncio.to_thread(self.set_device_output, state, channel)
 
 
 class ShellyTemperatureService:
@@ -174,55 +340,45 @@ class ShellyTemperatureService:
             self.auth_key = temperature_device.shelly_api_key
             self.device_name = temperature_device.shelly_device_name
             self.base_cloud_url = temperature_device.shelly_server
+            self.local_transport = (
+                ShellyLocalTransport(temperature_device.local_host, temperature_device.local_password)
+                if temperature_device.local_host
+                else None
+            )
         else:
             self.auth_key = None
             self.device_name = "Unknown Device"
             self.base_cloud_url = "Unknown"
+            self.local_transport = None
 
     def get_device_status(self):
-        """Fetches the status of a Shelly temperature device."""
-        if not self.auth_key:
-            return {"error": "Auth key is required for cloud requests."}
-        if not self.device_name:
-            return {"error": "Device name is missing for status request."}
-
-        url = f"{self.base_cloud_url}/device/status"
-        params = {
-            "id": self.device_name,
-            "auth_key": self.auth_key,
-        }
-
-        max_retries = 3
-        retry_count = 0
-
-        while retry_count < max_retries:
+        """Fetches the status of a Shelly temperature device, preferring the LAN when configured."""
+        if self.local_transport:
             try:
-                shelly_rate_limiter.wait_if_needed(self.base_cloud_url, self.auth_key)
-                response = requests.get(url, params=params, timeout=15)
-
-                if response.status_code == 429:
-                    shelly_rate_limiter.record_failure(self.base_cloud_url, self.auth_key)
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        continue
-                    raise requests.RequestException("Rate limit exceeded after retries")
-
-                response.raise_for_status()
-                status_data = response.json()
-                shelly_rate_limiter.record_success(self.base_cloud_url, self.auth_key)
+                status_data = self.local_transport.get_temperature_status()
                 status_data["shelly_device_name"] = self.device_name
                 return status_data
+            except (requests.RequestException, ValueError):
+                pass  # Fall back to Shelly Cloud
 
-            except requests.RequestException as e:
-                if retry_count < max_retries - 1:
-                    shelly_rate_limiter.record_failure(self.base_cloud_url, self.auth_key)
-                    retry_count += 1
-                    continue
+        if not self.auth_key:
+            return {"error": "Auth key is required for cloud requests."}
+        if not self.device_name:
+            return {"error": "Device name is missing for status request."}
 
-                safe_error = SecurityUtils.get_safe_error_message(
-                    e, "Shelly temperature request failed"
-                )
-                return {"error": safe_error}
+        status_data = shelly_cloud_request(
+            "GET",
+            self.base_cloud_url,
+            self.auth_key,
+            "/device/status",
+            params={"id": self.device_name},
+            error_context="Shelly temperature request failed",
+        )
+        if "error" in status_data:
+            return status_data
+
+        status_data["shelly_device_name"] = self.device_name
+        return status_data
 
 
 def extract_temperature_c(status_data):
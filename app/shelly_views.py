@@ -1,9 +1,12 @@
 # shellyapp/shelly_views.py
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 from .services.shelly_service import ShellyService
 from .models import ShellyDevice, DeviceLog
 from .logger import log_device_event
-from .utils.rate_limiter import shelly_rate_limiter
+from .device_state_manager import DeviceStateManager
+from .utils.circuit_breaker import shelly_circuit_breaker
+from .utils.http_session_pool import shelly_session_pool
 import time
 
 
@@ -15,12 +18,24 @@ def fetch_device_status(request):
         return JsonResponse({"error": "Device ID not provided"}, status=400)
 
     try:
-        # First, wait if needed, to queue requests from the frontend
-        device = ShellyDevice.objects.filter(device_id=device_id).first()
-        if device:
-            shelly_rate_limiter.wait_if_needed(device.shelly_server, device.shelly_api_key)
+        # Serve the cached state while it is fresh, unless the caller asks for a refresh
+        if request.GET.get("refresh") != "1":
+            device = ShellyDevice.objects.filter(device_id=device_id).first()
+            state = (
+                DeviceStateManager.get_state(device, device.relay_channel) if device else None
+            )
+            if DeviceStateManager.is_fresh(state):
+                return JsonResponse(
+                    {
+                        "device_id": device_id,
+                        "device_name": device.familiar_name,
+                        "online": state.online if state.online is not None else True,
+                        "running": "Running" if state.output else "Stopped",
+                        "cached": True,
+                    }
+                )
 
-        # Initialize Shelly Service - rate limiting is handled in the service
+        # Initialize Shelly Service - rate limiting (per server+token bucket) is handled in the service
         shelly_service = ShellyService(device_id)
         raw_status = shelly_service.get_device_status()
 
@@ -128,3 +143,22 @@ def toggle_device_output(request):
         },
         safe=False,
     )
+
+
+@staff_member_required
+def shelly_health(request):
+    """
+    Health scoreboard for Shelly Cloud accounts: circuit state, rolling latency and
+    error rate per server+token key, plus HTTP connection reuse per server.
+    """
+    accounts = shelly_circuit_breaker.stats()
+    slowest = sorted(
+        accounts, key=lambda key: accounts[key]["latency_avg_ms"] or 0, reverse=True
+    )
+    return JsonResponse(
+        {
+            "accounts": accounts,
+            "slowest_accounts": slowest,
+            "sessions": shelly_session_pool.stats(),
+        }
+    )
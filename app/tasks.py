@@ -1,6 +1,5 @@
 import requests
-import time
-from datetime import datetime, timedelta
+from datetime import timedelta
 from django.urls import reverse
 from django.utils.timezone import now
 from django.conf import settings
@@ -10,9 +9,6 @@ from app.models import (
     ShellyDevice,
     ShellyTemperature,
     TemperatureReading,
-    ElectricityPrice,
-    DeviceLog,
-    DeviceAssignment,
 )
 from app.shelly_views import toggle_device_output, fetch_device_status
 from app.services.shelly_service import (
@@ -21,17 +17,26 @@ from app.services.shelly_service import (
     extract_temperature_c,
 )
 from app.thermostat_manager import ThermostatAssignmentManager
-from app.price_views import call_fetch_prices, get_cheapest_hours
+from app.control_engine import AsyncControlEngine
+from app.control_planner import ControlPlanner
+from app.actuation_scheduler import ActuationScheduler
+from app.device_state_manager import DeviceStateManager
+from app.price_views import call_fetch_prices
 from .logger import log_device_event
 from app.utils.time_utils import TimeUtils
 from app.utils.db_utils import with_db_retries
-import pytz
+from app.utils.rate_limiter import server_token_key
+from app.utils.http_session_pool import shelly_session_pool
 from typing import Optional
 
 
 class DeviceController:
     """Controller for scheduled device and price operations."""
 
+    # Replay/simulation: control passes plan as usual but no device is contacted;
+    # simulated devices follow every command (see simulate_control_pass)
+    dry_run = False
+
     @staticmethod
     def fetch_electricity_prices() -> None:
         """Calls the Django view to fetch electricity prices internally."""
@@ -72,76 +77,78 @@ class DeviceController:
                 "INFO"
             )
             
-            # Get active price period and any assignments for this period
-            active_prices = ElectricityPrice.objects.filter(
-                start_time__range=(start_time, end_time)
-            )
-            active_price_ids = list(active_prices.values_list("id", flat=True))
-            
             # Only process devices with automation enabled (status = 1)
-            devices = ShellyDevice.objects.filter(status=1)
+            devices = list(
+                ShellyDevice.objects.filter(status=1).select_related("thermostat_device")
+            )
             
-            if not devices.exists():
+            if not devices:
                 log_device_event(None, "No devices with automation enabled found", "INFO")
                 return
             
+            # Only devices with a transition, stale state, drift or a due sweep are contacted
+            device_states = DeviceStateManager.get_states(devices)
+            state_ttl_seconds = DeviceStateManager.get_ttl_seconds()
+            # The planner resolves the period and loads all assigned device ids with one query
+            planner = ControlPlanner(start_time)
+            reasons = planner.plan(devices, device_states, state_ttl_seconds)
+            log_device_event(None, ControlPlanner.summarize(reasons, len(devices)), "INFO")
+            # Stale and swept devices are read again instead of trusting the cache
+            device_states = {
+                device_id: state
+                for device_id, state in device_states.items()
+                if reasons.get(device_id) not in ControlPlanner.LIVE_READ_REASONS
+            }
+            devices = [device for device in devices if device.device_id in reasons]
+            
             # Group devices by server+token combination for optimal parallel processing
             from collections import defaultdict
-            import hashlib
             
             device_groups = defaultdict(list)
             for device in devices:
-                # Create a key for server+token combination
-                key_hash = hashlib.md5(device.shelly_api_key.encode()).hexdigest()[:8]
-                group_key = f"{device.shelly_server}:{key_hash}"
-                device_groups[group_key].append(device)
-            
-            log_device_event(
-                None,
-                f"Processing {len(devices)} devices in {len(device_groups)} parallel groups by server+token combination",
-                "INFO"
-            )
+                # LAN devices are limited by the local transport, not by the cloud account
+                if device.local_host:
+                    device_groups[f"lan:{device.local_host}"].append(device)
+                    continue
+                # Same key as the rate limiter bucket for this server+token combination
+                device_groups[server_token_key(device.shelly_server, device.shelly_api_key)].append(device)
             
-            # Process each group with internal staggering, but groups can run in parallel
-            from concurrent.futures import ThreadPoolExecutor, as_completed
+            # Transitions first, thermostat-critical devices next, reads last; reads that
+            # would overrun the next period boundary are deferred
+            scheduler = ActuationScheduler(start_time, reasons)
+            device_groups = scheduler.schedule(device_groups)
             
-            def process_device_group(group_info):
-                group_key, device_list = group_info
+            if device_groups:
                 log_device_event(
                     None,
-                    f"Processing group {group_key} with {len(device_list)} devices",
+                    f"Processing {len(devices)} devices in {len(device_groups)} concurrent groups by server+token combination",
                     "INFO"
                 )
-                
-                for index, device in enumerate(device_list):
-                    try:
-                        # Small stagger within the group (only 1 second between devices in same group)
-                        if index > 0:
-                            time.sleep(1)
-                        
-                        DeviceController._process_single_device(device, active_price_ids, start_time)
-                        
-                    except Exception as e:
-                        log_device_event(
-                            device,
-                            f"Error processing device in group: {str(e)}",
-                            "ERROR"
-                        )
             
-            # Execute groups in parallel (max 5 concurrent groups to be conservative)
-            with ThreadPoolExecutor(max_workers=min(5, len(device_groups))) as executor:
-                futures = [executor.submit(process_device_group, group_info) for group_info in device_groups.items()]
-                
-                # Wait for all groups to complete
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        log_device_event(
-                            None,
-                            f"Error in device group processing: {str(e)}",
-                            "ERROR"
-                        )
+            if DeviceController.dry_run:
+                DeviceController.simulate_control_pass(
+                    device_groups, planner.assigned_device_ids, scheduler
+                )
+                ThermostatAssignmentManager.apply_next_period_assignments()
+                return
+
+            # Every group runs as its own coroutine; the rate limiter paces devices inside a group
+            AsyncControlEngine(
+                planner.assigned_device_ids,
+                start_time,
+                device_states=device_states,
+                state_ttl_seconds=state_ttl_seconds,
+                scheduler=scheduler,
+            ).run(device_groups)
+            scheduler.record_pass(devices)
+
+            for server, counters in shelly_session_pool.stats().items():
+                log_device_event(
+                    None,
+                    f"HTTP session totals for {server}: requests={counters['requests']}, "
+                    f"new connections={counters['new_connections']}, reused={counters['reused_connections']}",
+                    "DEBUG",
+                )
 
             DeviceController.fetch_thermostat_temperatures()
             ThermostatAssignmentManager.apply_next_period_assignments()
@@ -149,6 +156,26 @@ class DeviceController:
         except Exception as e:
             log_device_event(None, f"Error controlling Shelly devices: {e}", "ERROR")
 
+    @staticmethod
+    def simulate_control_pass(device_groups: dict, assigned_device_ids: set, scheduler=None) -> int:
+        """
+        Dry-run counterpart of the engine: every scheduled device is assumed to reach
+        its desired state, which is recorded in the state cache. Returns the number
+        of simulated commands.
+        """
+        commands = 0
+        for group_key, device_list in device_groups.items():
+            for device in device_list:
+                if scheduler and scheduler.should_defer(group_key, device):
+                    continue
+                state = "on" if device.device_id in assigned_device_ids else "off"
+                DeviceStateManager.record_command(device, state, device.relay_channel or 0)
+                commands += 1
+                if scheduler:
+                    scheduler.mark_done(device)
+        log_device_event(None, f"Dry run: simulated {commands} device commands", "DEBUG")
+        return commands
+
     @staticmethod
     def fetch_thermostat_temperatures() -> None:
         """Fetch temperature data for all thermostat devices."""
@@ -157,188 +184,106 @@ class DeviceController:
             if not temperature_devices.exists():
                 return
 
+            # Thermostats on the same account share one bulk status request
+            from collections import defaultdict
+
+            thermostat_groups = defaultdict(list)
             for temperature_device in temperature_devices:
-                shelly_service = ShellyTemperatureService(temperature_device.device_id)
-                status = shelly_service.get_device_status()
-                if "error" in status:
-                    log_device_event(
-                        None,
-                        f"Temperature fetch error for {temperature_device.familiar_name}: {status['error']}",
-                        "ERROR",
+                if temperature_device.local_host:
+                    group_key = f"lan:{temperature_device.local_host}"
+                else:
+                    group_key = server_token_key(
+                        temperature_device.shelly_server, temperature_device.shelly_api_key
                     )
-                    continue
+                thermostat_groups[group_key].append(temperature_device)
 
-                temperature_c = extract_temperature_c(status)
-                if temperature_c is None:
-                    log_device_event(
-                        None,
-                        f"Temperature not found for {temperature_device.familiar_name}",
-                        "WARN",
+            for group_key, group_devices in thermostat_groups.items():
+                account_statuses = {}
+                if len(group_devices) > 1 and not group_devices[0].local_host:
+                    bulk_status = ShellyService.fetch_account_status(
+                        group_devices[0].shelly_server, group_devices[0].shelly_api_key
                     )
-                    continue
-
-                temperature_device.current_temperature = temperature_c
-                temperature_device.temperature_updated_at = TimeUtils.now_utc()
-                temperature_device.save(
-                    update_fields=[
-                        "current_temperature",
-                        "temperature_updated_at",
-                        "updated_at",
-                    ]
-                )
-                TemperatureReading.objects.create(
-                    thermostat=temperature_device,
-                    temperature_c=temperature_c,
-                    recorded_at=temperature_device.temperature_updated_at,
-                )
+                    if "error" in bulk_status:
+                        log_device_event(
+                            None,
+                            f"Bulk temperature status failed for group {group_key}: {bulk_status['error']}",
+                            "WARN",
+                        )
+                    else:
+                        account_statuses = bulk_status["devices"]
 
-                log_device_event(
-                    None,
-                    f"Temperature for {temperature_device.familiar_name}: {temperature_c:.2f} C",
-                    "INFO",
-                )
+                for temperature_device in group_devices:
+                    DeviceController._store_thermostat_temperature(
+                        temperature_device,
+                        account_statuses.get(temperature_device.shelly_device_name),
+                    )
 
         except Exception as e:
             log_device_event(None, f"Error fetching thermostat temperatures: {e}", "ERROR")
 
     @staticmethod
-    def _process_single_device(device: ShellyDevice, active_price_ids: list, start_time) -> None:
-        """Process a single device - extracted for use in parallel processing."""
-        try:
-            # Check if this 15-minute period is assigned
-            assigned = DeviceAssignment.objects.filter(
-                device=device,
-                electricity_price_id__in=active_price_ids
-            ).exists()
-            
-            # Get initial device state (ONLY ONE STATUS CHECK)
-            shelly_service = ShellyService(device.device_id)
-            device_status = shelly_service.get_device_status()
-            
-            if "error" in device_status:
-                log_device_event(
-                    device,
-                    f"Error fetching initial status: {device_status['error']}",
-                    "ERROR"
-                )
-                return
-            
-            is_running = (
-                device_status.get("data", {})
-                .get("device_status", {})
-                .get("switch:0", {})
-                .get("output", False)
-            )
-            
-            # Log detailed state information
+    def _store_thermostat_temperature(temperature_device: ShellyTemperature, status: Optional[dict] = None) -> None:
+        """Stores the current temperature of one thermostat, fetching its status if not given."""
+        if status is None:
+            shelly_service = ShellyTemperatureService(temperature_device.device_id)
+            status = shelly_service.get_device_status()
+        if "error" in status:
             log_device_event(
-                device,
-                f"Period {start_time.strftime('%Y-%m-%d %H:%M')} - "
-                f"Assignment: {assigned}, Current State: {'running' if is_running else 'stopped'}",
-                "INFO"
+                None,
+                f"Temperature fetch error for {temperature_device.familiar_name}: {status['error']}",
+                "ERROR",
             )
-            
-            # Determine if action is needed
-            action_needed = (assigned and not is_running) or (not assigned and is_running)
-            desired_state = "on" if assigned else "off"
-            
-            if action_needed:
-                log_device_event(
-                    device,
-                    f"State change needed. Setting to {desired_state.upper()}",
-                    "INFO"
-                )
-                # Call toggle with the device state we just fetched (pass it to avoid re-fetching)
-                DeviceController.toggle_shelly_device_with_state(device, desired_state, is_running)
-            else:
-                log_device_event(
-                    device,
-                    f"No action needed. Current state matches desired state ({desired_state.upper()})",
-                    "INFO"
-                )
-                
-        except Exception as e:
+            return
+
+        temperature_c = extract_temperature_c(status)
+        if temperature_c is None:
             log_device_event(
-                device,
-                f"Error processing device: {str(e)}",
-                "ERROR"
+                None,
+                f"Temperature not found for {temperature_device.familiar_name}",
+                "WARN",
             )
+            return
+
+        temperature_device.current_temperature = temperature_c
+        temperature_device.temperature_updated_at = TimeUtils.now_utc()
+        temperature_device.save(
+            update_fields=[
+                "current_temperature",
+                "temperature_updated_at",
+                "updated_at",
+            ]
+        )
+        TemperatureReading.objects.create(
+            thermostat=temperature_device,
+            temperature_c=temperature_c,
+            recorded_at=temperature_device.temperature_updated_at,
+        )
+
+        log_device_event(
+            None,
+            f"Temperature for {temperature_device.familiar_name}: {temperature_c:.2f} C",
+            "INFO",
+        )
 
     @staticmethod
-    def toggle_shelly_device_with_state(device: ShellyDevice, action: str, current_is_running: bool) -> None:
-        """Helper function to toggle a Shelly device ON or OFF when current state is already known."""
-        # Only make the toggle call if the device is not already in the desired state
-        if (action == "off" and current_is_running) or (action == "on" and not current_is_running):
-            log_device_event(
-                device,
-                f"Device state needs change: currently {'ON' if current_is_running else 'OFF'}, setting to {action.upper()}",
-                "INFO"
-            )
-            
-            shelly_service = ShellyService(device.device_id)
-            result = shelly_service.set_device_output(state=action)
-            
-            if "error" in result:
-                log_device_event(
-                    device,
-                    f"Failed to turn {action.upper()} device: {result['error']}",
-                    "ERROR",
-                )
-            elif result.get("status") == "blocked":
-                log_device_event(
-                    device,
-                    f"Device toggle BLOCKED by SHELLY_STOP_REST_DEBUG: {result.get('message', 'No message')}",
-                    "INFO",
-                )
-            else:
-                log_device_event(device, f"Device turned {action.upper()}", "INFO")
-        else:
-            log_device_event(
-                device,
-                f"Device already in desired state ({action.upper()}), no action needed",
-                "INFO"
-            )
+    def extract_output_state(device_status: dict, channel: int = 0) -> Optional[bool]:
+        """Returns the relay output of a channel from a Shelly status payload, None when unknown."""
+        return DeviceStateManager.parse_status(device_status, channel)["output"]
 
     @staticmethod
-    def toggle_shelly_device(device: ShellyDevice, action: str) -> None:
-        """Helper function to toggle a Shelly device ON or OFF."""
-        # Get the last logged state to minimize API calls
-        last_log = DeviceLog.objects.filter(device=device).order_by('-created_at').first()
-        last_action = None
-        if last_log and (datetime.now(pytz.UTC) - last_log.created_at).total_seconds() < 120:  # Trust state for 2 minutes
-            message = last_log.message.lower()
-            if "turned on" in message:
-                last_action = "on"
-            elif "turned off" in message:
-                last_action = "off"
-                
-        # If the last action matches what we want to do, skip the API call
-        if last_action == action:
+    def log_toggle_result(device: ShellyDevice, action: str, result: dict) -> None:
+        """Logs the outcome of a relay command returned by ShellyService."""
+        if "error" in result:
             log_device_event(
                 device,
-                f"Skipping {action} command - device already in desired state (cached)",
-                "INFO"
+                f"Failed to turn {action.upper()} device: {result['error']}",
+                "ERROR",
             )
-            return
-
-        # Only proceed with API calls if we really need to change state
-        shelly_service = ShellyService(device.device_id)
-        
-        # First get current status to verify we need to make a change
-        device_status = shelly_service.get_device_status()
-        
-        if "error" in device_status:
+        elif result.get("status") == "blocked":
             log_device_event(
-                device, f"Error fetching status for toggle: {device_status['error']}", "ERROR"
+                device,
+                f"Device toggle BLOCKED by SHELLY_STOP_REST_DEBUG: {result.get('message', 'No message')}",
+                "INFO",
             )
-            return
-            
-        is_running = (
-            device_status.get("data", {})
-            .get("device_status", {})
-            .get("switch:0", {})
-            .get("output", False)
-        )
-        
-        # Use the new method to avoid duplicate code
-        DeviceController.toggle_shelly_device_with_state(device, action, is_running)
+        else:
+            log_device_event(device, f"Device turned {action.upper()}", "INFO")
@@ -3,11 +3,110 @@ This file demonstrates writing tests using the unittest module. These will pass
 when you run "manage.py test".
 """
 
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from decimal import Decimal
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
 import django
-from django.test import TestCase
+import numpy as np
+import pytz
+import requests
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from app.actuation_scheduler import ActuationScheduler
+from app.bidding_zones import BiddingZones
+from app.control_engine import AsyncControlEngine
+from app.control_planner import ControlPlanner
+from app.device_state_manager import DeviceStateManager
+from app.models import (
+    ActuationLateness,
+    AppSetting,
+    DeviceAssignment,
+    DeviceState,
+    ElectricityPrice,
+    PriceBackfillChunk,
+    PriceFetchAttempt,
+    ShellyDevice,
+    ShellyTemperature,
+    TemperatureReading,
+)
+from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon
+from app.entsoe_parser import parse_day_ahead
+from app.pipeline import PipelineStage, prices_changed
+from app.price_backfill import PriceBackfill
+from app.price_fetch_planner import PriceFetchPlanner
+from app.price_replay import PriceReplay
+from app.price_sources import FilePriceSource, SyntheticPriceSource
+from app.price_store import PriceStore
+from app.price_views import call_fetch_prices, fetch_day_ahead_xml, set_cheapest_hours
+from app.schedule_solver import ScheduleSolver
+from app.joint_optimizer import JointOptimizer
+from app.services.shelly_service import CIRCUIT_OPEN_ERROR, ShellyService, shelly_cloud_request
+from app.tasks import DeviceController
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.entsoe_cache import EntsoeResponseCache
+from app.utils.rate_limiter import RateLimiter
+from app.utils.http_session_pool import HttpSessionPool
+from app.utils.time_utils import TimeUtils
 
 # TODO: Configure your database in settings.py and sync before running tests.
 
+
+class StubShellyServer:
+    """Local keep-alive HTTP server that answers with canned JSON per path."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                path = self.path.split("?")[0]
+                stub.requests.append((self.command, self.path, body))
+                payload = json.dumps(stub.responses.get(path, {})).encode()
+                self.send_response(200 if path in stub.responses else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _reply
+            do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
 class ViewTest(TestCase):
     """Tests for the application views."""
 
@@ -32,3 +131,1203 @@ class ViewTest(TestCase):
         """Tests the about page."""
         response = self.client.get('/about')
         self.assertContains(response, 'About', 3, 200)
+
+
+
+class AsyncControlEngineTest(TransactionTestCase):
+    """Tests for the asyncio control engine."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="engine")
+        ShellyDevice.objects.all().delete()
+        self.devices = [
+            ShellyDevice.objects.create(
+                familiar_name=f"Heater {index}",
+                shelly_api_key=f"key-{index}",
+                shelly_device_name=f"shelly-{index}",
+                user=self.user,
+                day_transfer_price=0,
+                night_transfer_price=0,
+            )
+            for index in range(4)
+        ]
+
+    def test_groups_run_concurrently(self):
+        """Groups with different server+token keys do not wait for each other."""
+
+        def slow_status(service, slot_reserved=False):
+            time.sleep(0.3)
+            return {"data": {"device_status": {"switch:0": {"output": False}}}}
+
+        groups = {f"group-{d.device_id}": [d] for d in self.devices}
+        with mock.patch(
+            "app.services.shelly_service.ShellyService._get_cloud_status",
+            slow_status,
+        ):
+            started = time.monotonic()
+            AsyncControlEngine(set(), TimeUtils.now_utc()).run(groups)
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.3 * len(self.devices))
+
+
+class RateLimiterTest(SimpleTestCase):
+    """Tests for the per-key token-bucket rate limiter."""
+
+    def test_keys_do_not_block_each_other(self):
+        """A long wait on one server+token key does not delay another key."""
+        limiter = RateLimiter(base_delay=0.5)
+        limiter.wait_if_needed("https://a.example", "token-a")
+
+        def second_request_a():
+            limiter.wait_if_needed("https://a.example", "token-a")
+
+        waiter = threading.Thread(target=second_request_a)
+        waiter.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        limiter.wait_if_needed("https://b.example", "token-b")
+        self.assertLess(time.monotonic() - started, 0.1)
+        waiter.join()
+
+    def test_burst_capacity(self):
+        """An idle bucket hands out its burst without waiting, then paces."""
+        limiter = RateLimiter(base_delay=1.0, burst=3)
+        waits = [limiter.reserve("https://a.example", "token") for _ in range(4)]
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(waits[3], 1.0, delta=0.05)
+
+    def test_retry_after_pauses_bucket(self):
+        """A 429 with Retry-After holds the next slot until the server allows it."""
+        limiter = RateLimiter(base_delay=0.1)
+        limiter.reserve("https://a.example", "token")
+        limiter.record_failure("https://a.example", "token", retry_after="5")
+        self.assertAlmostEqual(
+            limiter.reserve("https://a.example", "token"), 5.0, delta=0.05
+        )
+
+    def test_reserved_caller_waits_out_retry_after(self):
+        """A caller whose slot was reserved before a Retry-After does not send inside the pause."""
+        limiter = RateLimiter(base_delay=0.1)
+        limiter.reserve("https://a.example", "token")
+
+        def blocked_by_server():
+            time.sleep(0.05)
+            limiter.record_failure("https://a.example", "token", retry_after="0.3")
+
+        failure = threading.Thread(target=blocked_by_server)
+        failure.start()
+        started = time.monotonic()
+        limiter.wait_if_needed("https://a.example", "token")  # Reserved for 0.1 s from now
+        failure.join()
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+
+class HttpSessionPoolTest(SimpleTestCase):
+    """Tests for the shared keep-alive session pool."""
+
+    def test_connections_are_reused_per_server(self):
+        """Repeated calls to one server go over a single kept-alive connection."""
+        pool = HttpSessionPool()
+        with StubShellyServer({"/device/status": {"isok": True}}) as stub:
+            session = pool.get_session(stub.url)
+            for _ in range(5):
+                session.get(f"{stub.url}/device/status", timeout=5).json()
+            self.assertIs(pool.get_session(stub.url), session)
+            stats = pool.stats()[stub.url]
+        pool.close_all()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["reused_connections"], 4)
+
+
+class BulkStatusTest(TransactionTestCase):
+    """Tests for the per-account bulk status path against a local stub server."""
+
+    ALL_STATUS = {
+        "isok": True,
+        "data": {
+            "devices_status": {
+                "shelly-a": {"_dev_info": {"online": True}, "switch:0": {"output": True}},
+                "shelly-b": {"_dev_info": {"online": False}, "switch:0": {"output": False}},
+                "ht-1": {"_dev_info": {"online": True}, "temperature:0": {"tC": 21.5}},
+                "ht-2": {"_dev_info": {"online": True}, "temperature:0": {"tC": 19.0}},
+            }
+        },
+    }
+
+    def setUp(self):
+        self.user = User.objects.create(username="bulk")
+        ShellyDevice.objects.all().delete()
+
+    def test_account_status_is_split_per_device(self):
+        """One all_status response is split by shelly_device_name."""
+        with StubShellyServer({"/device/all_status": self.ALL_STATUS}) as stub:
+            result = ShellyService.fetch_account_status(stub.url, "token")
+        self.assertEqual(len(stub.requests), 1)
+        devices = result["devices"]
+        self.assertTrue(DeviceController.extract_output_state(devices["shelly-a"]))
+        self.assertFalse(devices["shelly-b"]["data"]["online"])
+
+    def test_group_reads_state_with_one_request(self):
+        """A control pass over one account makes a single status request."""
+        responses = {"/device/all_status": self.ALL_STATUS, "/device/relay/control": {"isok": True}}
+        with StubShellyServer(responses) as stub:
+            devices = [
+                ShellyDevice.objects.create(
+                    familiar_name=name,
+                    shelly_api_key="token",
+                    shelly_device_name=name,
+                    shelly_server=stub.url,
+                    user=self.user,
+                    day_transfer_price=0,
+                    night_transfer_price=0,
+                )
+                for name in ("shelly-a", "shelly-b")
+            ]
+            AsyncControlEngine(set(), TimeUtils.now_utc()).run({"account": devices})
+        status_requests = [r for r in stub.requests if "status" in r[1]]
+        self.assertEqual(len(status_requests), 1)
+        self.assertTrue(status_requests[0][1].startswith("/device/all_status"))
+
+    def test_thermostats_share_bulk_status(self):
+        """Thermostats on one account are read from a single bulk payload."""
+        with StubShellyServer({"/device/all_status": self.ALL_STATUS}) as stub:
+            for name in ("ht-1", "ht-2"):
+                ShellyTemperature.objects.create(
+                    familiar_name=name,
+                    shelly_api_key="token",
+                    shelly_device_name=name,
+                    shelly_server=stub.url,
+                    user=self.user,
+                )
+            DeviceController.fetch_thermostat_temperatures()
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(TemperatureReading.objects.count(), 2)
+
+
+class LocalTransportTest(TestCase):
+    """Tests for the direct LAN Gen2 RPC transport."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="lan")
+
+    def _device(self, local_host, server="https://cloud.invalid"):
+        return ShellyDevice.objects.create(
+            familiar_name="LAN heater",
+            shelly_api_key="token",
+            shelly_device_name="shelly-lan",
+            shelly_server=server,
+            local_host=local_host,
+            user=self.user,
+            day_transfer_price=0,
+            night_transfer_price=0,
+        )
+
+    def test_status_and_switch_use_rpc(self):
+        """Status and relay calls go straight to the device RPC endpoints."""
+        responses = {
+            "/rpc/Switch.GetStatus": {"id": 0, "output": True, "apower": 1200.0},
+            "/rpc/Switch.Set": {"was_on": True},
+        }
+        with StubShellyServer(responses) as stub:
+            device = self._device(stub.url.replace("http://", ""))
+            service = ShellyService(device.device_id)
+            status = service.get_device_status()
+            result = service.set_device_output("off")
+        self.assertEqual(status["transport"], "local")
+        self.assertTrue(DeviceController.extract_output_state(status))
+        self.assertEqual(result["transport"], "local")
+        self.assertIn("on=false", stub.requests[-1][1])
+
+    def test_admin_keeps_password_submitted_empty(self):
+        """The admin never renders the LAN password, and saving the empty field keeps it."""
+        from django.contrib import admin
+        from app.admin import ShellyDeviceAdmin
+
+        device = self._device("10.0.0.9")
+        ShellyDevice.objects.filter(pk=device.pk).update(local_password="secret")
+        model_admin = ShellyDeviceAdmin(ShellyDevice, admin.site)
+        request = RequestFactory().post("/")
+        request.user = User.objects.create(username="lan-admin", is_superuser=True)
+
+        form = model_admin.get_form(request, device)(instance=device)
+        self.assertNotIn("secret", str(form["local_password"]))
+        device.local_password = ""
+        model_admin.save_model(request, device, form, change=True)
+        device.refresh_from_db()
+        self.assertEqual(device.local_password, "secret")
+
+    def test_output_is_read_from_relay_channel(self):
+        """A LAN status holds only the device's channel, which decides the output."""
+        status = {"data": {"device_status": {"switch:1": {"id": 1, "output": True}}}}
+        self.assertTrue(DeviceController.extract_output_state(status, 1))
+        self.assertIsNone(DeviceController.extract_output_state(status, 0))  # Not another channel's relay
+        self.assertFalse(
+            DeviceController.extract_output_state({"data": {"device_status": {"switch:0": {"output": False}}}})
+        )
+
+    def test_unreachable_device_falls_back_to_cloud(self):
+        """A device that does not answer on the LAN is read through the cloud."""
+        cloud_status = {"isok": True, "data": {"device_status": {"switch:0": {"output": False}}}}
+        with StubShellyServer({"/device/status": cloud_status}) as cloud:
+            device = self._device("127.0.0.1:1", server=cloud.url)
+            service = ShellyService(device.device_id)
+            status = service.get_device_status()
+        self.assertNotIn("transport", status)
+        self.assertIsNotNone(service.local_error)
+        self.assertEqual(len(cloud.requests), 1)
+
+
+class DeviceStateCacheTest(TransactionTestCase):
+    """Tests for the persistent device state cache."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="state")
+
+    def _device(self, server):
+        return ShellyDevice.objects.create(
+            familiar_name="Cached heater",
+            shelly_api_key="token",
+            shelly_device_name="shelly-a",
+            shelly_server=server,
+            user=self.user,
+            day_transfer_price=0,
+            night_transfer_price=0,
+        )
+
+    def test_status_and_commands_update_cache(self):
+        """Status fetches and relay commands are written to DeviceState."""
+        responses = {
+            "/device/status": {
+                "isok": True,
+                "data": {"online": True, "device_status": {"switch:0": {"output": True, "apower": 850.5}}},
+            },
+            "/device/relay/control": {"isok": True},
+        }
+        with StubShellyServer(responses) as stub:
+            device = self._device(stub.url)
+            service = ShellyService(device.device_id)
+            service.get_device_status()
+            state = DeviceStateManager.get_state(device)
+            self.assertTrue(state.output)
+            self.assertEqual(state.power_w, 850.5)
+
+            service.set_device_output("off")
+        state = DeviceStateManager.get_state(device)
+        self.assertFalse(state.output)
+        self.assertIsNotNone(state.command_at)
+        self.assertTrue(DeviceStateManager.is_fresh(state, ttl_seconds=60))
+
+    def test_control_pass_trusts_fresh_state(self):
+        """A fresh cached state that matches the plan needs no Shelly request at all."""
+        with StubShellyServer({}) as stub:
+            device = self._device(stub.url)
+            DeviceStateManager.record_command(device, "off")
+            AsyncControlEngine(
+                set(),
+                TimeUtils.now_utc(),
+                device_states=DeviceStateManager.get_states([device]),
+                state_ttl_seconds=3600,
+            ).run({"account": [device]})
+        self.assertEqual(stub.requests, [])
+        self.assertEqual(DeviceState.objects.count(), 1)
+
+
+class ControlPlannerTest(TestCase):
+    """Tests for the diff-based control plan."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="planner")
+        self.start = datetime(2026, 1, 1, 10, 15, tzinfo=timezone.utc)  # Not a sweep boundary
+        previous = ElectricityPrice.objects.create(
+            start_time=self.start - timedelta(minutes=15),
+            end_time=self.start,
+            price_kwh=1,
+        )
+        current = ElectricityPrice.objects.create(
+            start_time=self.start, end_time=self.start + timedelta(minutes=15), price_kwh=1
+        )
+        self.devices = {}
+        for name, periods, output in (
+            ("steady-on", [previous, current], True),
+            ("steady-off", [], False),
+            ("starts", [current], False),
+            ("drifted", [], True),
+            ("unknown", [], None),
+        ):
+            device = ShellyDevice.objects.create(
+                familiar_name=name,
+                shelly_api_key="token",
+                shelly_device_name=name,
+                user=self.user,
+                day_transfer_price=0,
+                night_transfer_price=0,
+            )
+            for price in periods:
+                DeviceAssignment.objects.create(user=self.user, device=device, electricity_price=price)
+            if output is not None:
+                DeviceStateManager.record_command(device, "on" if output else "off")
+            self.devices[name] = device
+
+    def _plan(self, start):
+        devices = list(self.devices.values())
+        planner = ControlPlanner(start, now=TimeUtils.now_utc())
+        return planner.plan(devices, DeviceStateManager.get_states(devices), ttl_seconds=3600)
+
+    def test_only_changed_devices_are_contacted(self):
+        """Unchanged devices with a fresh matching state are skipped."""
+        reasons = self._plan(self.start)
+        by_name = {d.familiar_name: reasons.get(d.device_id) for d in self.devices.values()}
+        self.assertEqual(
+            by_name,
+            {
+                "steady-on": None,
+                "steady-off": None,
+                "starts": ControlPlanner.REASON_TRANSITION,
+                "drifted": ControlPlanner.REASON_DRIFT,
+                "unknown": ControlPlanner.REASON_STALE,
+            },
+        )
+
+    def test_query_count_does_not_grow_with_devices(self):
+        """Planning a pass costs the same number of queries for 5 or 25 devices."""
+
+        def planning_queries():
+            with mock.patch("app.tasks.AsyncControlEngine.run") as run, mock.patch(
+                "app.tasks.DeviceController.fetch_thermostat_temperatures"
+            ), mock.patch("app.tasks.ThermostatAssignmentManager.apply_next_period_assignments"), mock.patch(
+                "app.tasks.shelly_session_pool.stats", return_value={}
+            ), mock.patch("app.tasks.TimeUtils.now_utc", return_value=self.start), CaptureQueriesContext(
+                connection
+            ) as queries:
+                DeviceController.control_shelly_devices()
+            self.assertTrue(run.called)
+            return len(queries)
+
+        baseline = planning_queries()
+        for index in range(20):
+            ShellyDevice.objects.create(
+                familiar_name=f"extra-{index}",
+                shelly_api_key="token",
+                shelly_device_name=f"extra-{index}",
+                user=self.user,
+                day_transfer_price=0,
+                night_transfer_price=0,
+            )
+        self.assertEqual(planning_queries(), baseline)
+        self.assertLessEqual(baseline, 12)
+
+    def test_service_is_built_without_queries(self):
+        """ShellyService.for_device reuses the loaded instance."""
+        device = self.devices["starts"]
+        with self.assertNumQueries(0):
+            service = ShellyService.for_device(device)
+        self.assertEqual(service.device_name, "starts")
+
+    def test_full_sweep_contacts_every_device(self):
+        """On a sweep boundary unchanged devices are read as well."""
+        AppSetting.objects.update_or_create(key="CONTROL_FULL_SWEEP_MINUTES", defaults={"value": "15"})
+        reasons = self._plan(self.start)
+        self.assertEqual(len(reasons), len(self.devices))
+        self.assertEqual(reasons[self.devices["steady-on"].device_id], ControlPlanner.REASON_SWEEP)
+
+
+class CircuitBreakerTest(TestCase):
+    """Tests for the per-account circuit breaker."""
+
+    def test_open_half_open_closed(self):
+        """The circuit opens on failures, lets one probe through and closes on success."""
+        breaker = CircuitBreaker(failure_threshold=2, open_seconds=0.05)
+        breaker.record_failure("https://s", "key", 0.1)
+        self.assertTrue(breaker.allow_request("https://s", "key"))
+        breaker.record_failure("https://s", "key", 0.1)
+        self.assertFalse(breaker.allow_request("https://s", "key"))
+        self.assertTrue(breaker.allow_request("https://other", "key"))
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow_request("https://s", "key"))  # The probe
+        self.assertFalse(breaker.allow_request("https://s", "key"))
+        breaker.record_success("https://s", "key", 0.02)
+
+        stats = next(v for v in breaker.stats().values() if v["server"] == "https://s")
+        self.assertEqual(stats["state"], CircuitBreaker.CLOSED)
+        self.assertEqual(stats["errors"], 2)
+        self.assertEqual(stats["rejected"], 2)
+
+    def test_dead_endpoint_fails_fast(self):
+        """Once open, requests to a failing account are not sent at all."""
+        breaker = CircuitBreaker(failure_threshold=2)
+        with StubShellyServer({}) as stub, mock.patch(
+            "app.services.shelly_service.shelly_circuit_breaker", breaker
+        ), mock.patch(
+            "app.services.shelly_service.shelly_rate_limiter", RateLimiter(base_delay=0.01)
+        ):
+            first = shelly_cloud_request("GET", stub.url, "token", "/device/status")
+            second = shelly_cloud_request("GET", stub.url, "token", "/device/status")
+        self.assertIn("error", first)
+        self.assertEqual(second, {"error": CIRCUIT_OPEN_ERROR})
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_health_endpoint_requires_staff(self):
+        """The scoreboard is served as JSON to staff users only."""
+        url = "/shellyapp/shelly-health/"
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user("ops", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("accounts", response.json())
+
+
+class ActuationSchedulerTest(TestCase):
+    """Tests for the deadline-aware actuation scheduler."""
+
+    def setUp(self):
+        self.user = User.objects.create(username="scheduler")
+        self.start = datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc)
+        self.cold = ShellyTemperature.objects.create(
+            familiar_name="cold room",
+            shelly_api_key="token",
+            shelly_device_name="ht",
+            user=self.user,
+            min_temperature=18,
+            current_temperature=15,
+            temperature_updated_at=self.start,
+        )
+
+    def _device(self, name, **kwargs):
+        return ShellyDevice.objects.create(
+            familiar_name=name,
+            shelly_api_key="token",
+            shelly_device_name=name,
+            local_host="10.0.0.2",
+            user=self.user,
+            day_transfer_price=0,
+            night_transfer_price=0,
+            **kwargs,
+        )
+
+    def test_priority_order_and_deferral(self):
+        """Transitions run first, critical devices next and reads that cannot finish are deferred."""
+        reads = [self._device(f"read-{i}") for i in range(5)]
+        critical = self._device("critical", thermostat_device=self.cold)
+        transition = self._device("transition")
+        reasons = {d.device_id: ControlPlanner.REASON_SWEEP for d in reads + [critical]}
+        reasons[transition.device_id] = ControlPlanner.REASON_TRANSITION
+
+        # 32 seconds left: the 30 s safety margin leaves room for about four LAN requests
+        now = self.start + timedelta(minutes=15) - timedelta(seconds=32)
+        scheduler = ActuationScheduler(self.start, reasons, now=now)
+        groups = scheduler.schedule({"lan": reads + [critical, transition]})
+
+        names = [d.familiar_name for d in groups["lan"]]
+        self.assertEqual(names[:2], ["transition", "critical"])
+        self.assertEqual(len(names), 4)
+        self.assertEqual(len(scheduler.deferred), 3)
+
+        scheduler.mark_done(transition)
+        scheduler.record_pass(reads + [critical, transition])
+        self.assertEqual(ActuationLateness.objects.filter(deferred=True).count(), 3)
+        done = ActuationLateness.objects.get(device=transition)
+        self.assertEqual(done.priority, ActuationScheduler.PRIORITY_TRANSITION)
+        self.assertIsNotNone(done.lateness_seconds)
+
+    def test_old_records_are_pruned(self):
+        """A pass removes lateness records older than the retention period."""
+        device = self._device("old")
+        for days in (20, 1):
+            ActuationLateness.objects.create(
+                device=device,
+                period_start=self.start - timedelta(days=days),
+                reason=ControlPlanner.REASON_SWEEP,
+                priority=ActuationScheduler.PRIORITY_VERIFY,
+            )
+        scheduler = ActuationScheduler(self.start, {})
+        self.assertEqual(scheduler.prune(), 1)
+        self.assertEqual(
+            list(ActuationLateness.objects.values_list("period_start", flat=True)),
+            [self.start - timedelta(days=1)],
+        )
+
+
+class PriceStoreTest(TestCase):
+    """Tests for the bulk price upsert."""
+
+    def _rows(self, start, prices):
+        return [
+            (start + timedelta(minutes=15 * i), start + timedelta(minutes=15 * (i + 1)), price)
+            for i, price in enumerate(prices)
+        ]
+
+    def test_counts_inserted_updated_unchanged(self):
+        """A re-fetch with one changed price reports exactly what changed."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        with self.assertNumQueries(4):  # Savepoint, one read, one bulk upsert, release
+            first = PriceStore.upsert_prices(self._rows(start, [1.5] * 96))
+        self.assertEqual(first.as_dict(), {"inserted": 96, "updated": 0, "unchanged": 0, "removed": 0})
+
+        second = PriceStore.upsert_prices(self._rows(start, [1.5] * 95 + [2.25]))
+        self.assertEqual(second.as_dict(), {"inserted": 0, "updated": 1, "unchanged": 95, "removed": 0})
+        self.assertTrue(second.changed)
+
+        third = PriceStore.upsert_prices(self._rows(start, [1.5] * 95 + [2.25]))
+        self.assertFalse(third.changed)
+        self.assertEqual(ElectricityPrice.objects.count(), 96)
+        self.assertEqual(
+            ElectricityPrice.objects.order_by("start_time").last().price_kwh, Decimal("2.25")
+        )
+
+    def test_hourly_prices_stored_once_and_resolved_by_range(self):
+        """Hourly prices are one row each, cover their quarters and replace 15-minute rows."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        PriceStore.upsert_prices(self._rows(start, [1.5] * 8))
+        hourly = [(start + timedelta(hours=i), start + timedelta(hours=i + 1), 2 + i) for i in range(2)]
+
+        result = PriceStore.upsert_prices(hourly)
+        self.assertEqual(result.as_dict(), {"inserted": 0, "updated": 2, "unchanged": 0, "removed": 6})
+        self.assertEqual(ElectricityPrice.objects.count(), 2)
+
+        covering = ElectricityPrice.objects.covering(start + timedelta(minutes=75)).get()
+        self.assertEqual(covering.start_time, start + timedelta(hours=1))
+        self.assertEqual(covering.resolution_minutes, 60)
+        self.assertFalse(ElectricityPrice.objects.covering(start + timedelta(hours=2)).exists())
+
+    def test_assignments_move_to_replacing_periods(self):
+        """A replaced period's assignment moves to the periods that cover it, either way."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        PriceStore.upsert_prices([(start, start + timedelta(hours=1), 2)])
+        user = User.objects.create(username="history")
+        device = ShellyDevice.objects.create(
+            familiar_name="boiler",
+            shelly_api_key="token",
+            shelly_device_name="boiler",
+            user=user,
+            day_transfer_price=0,
+            night_transfer_price=0,
+        )
+        DeviceAssignment.objects.create(
+            user=user, device=device, electricity_price=ElectricityPrice.objects.get()
+        )
+
+        PriceStore.upsert_prices(self._rows(start, [1.5] * 4))
+        moved = DeviceAssignment.objects.filter(device=device).order_by("electricity_price__start_time")
+        self.assertEqual(
+            [a.electricity_price.start_time for a in moved],
+            [start + timedelta(minutes=15 * i) for i in range(4)],
+        )
+        self.assertEqual({a.source for a in moved}, {DeviceAssignment.SOURCE_MANUAL})
+
+        result = PriceStore.upsert_prices([(start, start + timedelta(hours=1), 2)])
+        self.assertEqual(result.removed, 3)
+        self.assertEqual(DeviceAssignment.objects.get(device=device).electricity_price.resolution_minutes, 60)
+
+
+class EntsoeCacheTest(TestCase):
+    """Tests for the on-disk ENTSO-E response cache."""
+
+    PRICES_XML = "<Publication_MarketDocument><TimeSeries>...</TimeSeries></Publication_MarketDocument>"
+    ACK_XML = "<Acknowledgement_MarketDocument><Reason><code>999</code></Reason></Acknowledgement_MarketDocument>"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.start = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+        self.end = self.start + timedelta(hours=25)
+
+    def test_expiry_follows_publication(self):
+        """Published prices live until the window ends, acknowledgements only briefly."""
+        cache = EntsoeResponseCache(self.tmp.name)
+        now = self.start
+        cache.put("FI", self.start, self.end, self.PRICES_XML, now=now)
+        cache.put("SE3", self.start, self.end, self.ACK_XML, now=now)
+
+        later = now + timedelta(hours=2)
+        self.assertEqual(cache.get("FI", self.start, self.end, now=later), self.PRICES_XML)
+        self.assertIsNone(cache.get("SE3", self.start, self.end, now=later))
+        self.assertIsNone(cache.get("FI", self.start, self.end, now=self.end))
+
+    def test_one_download_per_window(self):
+        """Repeated fetches for the same window reuse the cached document."""
+        with override_settings(ENTSOE_CACHE_DIR=self.tmp.name), mock.patch(
+            "entsoe.EntsoeRawClient"
+        ) as client_class:
+            client_class.return_value.query_day_ahead_prices.return_value = self.PRICES_XML
+            with mock.patch("app.utils.entsoe_cache.TimeUtils.now_utc", return_value=self.start):
+                first = fetch_day_ahead_xml("key", "FI", self.start, self.end)
+                second = fetch_day_ahead_xml("key", "FI", self.start, self.end)
+        self.assertEqual(first, second)
+        self.assertEqual(client_class.return_value.query_day_ahead_prices.call_count, 1)
+
+
+def entsoe_xml(periods):
+    """Builds a day-ahead document from (start, end, resolution, curve_type, {position: price})."""
+    series = []
+    for start, end, resolution, curve_type, points in periods:
+        body = "".join(
+            f"<Point><position>{pos}</position><price.amount>{price}</price.amount></Point>"
+            for pos, price in points.items()
+        )
+        series.append(
+            f"<TimeSeries><curveType>{curve_type}</curveType><Period><timeInterval>"
+            f"<start>{start}</start><end>{end}</end></timeInterval>"
+            f"<resolution>{resolution}</resolution>{body}</Period></TimeSeries>"
+        )
+    return (
+        '<Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:3">'
+        + "".join(series)
+        + "</Publication_MarketDocument>"
+    )
+
+
+class EntsoeParserTest(SimpleTestCase):
+    """Tests for the streaming ENTSO-E parser."""
+
+    def test_a03_gaps_are_filled(self):
+        """Missing A03 positions repeat the previous price up to the period end."""
+        xml = entsoe_xml(
+            [("2026-01-01T23:00Z", "2026-01-02T00:00Z", "PT15M", "A03", {1: 10.5, 3: 12.0})]
+        )
+        series = parse_day_ahead(xml).series[15]
+        self.assertEqual(series.prices.tolist(), [10.5, 10.5, 12.0, 12.0])
+        self.assertEqual(str(series.timestamps[1]), "2026-01-01T23:15:00")
+
+    def test_matches_entsoe_py(self):
+        """Prices and timestamps agree with entsoe-py's parse_prices."""
+        from entsoe.parsers import parse_prices
+
+        xml = entsoe_xml(
+            [
+                ("2026-01-01T23:00Z", "2026-01-02T23:00Z", "PT15M", "A03", {1: 1, 5: 2.5, 90: -0.4}),
+                ("2026-01-02T23:00Z", "2026-01-03T02:00Z", "PT60M", "A01", {1: 3, 2: 4, 3: 5}),
+            ]
+        )
+        document = parse_day_ahead(xml)
+        expected = parse_prices(xml)
+        for minutes, key in ((15, "15min"), (60, "60min")):
+            reference = expected.get(key)
+            if reference is None:
+                reference = expected[key.replace("min", "T")]
+            series = document.series[minutes]
+            self.assertEqual(series.prices.tolist(), reference.astype(float).tolist())
+            self.assertEqual(
+                [ts for ts, _ in series.items()],
+                [ts.to_pydatetime() for ts in reference.index],
+            )
+        split = document.series[60].to_resolution(15)
+        self.assertEqual(len(split), 12)
+        self.assertEqual(document.summary["time_series_count"], 2)
+
+
+class BiddingZoneFetchTest(TransactionTestCase):
+    """Tests for fetching several bidding zones in one price run."""
+
+    def test_zones_are_fetched_and_stored_separately(self):
+        """Each configured zone gets its own download and its own price rows."""
+        AppSetting.objects.update_or_create(key="ENTSOE_API_KEY", defaults={"value": "key"})
+        AppSetting.objects.update_or_create(key="ENTSOE_BIDDING_ZONES", defaults={"value": "FI,SE3"})
+        documents = {
+            BiddingZones.eic("FI"): entsoe_xml(
+                [("2026-01-01T23:00Z", "2026-01-02T00:00Z", "PT60M", "A01", {1: 100})]
+            ),
+            BiddingZones.eic("SE3"): entsoe_xml(
+                [("2026-01-01T23:00Z", "2026-01-02T00:00Z", "PT60M", "A01", {1: 20})]
+            ),
+        }
+        now = datetime(2026, 1, 1, 13, tzinfo=timezone.utc)
+
+        with mock.patch("app.utils.time_utils.TimeUtils.now_utc", return_value=now), mock.patch(
+            "app.price_views.fetch_day_ahead_xml",
+            side_effect=lambda key, area, start, end: documents[area],
+        ) as fetch, mock.patch("app.price_views.prices_changed") as changed, mock.patch(
+            "app.tasks.DeviceController.control_shelly_devices"
+        ) as control:
+            response = call_fetch_prices(None)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(changed.send.call_args.kwargs["zones"], ["FI", "SE3"])
+        control.assert_not_called()  # The control pass has its own trigger
+        payload = json.loads(response.content)
+        self.assertEqual(set(payload["zones"]), {"FI", "SE3"})
+        self.assertEqual(payload["stored"]["inserted"], 1)  # One hourly row, not four
+        self.assertEqual(
+            ElectricityPrice.objects.filter(bidding_zone="FI").first().price_kwh, Decimal("10.000")
+        )
+        self.assertEqual(
+            ElectricityPrice.objects.filter(bidding_zone="SE3").first().price_kwh, Decimal("2.000")
+        )
+
+
+class PriceBackfillTest(TransactionTestCase):
+    """Tests for the resumable price backfill command."""
+
+    def test_resumes_failed_chunks_only(self):
+        """A second run fetches only the month that failed in the first one."""
+        AppSetting.objects.update_or_create(key="ENTSOE_API_KEY", defaults={"value": "key"})
+        january = entsoe_xml([("2025-01-01T00:00Z", "2025-01-01T02:00Z", "PT60M", "A01", {1: 50, 2: 60})])
+        february = entsoe_xml([("2025-02-01T00:00Z", "2025-02-01T01:00Z", "PT60M", "A01", {1: 70})])
+        calls = []
+
+        def fetch(key, area, start, end, failing=True):
+            calls.append(start.month)
+            if start.month == 1 and failing:
+                raise requests.HTTPError("503 Server Error")
+            return january if start.month == 1 else february
+
+        args = ["backfill_prices", "--start", "2025-01-01", "--end", "2025-03-01", "--zone", "FI"]
+        with mock.patch("app.price_backfill.entsoe_rate_limiter"), mock.patch(
+            "app.price_backfill.fetch_day_ahead_xml", side_effect=fetch
+        ):
+            call_command(*args, stdout=io.StringIO())
+        self.assertEqual(sorted(calls), [1, 1, 1, 2])  # January retried MAX_ATTEMPTS times
+        chunks = dict(PriceBackfillChunk.objects.values_list("chunk_start__month", "status"))
+        self.assertEqual(chunks, {1: "failed", 2: "done"})
+
+        calls.clear()
+        output = io.StringIO()
+        with mock.patch("app.price_backfill.entsoe_rate_limiter"), mock.patch(
+            "app.price_backfill.fetch_day_ahead_xml",
+            side_effect=lambda *a: fetch(*a, failing=False),
+        ):
+            call_command(*args, stdout=output)
+        self.assertEqual(calls, [1])
+        self.assertIn("rows/s", output.getvalue())
+        self.assertEqual(ElectricityPrice.objects.count(), 3)  # 3 hourly prices, one row each
+        self.assertFalse(PriceBackfillChunk.objects.exclude(status="done").exists())
+
+    def test_chunk_keeps_every_resolution(self):
+        """A month switching from hourly to 15-minute prices keeps both, without overlap."""
+        xml = entsoe_xml(
+            [
+                ("2025-09-30T20:00Z", "2025-09-30T23:00Z", "PT60M", "A01", {1: 40, 2: 50, 3: 60}),
+                ("2025-09-30T22:00Z", "2025-10-01T00:00Z", "PT15M", "A01", {i: 10 * i for i in range(1, 9)}),
+            ]
+        )
+        with mock.patch("app.price_backfill.entsoe_rate_limiter"), mock.patch(
+            "app.price_backfill.fetch_day_ahead_xml", return_value=xml
+        ):
+            rows = PriceBackfill.fetch_chunk(
+                "key",
+                "FI",
+                datetime(2025, 9, 1, tzinfo=timezone.utc),
+                datetime(2025, 10, 1, tzinfo=timezone.utc),
+            )
+        minutes = sorted(
+            (start.hour, start.minute, int((end - start).total_seconds() // 60)) for start, end, _ in rows
+        )
+        self.assertEqual(minutes[:2], [(20, 0, 60), (21, 0, 60)])  # 22:00 is covered by 15-minute prices
+        self.assertEqual(len(minutes), 10)
+        self.assertEqual(minutes[-1], (23, 45, 15))
+
+
+class WorkerImportTest(SimpleTestCase):
+    """Checks the import-time profile of a cold web worker."""
+
+    HEAVY_MODULES = ("pandas", "numpy", "entsoe")
+
+    def test_web_worker_skips_ingestion_dependencies(self):
+        """Loading the WSGI app, every view and the tasks module imports no heavy dependency."""
+        script = (
+            "from project.wsgi import application\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            "import app.tasks\n"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE="project.settings",
+                DJANGO_SQLITE_PATH=os.path.join(tmp, "empty.sqlite3"),  # No scheduler, no data
+                DJANGO_SECRET_KEY="import-profile",
+            )
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", script],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=120,
+            )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        # Lines look like "import time:  self [us] | cumulative | <indent>package"
+        imported = {
+            line.rsplit("|", 1)[-1].strip().split(".")[0]
+            for line in result.stderr.splitlines()
+            if line.startswith("import time:") and "|" in line
+        }
+        self.assertIn("django", imported)
+        self.assertEqual(sorted(imported & set(self.HEAVY_MODULES)), [])
+
+
+class PriceFetchPlannerTest(TestCase):
+    """Tests for publication-aware price fetch scheduling."""
+
+    def _price(self, start):
+        ElectricityPrice.objects.create(
+            start_time=start, end_time=start + timedelta(minutes=15), price_kwh=Decimal("1")
+        )
+
+    def test_next_run_follows_publication_and_backoff(self):
+        """Sleep until publication, retry with growing delays, then sleep until the next day."""
+        self._price(datetime(2026, 3, 10, 0, tzinfo=timezone.utc))
+        publication = datetime(2026, 3, 10, 12, tzinfo=timezone.utc)  # 13:00 CET
+        morning = datetime(2026, 3, 10, 8, tzinfo=timezone.utc)
+        self.assertEqual(PriceFetchPlanner.next_run_at(morning, ["FI"]), publication)
+        self.assertEqual(
+            PriceFetchPlanner.expected_local("FI", morning.date() + timedelta(days=1)).strftime("%H:%M"),
+            "14:00",
+        )
+
+        after = datetime(2026, 3, 10, 12, 30, tzinfo=timezone.utc)
+        self.assertEqual(PriceFetchPlanner.next_run_at(after, ["FI"]), after)
+        for minute in (0, 5):
+            PriceFetchAttempt.objects.create(
+                delivery_day=datetime(2026, 3, 11).date(),
+                attempt=1,
+                expected_at=publication,
+                started_at=publication + timedelta(minutes=minute),
+                outcome=PriceFetchAttempt.OUTCOME_NOT_PUBLISHED,
+            )
+        # Second failure: 5 * 2 minutes after the last attempt
+        retry_check = publication + timedelta(minutes=6)
+        self.assertEqual(
+            PriceFetchPlanner.next_run_at(retry_check, ["FI"]), publication + timedelta(minutes=15)
+        )
+
+        self._price(datetime(2026, 3, 11, 0, tzinfo=timezone.utc))
+        self.assertEqual(
+            PriceFetchPlanner.next_run_at(after, ["FI"]), publication + timedelta(days=1)
+        )
+
+    def test_attempt_records_latency_to_data(self):
+        """The attempt that stores the missing day records how late the data arrived."""
+        self._price(datetime(2026, 3, 10, 0, tzinfo=timezone.utc))
+        now = datetime(2026, 3, 10, 12, 20, tzinfo=timezone.utc)
+        with mock.patch("app.utils.time_utils.TimeUtils.now_utc", return_value=now), mock.patch(
+            "app.price_views.call_fetch_prices",
+            side_effect=lambda request: self._price(datetime(2026, 3, 11, 0, tzinfo=timezone.utc)),
+        ) as fetch, mock.patch("app.scheduler.schedule_price_fetch") as schedule:
+            attempt = PriceFetchPlanner.run_attempt()
+            PriceFetchPlanner.run_attempt()
+
+        fetch.assert_called_once()  # The second attempt finds nothing missing
+        self.assertEqual(attempt.outcome, PriceFetchAttempt.OUTCOME_PUBLISHED)
+        self.assertEqual(attempt.latency_to_data_seconds, 20 * 60)
+        self.assertEqual(
+            schedule.call_args.args[0], datetime(2026, 3, 11, 12, tzinfo=timezone.utc)
+        )
+
+    def test_no_data_yet_is_not_published_and_failures_still_reschedule(self):
+        """A source without prices is not an error, and a crashing attempt still queues the next one."""
+        now = datetime(2026, 3, 10, 12, 20, tzinfo=timezone.utc)
+        source = mock.Mock(fetch=mock.Mock(return_value=None))
+        with mock.patch("app.utils.time_utils.TimeUtils.now_utc", return_value=now), mock.patch(
+            "app.price_views.PriceSources.configured", return_value=source
+        ), mock.patch("app.scheduler.schedule_price_fetch") as schedule:
+            attempt = PriceFetchPlanner.run_attempt()
+            self.assertEqual(attempt.outcome, PriceFetchAttempt.OUTCOME_NOT_PUBLISHED)
+            self.assertEqual(attempt.error, "")
+
+            with mock.patch.object(
+                PriceFetchPlanner, "missing_zones", side_effect=OperationalError("database is locked")
+            ):
+                with self.assertRaises(OperationalError):
+                    PriceFetchPlanner.run_attempt()
+
+        self.assertEqual(schedule.call_count, 2)
+        self.assertEqual(schedule.call_args.args[0], now + timedelta(minutes=PriceFetchPlanner.RETRY_BASE_MINUTES))
+
+
+class PriceSourceTest(TestCase):
+    """Tests for the offline price sources and the replay driver."""
+
+    def test_file_source_keeps_hourly_rows_per_zone(self):
+        """Hourly CSV rows stay hourly; zone rows win over zone-less rows."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prices.csv")
+            with open(path, "w") as handle:
+                handle.write("start_time,price,bidding_zone\n")
+                handle.write("2025-01-01T00:00Z,10,\n2025-01-01T01:00Z,20,\n")
+                handle.write("2025-01-01T00:00Z,99,SE3\n2025-01-01T01:00Z,98,SE3\n")
+            source = FilePriceSource(path)
+            start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+            fi = source.fetch("FI", start, start + timedelta(hours=2))
+            se3 = source.fetch("SE3", start, start + timedelta(hours=1))
+
+        self.assertEqual(fi.minutes, 60)
+        self.assertEqual(fi.prices.tolist(), [10.0, 20.0])
+        self.assertEqual(se3.prices.tolist(), [99.0])
+
+    def test_synthetic_windows_agree(self):
+        """Overlapping windows of the synthetic source give identical prices."""
+        source = SyntheticPriceSource(seed=7)
+        start = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+        full = source.fetch("FI", start, start + timedelta(hours=25))
+        part = source.fetch("FI", start + timedelta(hours=13), start + timedelta(hours=14))
+        self.assertEqual(len(full), 100)
+        self.assertEqual(part.prices.tolist(), full.prices[52:56].tolist())
+
+    def test_replay_runs_pipeline_without_devices_contacted(self):
+        """A replayed day stores prices, assigns cheap periods and simulates commands."""
+        user = User.objects.create_user(username="replay", password="pass")
+        device = ShellyDevice.objects.create(
+            user=user,
+            familiar_name="Boiler",
+            shelly_api_key="key",
+            shelly_device_name="boiler",
+            shelly_server="https://shelly.invalid",
+            run_hours_per_day=2,
+            day_transfer_price=0,
+            night_transfer_price=0,
+            status=1,
+        )
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        with mock.patch("app.control_engine.AsyncControlEngine.run") as engine:
+            stats = PriceReplay.run(SyntheticPriceSource(), start, start + timedelta(days=1))
+
+        engine.assert_not_called()
+        self.assertEqual(stats.periods, 96)
+        self.assertEqual(stats.fetches, 2)  # Start of the replay and 14:00 Helsinki
+        self.assertGreater(stats.assignments_created, 0)
+        self.assertIsNotNone(DeviceStateManager.get_state(device))
+        self.assertGreater(TimeUtils.now_utc().year, 2025)  # Wall clock restored
+
+
+class PricePipelineTest(TestCase):
+    """Tests for the independent fetch, replanning and control stages."""
+
+    def test_control_runs_while_fetch_overruns(self):
+        """A fetch stuck past its budget skips its own triggers but never delays control."""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        fetch = PipelineStage("price_fetch", timeout_seconds=0.05)
+        control = PipelineStage("control", timeout_seconds=5)
+        calls = []
+
+        self.assertFalse(fetch.run(release.wait))  # Overran its budget, keeps running
+        self.assertFalse(fetch.run(calls.append, "fetch"))  # Next trigger skipped
+        self.assertTrue(control.run(calls.append, "control"))
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while not fetch.run(calls.append, "fetch") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(calls, ["control", "fetch"])
+
+    def test_price_change_triggers_replanning(self):
+        """prices_changed starts the replanning stage."""
+        with mock.patch.object(PipelineStage, "inline", True), mock.patch(
+            "app.price_views.set_cheapest_hours"
+        ) as cheapest:
+            prices_changed.send(sender=PriceStore, zones=["FI"])
+        cheapest.assert_called_once()
+
+
+class CheapestSlotPlannerTest(SimpleTestCase):
+    """Tests for the fleet-wide cheapest period selection."""
+
+    def test_fleet_selection_matches_per_device_sort(self):
+        """Each matrix row equals sorting that device's own totals, plus threshold periods."""
+        tz = pytz.timezone("Europe/Helsinki")
+        start = datetime(2026, 1, 1, 22, tzinfo=timezone.utc)
+        # Distinct totals, so the selection has no ties
+        prices = [Decimal(i * 7919 % 997) / 100 + Decimal(i) / 100000 for i in range(192)]
+        horizon = PriceHorizon(
+            [start + timedelta(minutes=15 * i) for i in range(192)], prices, [15] * 192, tz
+        )
+        devices = [(Decimal("3.0"), Decimal("1.5"), 4, None), (Decimal("0"), Decimal("9.9"), 1, Decimal("1.0"))]
+        selected = CheapestSlotPlanner.select(horizon, *zip(*devices))
+
+        for row, (day, night, hours, threshold) in zip(selected, devices):
+            totals = [
+                price + (day if horizon.daytime[i] else night) for i, price in enumerate(prices)
+            ]
+            ranked = sorted(range(192), key=lambda i: (totals[i], i))
+            expected = set(ranked[: hours * 4])
+            expected |= {i for i in range(192) if threshold is not None and totals[i] <= threshold}
+            self.assertEqual(set(row.nonzero()[0].tolist()), expected)
+
+    def test_mixed_resolutions_cover_run_hours(self):
+        """Hourly periods count for four quarters when covering the run hours."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        horizon = PriceHorizon(
+            [start, start + timedelta(hours=1), start + timedelta(hours=1, minutes=15)],
+            [1, 2, 3],
+            [60, 15, 15],
+            pytz.utc,
+        )
+        selected = CheapestSlotPlanner.select(horizon, [0], [0], [1], [None])
+        self.assertEqual(selected[0].tolist(), [True, False, False])
+
+
+class ScheduleSolverTest(SimpleTestCase):
+    """Tests for planning devices in run blocks."""
+
+    def test_runs_match_exhaustive_search(self):
+        """One hour as two 30-minute runs at most 30 minutes apart and from the start, at the lowest cost."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        for seed in range(20):
+            prices = [(seed * 31 + i * 17) % 13 - 2 for i in range(12)]
+            horizon = PriceHorizon(
+                [start + timedelta(minutes=15 * i) for i in range(12)], prices, [15] * 12, pytz.utc
+            )
+            selected = ScheduleSolver.select(horizon, [0], [0], [1], [None], [30], [30], [2])[0]
+
+            best = min(
+                prices[first] + prices[first + 1] + prices[second] + prices[second + 1]
+                for first in range(3)  # At most 30 minutes off before the first run
+                for second in range(first + 2, min(first + 5, 11))
+            )
+            on = selected.nonzero()[0].tolist()
+            self.assertEqual(len(on), 4)
+            self.assertEqual(sum(prices[i] for i in on), best)
+            runs = [i for i in on if i - 1 not in on]
+            self.assertLessEqual(len(runs), 2)
+            self.assertTrue(all(on.index(i) % 2 == 0 for i in runs))  # Runs of two quarters
+            self.assertLessEqual(on[-1] - on[0] + 1, 4 + 2)
+
+    def test_switch_limit_keeps_run_contiguous(self):
+        """Alternating prices give the cheapest mode many runs and the solver one."""
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        prices = [9, 1, 9, 1, 9, 1, 9, 1, 2, 2, 2, 2, 9, 1, 9, 1]
+        horizon = PriceHorizon(
+            [start + timedelta(minutes=15 * i) for i in range(16)], prices, [15] * 16, pytz.utc
+        )
+        cheapest = CheapestSlotPlanner.select(horizon, [0], [0], [1], [None])[0]
+        blocks = ScheduleSolver.select(horizon, [0], [0], [1], [None], [60], [None], [1])[0]
+
+        self.assertEqual(cheapest.nonzero()[0].tolist(), [1, 3, 5, 7])
+        self.assertEqual(blocks.nonzero()[0].tolist(), [7, 8, 9, 10])
+
+
+class JointOptimizerTest(SimpleTestCase):
+    """Tests for fitting a site's plans under its power cap."""
+
+    def test_moves_cheapest_device_and_keeps_fixed_loads(self):
+        """The device losing least moves to a free period; fixed loads stay where they are."""
+        costs = np.array([[1, 5, 2, 9], [1, 3, 8, 9], [1, 1, 1, 1]])
+        selected = np.array([[True, False, False, False], [True, False, False, False], [True, False, False, False]])
+
+        fitted, moved, dropped = JointOptimizer.fit_to_cap(
+            costs, selected, [1000, 1000, 1000], 2000, [True, True, False], [15] * 4
+        )
+
+        self.assertEqual((moved, dropped), (1, 0))
+        self.assertEqual(fitted.tolist(), [
+            [False, False, True, False],  # 2 - 1 is the smallest extra cost
+            [True, False, False, False],
+            [True, False, False, False],
+        ])
+
+
+class SetCheapestHoursTest(TestCase):
+    """Tests for writing the planned assignments."""
+
+    def _devices(self, user, count):
+        return [
+            ShellyDevice.objects.create(
+                familiar_name=f"device-{i}",
+                shelly_api_key="token",
+                user=user,
+                run_hours_per_day=2,
+                day_transfer_price=0,
+                night_transfer_price=0,
+            )
+            for i in range(count)
+        ]
+
+    def test_query_count_does_not_grow_with_the_fleet(self):
+        """Assignments are written with a fixed number of queries and never duplicated."""
+        user = User.objects.create(username="fleet")
+        now = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+        PriceStore.upsert_prices(
+            (now + timedelta(minutes=15 * i), now + timedelta(minutes=15 * (i + 1)), 1 + i % 7)
+            for i in range(96)
+        )
+        self._devices(user, 3)
+
+        with mock.patch("app.utils.time_utils.TimeUtils.now_utc", return_value=now):
+            with CaptureQueriesContext(connection) as small_fleet:
+                set_cheapest_hours()
+            self._devices(user, 10)
+            with CaptureQueriesContext(connection) as large_fleet:
+                set_cheapest_hours()
+            set_cheapest_hours()
+
+        self.assertEqual(len(small_fleet.captured_queries), len(large_fleet.captured_queries))
+        # 2 hours of 15-minute periods per device, 1 hour for the user's demo device
+        self.assertEqual(DeviceAssignment.objects.filter(user=user).count(), 13 * 8 + 4)
+
+    def test_device_change_replans_only_that_device(self):
+        """Saving new plan inputs replans the device; unchanged devices and manual assignments stay."""
+        user = User.objects.create(username="changes")
+        now = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+        PriceStore.upsert_prices(
+            (now + timedelta(minutes=15 * i), now + timedelta(minutes=15 * (i + 1)), 1 + i % 7)
+            for i in range(96)
+        )
+        device, other = self._devices(user, 2)
+
+        with mock.patch("app.utils.time_utils.TimeUtils.now_utc", return_value=now):
+            set_cheapest_hours()
+            manual_price = ElectricityPrice.objects.order_by("-price_kwh", "-start_time").first()
+            DeviceAssignment.objects.create(user=user, device=device, electricity_price=manual_price)
+            other_assignments = set(
+                DeviceAssignment.objects.filter(device=other).values_list("id", flat=True)
+            )
+
+            device.refresh_from_db()
+            device.run_hours_per_day = 4
+            with self.captureOnCommitCallbacks(execute=True):
+                device.save()
+            device.refresh_from_db()
+            self.assertEqual(device.plan_version, 2)
+            self.assertEqual(
+                DeviceAssignment.objects.filter(device=device, source=DeviceAssignment.SOURCE_PLANNER).count(), 16
+            )
+
+            device.familiar_name = "renamed"
+            with self.captureOnCommitCallbacks(execute=True):
+                device.save()
+            device.refresh_from_db()
+            self.assertEqual(device.plan_version, 2)
+
+            device.run_hours_per_day = 1
+            with self.captureOnCommitCallbacks(execute=True):
+                device.save()
+
+        self.assertEqual(
+            DeviceAssignment.objects.filter(device=device, source=DeviceAssignment.SOURCE_PLANNER).count(), 4
+        )
+        self.assertTrue(DeviceAssignment.objects.filter(device=device, electricity_price=manual_price).exists())
+        self.assertEqual(
+            set(DeviceAssignment.objects.filter(device=other).values_list("id", flat=True)), other_assignments
+        )
+        self.assertEqual(ShellyDevice.objects.get(pk=other.pk).plan_version, 1)
+
+    def test_site_power_cap_spreads_devices(self):
+        """Devices of a capped site never draw more than the cap together and keep their run time."""
+        user = User.objects.create(username="capped")
+        user.profile.site_power_cap_w = 5000
+        user.profile.save()
+        now = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+        PriceStore.upsert_prices(
+            (now + timedelta(minutes=15 * i), now + timedelta(minutes=15 * (i + 1)), 1 + i % 7)
+            for i in range(96)
+        )
+        devices = self._devices(user, 3)
+        ShellyDevice.objects.filter(pk__in=[device.pk for device in devices]).update(rated_power_w=2000)
+
+        with mock.patch("app.utils.time_utils.TimeUtils.now_utc", return_value=now):
+            set_cheapest_hours()
+
+        periods = {}
+        for price_id, power in DeviceAssignment.objects.filter(user=user).values_list(
+            "electricity_price_id", "device__rated_power_w"
+        ):
+            periods[price_id] = periods.get(price_id, 0) + (power or 0)
+        self.assertLessEqual(max(periods.values()), 5000)
+        for device in devices:
+            self.assertEqual(DeviceAssignment.objects.filter(device=device).count(), 8)
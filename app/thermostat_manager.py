@@ -22,15 +22,13 @@ class ThermostatAssignmentManager:
         next_start = current_start + timedelta(minutes=15)
         next_end = next_start + timedelta(minutes=15)
 
-        next_price = (
-            ElectricityPrice.objects.filter(
-                start_time__gte=next_start,
-                start_time__lt=next_end,
-            )
-            .order_by("start_time")
-            .first()
-        )
-        if not next_price:
+        # The price covering the next period, one per bidding zone (an hourly
+        # price covers all four periods of its hour)
+        next_prices = {
+            price.bidding_zone: price
+            for price in ElectricityPrice.objects.covering(next_start)
+        }
+        if not next_prices:
             log_device_event(
                 None,
                 f"No electricity price found for next period {next_start} to {next_end}",
@@ -50,6 +48,10 @@ class ThermostatAssignmentManager:
             if (now - thermostat.temperature_updated_at) > timedelta(minutes=15):
                 continue
 
+            next_price = next_prices.get(device.bidding_zone)
+            if not next_price:
+                continue
+
             current_temp = thermostat.current_temperature
             min_temp = thermostat.min_temperature
             max_temp = thermostat.max_temperature
@@ -62,6 +64,7 @@ class ThermostatAssignmentManager:
                     user=device.user,
                     device=device,
                     electricity_price=next_price,
+                    defaults={"source": DeviceAssignment.SOURCE_THERMOSTAT},
                 )
                 if created:
                     log_device_event(
@@ -2,7 +2,7 @@
 
 from django.urls import path
 from . import views
-from .shelly_views import fetch_device_status, toggle_device_output
+from .shelly_views import fetch_device_status, toggle_device_output, shelly_health
 from .price_views import call_fetch_prices
 from .graph_views import graphs, get_graph_data
 from django.contrib.auth import views as auth_views
@@ -15,6 +15,9 @@ urlpatterns = [
     path(
         "toggle-device-output/", toggle_device_output, name="toggle_device_output"
     ),  # page to toggle shelly device output on / off]
+    path(
+        "shelly-health/", shelly_health, name="shelly_health"
+    ),  # Staff JSON endpoint with per-account Shelly Cloud health
     path(
         "fetch-prices/", call_fetch_prices, name="fetch_prices"
     ),  # fetch electricity prices
@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from .rate_limiter import server_token_key
+
+
+class _KeyHealth:
+    """Breaker state and rolling request samples for one server+token combination."""
+
+    def __init__(self, server_url: str, window_size: int):
+        self.server_url = server_url
+        self.state = CircuitBreaker.CLOSED
+        self.consecutive_failures = 0
+        self.reopen_count = 0  # Failed probes since the breaker last closed
+        self.opened_at = None
+        self.next_probe_at = None
+        self.probe_started_at = None
+        self.rejected = 0
+        self.samples = deque(maxlen=window_size)  # (monotonic time, latency seconds, ok)
+        self.lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per server+token combination for Shelly Cloud calls.
+    CLOSED lets every request through. Too many consecutive failures, or a high
+    error rate over the rolling window, OPEN the circuit and requests fail fast.
+    After open_seconds one probe request is let through (HALF_OPEN): success
+    closes the circuit, failure opens it again with a doubled wait.
+    Rate limiting (429) is not a failure here; the rate limiter handles it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 600.0,
+        window_seconds: float = 900.0,
+        window_size: int = 200,
+    ):
+        self.failure_threshold = failure_threshold  # Consecutive failures that open the circuit
+        self.error_rate_threshold = error_rate_threshold  # Error rate that opens the circuit
+        self.min_samples = min_samples  # Samples needed before the error rate counts
+        self.open_seconds = open_seconds  # Wait before the first probe
+        self.max_open_seconds = max_open_seconds
+        self.window_seconds = window_seconds  # Rolling window for stats and error rate
+        self.window_size = window_size
+        self._health: Dict[str, _KeyHealth] = {}
+        self.lock = threading.Lock()  # Only guards creation of entries
+
+    def _entry(self, server_url: str, auth_key: str) -> _KeyHealth:
+        key = server_token_key(server_url, auth_key)
+        health = self._health.get(key)
+        if health is None:
+            with self.lock:
+                health = self._health.get(key)
+                if health is None:
+                    health = _KeyHealth(server_url, self.window_size)
+                    self._health[key] = health
+        return health
+
+    def _recent(self, health: _KeyHealth, now: float) -> list:
+        return [s for s in health.samples if now - s[0] <= self.window_seconds]
+
+    def _open(self, health: _KeyHealth, now: float) -> None:
+        wait = min(self.open_seconds * (2 ** health.reopen_count), self.max_open_seconds)
+        health.state = self.OPEN
+        health.opened_at = now
+        health.next_probe_at = now + wait
+        health.probe_started_at = None
+
+    def is_open(self, server_url: str, auth_key: str) -> bool:
+        """True when a request would be rejected right now (does not start a probe)."""
+        health = self._entry(server_url, auth_key)
+        now = time.monotonic()
+        with health.lock:
+            if health.state == self.OPEN:
+                return now < health.next_probe_at
+            if health.state == self.HALF_OPEN:
+                return not self._probe_expired(health, now)
+            return False
+
+    def _probe_expired(self, health: _KeyHealth, now: float) -> bool:
+        # A probe that never reported back must not block the key forever
+        return health.probe_started_at is None or now - health.probe_started_at > self.open_seconds
+
+    def allow_request(self, server_url: str, auth_key: str) -> bool:
+        """
+        Returns True when a request may be sent. When the open period has passed,
+        exactly one caller gets True and becomes the half-open probe.
+        """
+        health = self._entry(server_url, auth_key)
+        now = time.monotonic()
+        with health.lock:
+            if health.state == self.CLOSED:
+                return True
+            if health.state == self.OPEN and now >= health.next_probe_at:
+                health.state = self.HALF_OPEN
+                health.probe_started_at = now
+                return True
+            if health.state == self.HALF_OPEN and self._probe_expired(health, now):
+                health.probe_started_at = now
+                return True
+            health.rejected += 1
+            return False
+
+    def record_success(self, server_url: str, auth_key: str, latency: float = 0.0) -> None:
+        """Record a successful request; a successful probe closes the circuit."""
+        health = self._entry(server_url, auth_key)
+        with health.lock:
+            health.samples.append((time.monotonic(), latency, True))
+            health.consecutive_failures = 0
+            if health.state != self.CLOSED:
+                health.state = self.CLOSED
+                health.reopen_count = 0
+                health.opened_at = None
+                health.next_probe_at = None
+                health.probe_started_at = None
+
+    def record_failure(self, server_url: str, auth_key: str, latency: float = 0.0) -> None:
+        """Record a failed request and open the circuit when the key looks unhealthy."""
+        health = self._entry(server_url, auth_key)
+        now = time.monotonic()
+        with health.lock:
+            health.samples.append((now, latency, False))
+            health.consecutive_failures += 1
+
+            if health.state == self.HALF_OPEN:
+                health.reopen_count += 1
+                self._open(health, now)
+                return
+            if health.state == self.OPEN:
+                return
+
+            recent = self._recent(health, now)
+            errors = sum(1 for s in recent if not s[2])
+            error_rate = errors / len(recent) if recent else 0.0
+            if health.consecutive_failures >= self.failure_threshold or (
+                len(recent) >= self.min_samples and error_rate >= self.error_rate_threshold
+            ):
+                self._open(health, now)
+
+    def stats(self) -> Dict[str, dict]:
+        """Rolling latency and error statistics per server+token key."""
+        with self.lock:
+            entries = dict(self._health)
+        now = time.monotonic()
+        result = {}
+        for key, health in entries.items():
+            with health.lock:
+                recent = self._recent(health, now)
+                latencies = sorted(s[1] for s in recent)
+                errors = sum(1 for s in recent if not s[2])
+                retry_in = (
+                    max(0.0, health.next_probe_at - now)
+                    if health.state == self.OPEN
+                    else None
+                )
+                result[key] = {
+                    "server": health.server_url,
+                    "state": health.state,
+                    "requests": len(recent),
+                    "errors": errors,
+                    "error_rate": round(errors / len(recent), 3) if recent else 0.0,
+                    "latency_avg_ms": (
+                        round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None
+                    ),
+                    "latency_p95_ms": (
+                        round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1)
+                        if latencies
+                        else None
+                    ),
+                    "consecutive_failures": health.consecutive_failures,
+                    "rejected": health.rejected,
+                    "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+                }
+        return result
+
+    def reset(self) -> None:
+        """Forget all state (used by tests)."""
+        with self.lock:
+            self._health.clear()
+
+
+# Global circuit breaker shared by all Shelly Cloud requests in this process
+shelly_circuit_breaker = CircuitBreaker()
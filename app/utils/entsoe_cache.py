@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+
+from .time_utils import TimeUtils
+
+
+class EntsoeResponseCache:
+    """
+    Content-addressed on-disk cache of raw ENTSO-E XML documents.
+    An index entry per (area, start, end, resolution) points at the SHA-256 of the
+    document stored under objects/, so identical documents are stored once.
+    A document with prices stays valid until its window ends, since day-ahead
+    prices do not change once published. An acknowledgement without prices (not
+    published yet) expires after RETRY_SECONDS so the next run asks again.
+    """
+
+    RETRY_SECONDS = 10 * 60
+
+    def __init__(self, cache_dir: str = None):
+        self._cache_dir = cache_dir  # None follows settings.ENTSOE_CACHE_DIR
+        self.lock = threading.Lock()
+
+    @property
+    def cache_dir(self) -> Path:
+        return Path(self._cache_dir or settings.ENTSOE_CACHE_DIR)
+
+    @staticmethod
+    def request_key(area: str, start, end, resolution: str = "any") -> str:
+        """Stable key for one request window."""
+        raw = f"{area}|{TimeUtils.to_utc(start).isoformat()}|{TimeUtils.to_utc(end).isoformat()}|{resolution}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def has_prices(content: str) -> bool:
+        """False for acknowledgement documents that carry no TimeSeries."""
+        return "TimeSeries" in content and "Acknowledgement_MarketDocument" not in content
+
+    def _index_path(self, key: str) -> Path:
+        return self.cache_dir / "index" / f"{key}.json"
+
+    def _object_path(self, digest: str) -> Path:
+        return self.cache_dir / "objects" / f"{digest}.xml"
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get(self, area: str, start, end, resolution: str = "any", now=None) -> Optional[str]:
+        """Returns the cached document for the window, or None when missing or expired."""
+        index_path = self._index_path(self.request_key(area, start, end, resolution))
+        try:
+            entry = json.loads(index_path.read_text())
+            if datetime.fromisoformat(entry["expires_at"]) <= (now or TimeUtils.now_utc()):
+                return None
+            return self._object_path(entry["sha256"]).read_bytes().decode("utf-8")
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, area: str, start, end, content: str, resolution: str = "any", now=None) -> datetime:
+        """Stores a document and returns when its index entry expires."""
+        now = now or TimeUtils.now_utc()
+        if self.has_prices(content):
+            expires_at = max(TimeUtils.to_utc(end), now + timedelta(seconds=self.RETRY_SECONDS))
+        else:
+            expires_at = now + timedelta(seconds=self.RETRY_SECONDS)
+
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        entry = {
+            "area": area,
+            "start": TimeUtils.to_utc(start).isoformat(),
+            "end": TimeUtils.to_utc(end).isoformat(),
+            "resolution": resolution,
+            "sha256": digest,
+            "fetched_at": now.isoformat(),
+            "expires_at": expires_at.isoformat(),
+        }
+        with self.lock:
+            object_path = self._object_path(digest)
+            if not object_path.exists():
+                self._write_atomic(object_path, data)
+            self._write_atomic(
+                self._index_path(self.request_key(area, start, end, resolution)),
+                json.dumps(entry).encode(),
+            )
+            self.purge_expired(now)
+        return expires_at
+
+    def purge_expired(self, now=None) -> int:
+        """Removes expired index entries and documents no entry refers to."""
+        now = now or TimeUtils.now_utc()
+        removed = 0
+        referenced = set()
+        for index_path in (self.cache_dir / "index").glob("*.json"):
+            try:
+                entry = json.loads(index_path.read_text())
+                if datetime.fromisoformat(entry["expires_at"]) > now:
+                    referenced.add(entry["sha256"])
+                    continue
+            except (OSError, ValueError, KeyError):
+                pass
+            index_path.unlink(missing_ok=True)
+            removed += 1
+        for object_path in (self.cache_dir / "objects").glob("*.xml"):
+            if object_path.stem not in referenced:
+                object_path.unlink(missing_ok=True)
+        return removed
+
+
+# Shared cache used by the price fetch
+entsoe_response_cache = EntsoeResponseCache()
@@ -0,0 +1,141 @@
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+
+class _ServerCounters:
+    """Request and connection counters for one server."""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.lock = threading.Lock()
+
+    def add_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def add_connection(self):
+        with self.lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": max(0, self.requests - self.new_connections),
+            }
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests and newly opened TCP/TLS connections."""
+
+    def __init__(self, counters: _ServerCounters, **kwargs):
+        self.counters = counters
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        counters = self.counters
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                counters.add_connection()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                counters.add_connection()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        self.counters.add_request()
+        return super().send(request, **kwargs)
+
+
+class HttpSessionPool:
+    """
+    Process-wide pool of keep-alive requests.Session objects keyed by server URL.
+    Sessions keep TCP+TLS connections open between status polls and relay commands,
+    and retry connection errors at the transport level. Error responses are not
+    retried here: the caller's retries go through the rate limiter and the
+    circuit breaker, which a transport retry would bypass.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 4,
+        pool_maxsize: int = 32,
+        connect_retries: int = 2,
+        backoff_factor: float = 0.3,
+    ):
+        self.pool_connections = pool_connections  # Host pools cached per session
+        self.pool_maxsize = pool_maxsize  # Keep-alive connections kept per host
+        self.connect_retries = connect_retries
+        self.backoff_factor = backoff_factor
+        self._sessions: Dict[str, requests.Session] = {}
+        self._counters: Dict[str, _ServerCounters] = {}
+        self.lock = threading.Lock()
+
+    def _build_retry(self) -> Retry:
+        return Retry(
+            total=self.connect_retries,
+            connect=self.connect_retries,
+            read=0,
+            status=0,
+            backoff_factor=self.backoff_factor,
+            raise_on_status=False,
+        )
+
+    def get_session(self, server_url: str) -> requests.Session:
+        """Return the shared session for a server, creating it on first use."""
+        session = self._sessions.get(server_url)
+        if session is not None:
+            return session
+
+        with self.lock:
+            session = self._sessions.get(server_url)
+            if session is None:
+                counters = _ServerCounters()
+                adapter = _CountingAdapter(
+                    counters,
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=self._build_retry(),
+                )
+                session = requests.Session()
+                session.headers.update({"Connection": "keep-alive"})
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._counters[server_url] = counters
+                self._sessions[server_url] = session
+        return session
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-server request, new connection and reused connection counters."""
+        with self.lock:
+            counters = dict(self._counters)
+        return {server: c.snapshot() for server, c in counters.items()}
+
+    def close_all(self) -> None:
+        """Close every pooled session (used by tests and on shutdown)."""
+        with self.lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._counters.clear()
+        for session in sessions:
+            session.close()
+
+
+# Global session pool shared by all Shelly services in this process
+shelly_session_pool = HttpSessionPool()
@@ -1,78 +1,159 @@
-import time
-from datetime import datetime, timedelta
-from typing import Dict, List
+import asyncio
+import hashlib
 import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+
+def server_token_key(server_url: str, auth_key: str) -> str:
+    """Generate a unique key for server+token combination."""
+    # Hash the auth_key for privacy but keep it deterministic
+    key_hash = hashlib.md5((auth_key or "").encode()).hexdigest()[:8]
+    return f"{server_url}:{key_hash}"
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds."""
+    if value is None or value == "":
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _TokenBucket:
+    """Token state for one server+token combination."""
+
+    __slots__ = ("tokens", "updated", "failures", "blocked_until", "lock")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now  # May lie in the future while a Retry-After block is active
+        self.failures = 0
+        self.blocked_until = 0.0  # Monotonic end of the last Retry-After block
+        self.lock = threading.Lock()
+
 
 class RateLimiter:
     """
-    Advanced rate limiter for Shelly API calls.
-    Implements adaptive rate limiting with exponential backoff and request tracking.
-    Rate limiting is per server+token combination - different combinations can run in parallel.
+    Token-bucket rate limiter for Shelly API calls.
+    Each server+token combination has its own bucket and lock, so a caller waiting
+    for one key never holds up callers of another key. A slot is reserved under a
+    short lock and the caller sleeps outside it. Tokens may go negative: every
+    reservation queues behind the previous ones for the same key.
+    Consecutive failures slow the refill rate with exponential backoff and a 429
+    Retry-After pauses the bucket until the server allows new requests; callers
+    whose reserved slot falls inside the pause reserve again when they wake.
     """
-    def __init__(self):
-        self.last_request: Dict[str, datetime] = {}
-        self.failed_requests: Dict[str, int] = {}  # Track consecutive failures
-        self.base_delay = 1.1  # Base delay in seconds per server+token combination (1.1s to be safe with 1s API limit)
-        self.max_delay = 30.0  # Maximum delay between requests
-        self.lock = threading.Lock()
+
+    def __init__(self, base_delay: float = 1.1, burst: int = 1, max_delay: float = 30.0):
+        self.base_delay = base_delay  # Seconds per token (1.1s to be safe with 1s API limit)
+        self.burst = burst  # Requests allowed back-to-back after an idle period
+        self.max_delay = max_delay  # Maximum delay between requests while backing off
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.lock = threading.Lock()  # Only guards creation of buckets
 
     def _get_server_token_key(self, server_url: str, auth_key: str) -> str:
-        """Generate a unique key for server+token combination."""
-        # Hash the auth_key for privacy but keep it deterministic
-        import hashlib
-        key_hash = hashlib.md5(auth_key.encode()).hexdigest()[:8]
-        return f"{server_url}:{key_hash}"
-    
-    def _get_wait_time(self, server_token_key: str, current_time: datetime) -> float:
-        """Calculate the time to wait before next request using exponential backoff."""
-        if server_token_key not in self.last_request:
-            return 0  # No delay for first request to this server+token combination
-
-        elapsed = (current_time - self.last_request[server_token_key]).total_seconds()
-        failures = self.failed_requests.get(server_token_key, 0)
-        
-        # Calculate delay with exponential backoff
-        if failures > 0:
-            delay = min(self.base_delay * (2 ** failures), self.max_delay)
-        else:
-            delay = self.base_delay
-
-        if elapsed < delay:
-            return delay - elapsed
-        return 0
-
-    def wait_if_needed(self, server_url: str, auth_key: str):
+        return server_token_key(server_url, auth_key)
+
+    def _bucket(self, server_url: str, auth_key: str) -> _TokenBucket:
+        key = server_token_key(server_url, auth_key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self.lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = _TokenBucket(self.burst, time.monotonic())
+                    self._buckets[key] = bucket
+        return bucket
+
+    def _delay_for(self, bucket: _TokenBucket) -> float:
+        """Seconds per token, including exponential backoff after failures."""
+        if bucket.failures > 0:
+            return min(self.base_delay * (2 ** bucket.failures), self.max_delay)
+        return self.base_delay
+
+    def reserve(self, server_url: str, auth_key: str) -> float:
+        """
+        Reserve the next request slot for a server+token combination.
+        Returns how many seconds the caller must wait before sending the request.
+        """
+        bucket = self._bucket(server_url, auth_key)
+        with bucket.lock:
+            now = time.monotonic()
+            delay = self._delay_for(bucket)
+            if now > bucket.updated:
+                bucket.tokens = min(
+                    self.burst, bucket.tokens + (now - bucket.updated) / delay
+                )
+                bucket.updated = now
+            bucket.tokens -= 1
+            wait_time = (bucket.updated - now) + max(0.0, -bucket.tokens) * delay
+        return max(0.0, wait_time)
+
+    def is_blocked(self, server_url: str, auth_key: str) -> bool:
+        """True while a Retry-After pause is active for the server+token combination."""
+        return time.monotonic() < self._bucket(server_url, auth_key).blocked_until
+
+    def wait_if_needed(self, server_url: str, auth_key: str) -> float:
         """
-        Wait if necessary using adaptive rate limiting per server+token combination.
-        Different server+token combinations can run in parallel without waiting.
+        Wait if necessary using the server+token bucket.
+        Different server+token combinations never wait for each other.
         Returns the required wait time in seconds.
         """
-        with self.lock:
-            current_time = datetime.now()
-            server_token_key = self._get_server_token_key(server_url, auth_key)
-            
-            wait_time = self._get_wait_time(server_token_key, current_time)
-            
+        waited = 0.0
+        while True:
+            wait_time = self.reserve(server_url, auth_key)
             if wait_time > 0:
                 time.sleep(wait_time)
-                current_time = datetime.now()
-            
-            # Update last request time for this server+token combination
-            self.last_request[server_token_key] = current_time
-                
-            return wait_time
-
-    def record_failure(self, server_url: str, auth_key: str):
-        """Record a failed request to increase backoff time for this server+token combination."""
-        with self.lock:
-            server_token_key = self._get_server_token_key(server_url, auth_key)
-            self.failed_requests[server_token_key] = self.failed_requests.get(server_token_key, 0) + 1
+                waited += wait_time
+            if not self.is_blocked(server_url, auth_key):
+                return waited
+
+    async def async_wait_if_needed(self, server_url: str, auth_key: str) -> float:
+        """Awaitable variant of wait_if_needed that does not block the event loop."""
+        waited = 0.0
+        while True:
+            wait_time = self.reserve(server_url, auth_key)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+                waited += wait_time
+            if not self.is_blocked(server_url, auth_key):
+                return waited
+
+    def record_failure(self, server_url: str, auth_key: str, retry_after=None):
+        """
+        Record a failed request to increase backoff time for this server+token combination.
+        When the server sent Retry-After, no tokens are handed out before that moment.
+        """
+        bucket = self._bucket(server_url, auth_key)
+        retry_seconds = parse_retry_after(retry_after)
+        with bucket.lock:
+            bucket.failures += 1
+            if retry_seconds is not None:
+                # Slots reserved earlier are dropped from the queue; their callers see
+                # blocked_until when they wake inside the pause and reserve again
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_seconds)
+                bucket.updated = max(bucket.updated, bucket.blocked_until)
+                bucket.tokens = 1.0
 
     def record_success(self, server_url: str, auth_key: str):
         """Record a successful request to reset backoff time for this server+token combination."""
-        with self.lock:
-            server_token_key = self._get_server_token_key(server_url, auth_key)
-            self.failed_requests[server_token_key] = 0
+        bucket = self._bucket(server_url, auth_key)
+        with bucket.lock:
+            bucket.failures = 0
+
 
 # Global rate limiter instance
-shelly_rate_limiter = RateLimiter()  # Enforces 1 request per second per device
\ No newline at end of file
+shelly_rate_limiter = RateLimiter()  # Enforces 1 request per 1.1 seconds per server+token
+entsoe_rate_limiter = RateLimiter(base_delay=0.5, burst=4)  # Well below ENTSO-E's 400 requests per minute
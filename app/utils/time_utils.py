@@ -10,11 +10,23 @@ class TimeUtils:
     UTC = pytz.utc  # Standard UTC timezone
     DEFAULT_TZ = pytz.timezone("Europe/Helsinki")  # Default if user timezone is unknown
 
+    _clock = None  # Optional callable returning an aware UTC datetime, see set_clock
+
     @staticmethod
     def now_utc():
         """Returns the current time in UTC."""
+        if TimeUtils._clock is not None:
+            return TimeUtils._clock()
         return datetime.now(UTC).replace(tzinfo=TimeUtils.UTC)
 
+    @staticmethod
+    def set_clock(clock=None):
+        """
+        Replaces the wall clock behind now_utc with a callable (used by price replay).
+        Pass None to restore the wall clock.
+        """
+        TimeUtils._clock = clock
+
     @staticmethod
     def to_utc(dt):
         """Converts a naive or non-UTC aware datetime to UTC."""
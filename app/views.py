@@ -6,6 +6,7 @@ from django.contrib.auth.views import LoginView
 from django.utils import timezone
 from .models import ElectricityPrice, ShellyDevice, DeviceLog, DeviceAssignment
 from .price_views import get_cheapest_hours
+from .bidding_zones import DEFAULT_BIDDING_ZONE
 from .device_assignment_manager import DeviceAssignmentManager
 from app.utils.time_utils import TimeUtils
 from typing import Dict, Any
@@ -90,12 +91,6 @@ def get_common_context(request: HttpRequest) -> Dict[str, Any]:
     start_range = now_utc - timedelta(hours=12)
     end_range = now_utc + timedelta(hours=24)
 
-    prices = list(
-        ElectricityPrice.objects.filter(start_time__range=(start_range, end_range))
-        .order_by("start_time")
-        .values("id", "start_time", "end_time", "price_kwh")
-    )
-
     users = None
     selected_user = request.user
 
@@ -137,6 +132,16 @@ def get_common_context(request: HttpRequest) -> Dict[str, Any]:
     )
     hours_needed = selected_device.run_hours_per_day if selected_device else 0
 
+    # Show the prices of the bidding zone the selected device is in
+    bidding_zone = selected_device.bidding_zone if selected_device else DEFAULT_BIDDING_ZONE
+    prices = list(
+        ElectricityPrice.objects.filter(
+            bidding_zone=bidding_zone, start_time__range=(start_range, end_range)
+        )
+        .order_by("start_time")
+        .values("id", "start_time", "end_time", "price_kwh")
+    )
+
     # Build a map of price_id -> list of assigned device_ids
     assigned_devices_map = {}
     for assignment in assignments:
@@ -146,6 +151,10 @@ def get_common_context(request: HttpRequest) -> Dict[str, Any]:
             assigned_devices_map[price_id] = []
         assigned_devices_map[price_id].append(str(device_id))
 
+    # Round to nearest 15 minutes for current_time_key
+    rounded_minutes = (now_user_tz.minute // 15) * 15
+    current_time_key = f"{now_user_tz.hour:02d}:{rounded_minutes:02d}"  # Format: "HH:MM"
+
     for price in prices:
         price["assigned_devices"] = ",".join(assigned_devices_map.get(price["id"], []))
         # Convert UTC time to user's timezone for hour comparison
@@ -153,14 +162,14 @@ def get_common_context(request: HttpRequest) -> Dict[str, Any]:
         # Store both hour and 15-minute period information
         price["hour"] = str(price_user_tz.hour)
         price["time_key"] = f"{price_user_tz.hour:02d}:{price_user_tz.minute:02d}"  # Format: "HH:MM"
+        if price["start_time"] <= now_utc < price["end_time"]:
+            # Highlight the row covering now, also when it is an hourly price
+            current_time_key = price["time_key"]
         price["start_time"] = price["start_time"].isoformat()
         price["end_time"] = price["end_time"].isoformat()
 
     assignment_manager = DeviceAssignmentManager(request.user)
     devices = assignment_manager.get_device_cheapest_hours(devices)
-    # Round to nearest 15 minutes for current_time_key
-    rounded_minutes = (now_user_tz.minute // 15) * 15
-    current_time_key = f"{now_user_tz.hour:02d}:{rounded_minutes:02d}"  # Format: "HH:MM"
     current_time = now_utc.strftime("%Y-%m-%d %H:%M")  # Keep full timestamp in UTC
     user_timezone_name = TimeUtils.get_user_timezone_name(request.user)
 
@@ -261,7 +270,7 @@ def admin_test_page(request: HttpRequest):
             from django.test import RequestFactory
 
             rf = RequestFactory()
-            fake_request = rf.get("/fake", {"device_id": device_id})
+            fake_request = rf.get("/fake", {"device_id": device_id, "refresh": "1"})
             response = fetch_device_status(fake_request)
             if hasattr(response, "content"):
                 result = response.content.decode("utf-8")
@@ -312,13 +321,14 @@ def admin_test_page(request: HttpRequest):
             cheapest_device_id = request.POST.get("cheapest_device_id")
             device = devices.filter(device_id=cheapest_device_id).first()
             if device:
-                assignment_manager = DeviceAssignmentManager(device.user)
                 # Only consider prices from now forward
                 now_utc = TimeUtils.now_utc()
                 prices_list = list(
-                    ElectricityPrice.objects.filter(start_time__gte=now_utc)
+                    ElectricityPrice.objects.filter(
+                        bidding_zone=device.bidding_zone, start_time__gte=now_utc
+                    )
                     .order_by("start_time")
-                    .values("start_time", "price_kwh", "id")
+                    .values("start_time", "resolution_minutes", "price_kwh", "id")
                 )
                 cheapest_hours = get_cheapest_hours(
                     prices_list,
@@ -328,27 +338,10 @@ def admin_test_page(request: HttpRequest):
                     device.auto_assign_price_threshold,
                     local_tz,
                 )
-                assigned_count = 0
-                for hour in cheapest_hours:
-                    price_entry = next(
-                        (
-                            p
-                            for p in prices_list
-                            if TimeUtils.to_utc(p["start_time"]).strftime(
-                                "%Y-%m-%d %H:%M"
-                            )
-                            == hour.strftime("%Y-%m-%d %H:%M")
-                        ),
-                        None,
-                    )
-                    if price_entry:
-                        assignment, created = DeviceAssignment.objects.get_or_create(
-                            user=device.user,  # assign to device owner
-                            device=device,
-                            electricity_price_id=price_entry["id"],
-                        )
-                        if created:
-                            assigned_count += 1
+                price_ids = {p["start_time"]: p["id"] for p in prices_list}
+                assigned_count = DeviceAssignmentManager.assign_prices(
+                    [(device, [price_ids[hour] for hour in cheapest_hours if hour in price_ids])]
+                )
                 result = f"Assigned {assigned_count} cheapest hours to {device.familiar_name} for user {device.user.username} (override 24h check)"
             else:
                 result = "Invalid device selection for cheapest hours assignment."
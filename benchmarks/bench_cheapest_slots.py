@@ -0,0 +1,110 @@
+"""
+Benchmark of the fleet-wide cheapest-slot planner against the per-device loop.
+
+Builds a horizon of 15-minute prices and a fleet with random day/night transfer
+prices, run hours and auto-assign thresholds, then times the previous
+per-device selection (Decimal totals, pytz localization and a full sort for
+every device) against one (devices x periods) cost matrix with argpartition.
+
+Usage: python benchmarks/bench_cheapest_slots.py [--devices 100 1000 10000] [--periods 192] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon  # noqa: E402
+
+LOCAL_TZ = pytz.timezone("Europe/Helsinki")
+
+
+def build_prices(periods: int) -> list:
+    rng = random.Random(periods)
+    start = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    return [
+        {
+            "start_time": start + timedelta(minutes=15 * i),
+            "price_kwh": Decimal(str(round(rng.uniform(-0.5, 25), 5))),
+            "resolution_minutes": 15,
+        }
+        for i in range(periods)
+    ]
+
+
+def build_fleet(devices: int) -> list:
+    rng = random.Random(devices)
+    return [
+        (
+            Decimal(str(round(rng.uniform(2, 6), 1))),
+            Decimal(str(round(rng.uniform(1, 3), 1))),
+            rng.randint(0, 12),
+            Decimal(str(round(rng.uniform(0, 4), 1))) if rng.random() < 0.3 else None,
+        )
+        for _ in range(devices)
+    ]
+
+
+def per_device_path(prices: list, fleet: list) -> int:
+    """The previous get_cheapest_hours, called once per device."""
+    selected = 0
+    for day, night, hours, threshold in fleet:
+        enriched, forced = [], []
+        for entry in prices:
+            ts = entry["start_time"]
+            local_ts = ts.astimezone(LOCAL_TZ)
+            is_daytime = (7 <= local_ts.hour < 22) or (local_ts.hour == 22 and local_ts.minute == 0)
+            total = Decimal(str(entry["price_kwh"])) + (day if is_daytime else night)
+            enriched.append((total, ts))
+            if threshold is not None and total <= threshold:
+                forced.append(ts)
+        enriched.sort(key=lambda x: x[0])
+        cheapest = {slot for _, slot in enriched[: hours * 4]}
+        selected += len(cheapest | set(forced))
+    return selected
+
+
+def matrix_path(prices: list, fleet: list) -> int:
+    horizon = PriceHorizon.from_rows(prices, LOCAL_TZ)
+    return int(CheapestSlotPlanner.select(horizon, *zip(*fleet)).sum())
+
+
+def best_of(repeat: int, func, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--periods", type=int, default=192)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    prices = build_prices(args.periods)
+    print(f"{'devices':>8} {'periods':>8} {'per device':>12} {'matrix':>10} {'speedup':>8}")
+    for devices in args.devices:
+        fleet = build_fleet(devices)
+        loop_seconds, loop_selected = best_of(args.repeat, per_device_path, prices, fleet)
+        matrix_seconds, matrix_selected = best_of(args.repeat, matrix_path, prices, fleet)
+        assert loop_selected == matrix_selected, (loop_selected, matrix_selected)
+        print(
+            f"{devices:>8} {args.periods:>8} {loop_seconds:>11.3f}s {matrix_seconds:>9.3f}s "
+            f"{loop_seconds / matrix_seconds:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark of the streaming ENTSO-E parser against the entsoe-py + pandas path.
+
+Builds a synthetic multi-month day-ahead document (one PT15M A03 TimeSeries per
+day with some repeated values left out) and times both paths from raw XML to
+15-minute (start, end, c/kWh) rows ready for persistence.
+
+Usage: python benchmarks/bench_entsoe_parser.py [--days 30 90 180] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.entsoe_parser import parse_day_ahead  # noqa: E402
+
+CONVERSION = Decimal("0.1")
+
+
+def build_document(days: int) -> str:
+    rng = random.Random(days)
+    start = datetime(2025, 1, 1, 23, tzinfo=timezone.utc)
+    series = []
+    for day in range(days):
+        period_start = start + timedelta(days=day)
+        period_end = period_start + timedelta(days=1)
+        points = []
+        price = 50.0
+        for position in range(1, 97):
+            # A03: a repeated price may be left out
+            if position > 1 and rng.random() < 0.2:
+                continue
+            price = round(rng.uniform(-5, 250), 2)
+            points.append(
+                f"<Point><position>{position}</position><price.amount>{price}</price.amount></Point>"
+            )
+        series.append(
+            "<TimeSeries><mRID>1</mRID><curveType>A03</curveType><Period><timeInterval>"
+            f"<start>{period_start:%Y-%m-%dT%H:%MZ}</start><end>{period_end:%Y-%m-%dT%H:%MZ}</end>"
+            f"</timeInterval><resolution>PT15M</resolution>{''.join(points)}</Period></TimeSeries>"
+        )
+    return (
+        '<Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:3">'
+        + "".join(series)
+        + "</Publication_MarketDocument>"
+    )
+
+
+def pandas_path(xml: str) -> list:
+    import pandas as pd
+    from entsoe.parsers import parse_prices
+
+    parsed = parse_prices(xml)
+    series = next(s for s in parsed.values() if len(s))
+    series = series.resample("15min").ffill()
+    return [
+        (ts, ts + pd.Timedelta(minutes=15), Decimal(str(price)) * CONVERSION)
+        for ts, price in series.items()
+    ]
+
+
+def streaming_path(xml: str) -> list:
+    series = parse_day_ahead(xml).preferred().to_resolution(15)
+    step = timedelta(minutes=15)
+    return [
+        (ts, ts + step, Decimal(repr(price)) * CONVERSION) for ts, price in series.items()
+    ]
+
+
+def best_of(func, xml: str, repeat: int) -> tuple:
+    best, rows = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = func(xml)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, nargs="+", default=[30, 90, 180])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'days':>5} {'MB':>6} {'rows':>7} {'pandas s':>9} {'stream s':>9} {'speedup':>8}")
+    for days in args.days:
+        xml = build_document(days)
+        old, old_rows = best_of(pandas_path, xml, args.repeat)
+        new, new_rows = best_of(streaming_path, xml, args.repeat)
+        if old_rows != new_rows:
+            print(f"row count mismatch: pandas={old_rows} stream={new_rows}")
+        print(
+            f"{days:>5} {len(xml) / 1e6:>6.1f} {new_rows:>7} {old:>9.3f} {new:>9.3f} {old / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
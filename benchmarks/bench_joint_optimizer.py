@@ -0,0 +1,75 @@
+"""
+Benchmark of the site power-cap repair.
+
+Plans one site of devices with random transfer prices, run hours and rated
+power independently with the cheapest-period planner, then times fitting the
+plans under a cap of a share of the site's total rated power, and reports the
+peak load before and after, the periods moved and dropped and the extra cost.
+
+Usage: python benchmarks/bench_joint_optimizer.py [--devices 50 200 500] [--cap-share 0.25] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_cheapest_slots import LOCAL_TZ, best_of  # noqa: E402
+from bench_schedule_solver import build_prices  # noqa: E402
+
+from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon  # noqa: E402
+from app.joint_optimizer import JointOptimizer  # noqa: E402
+
+
+def build_site(devices: int) -> list:
+    rng = random.Random(devices)
+    return [
+        (
+            Decimal(str(round(rng.uniform(2, 6), 1))),
+            Decimal(str(round(rng.uniform(1, 3), 1))),
+            rng.randint(1, 6),
+            None,
+            rng.choice([1000, 2000, 3000]),
+        )
+        for _ in range(devices)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--periods", type=int, default=192)
+    parser.add_argument("--cap-share", type=float, default=0.25)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    horizon = PriceHorizon.from_rows(build_prices(args.periods), LOCAL_TZ)
+    print(
+        f"{'devices':>8} {'cap kW':>7} {'peak kW':>8} {'after':>6} {'moved':>6} {'dropped':>8} "
+        f"{'time':>8} {'cost':>7}"
+    )
+    for devices in args.devices:
+        day, night, hours, thresholds, power = zip(*build_site(devices))
+        power = np.asarray(power)
+        costs = CheapestSlotPlanner.cost_matrix(horizon, day, night)
+        selected = CheapestSlotPlanner.select(horizon, day, night, hours, thresholds)
+        cap = int(power.sum() * args.cap_share)
+
+        seconds, (fitted, moved, dropped) = best_of(
+            args.repeat, JointOptimizer.fit_to_cap, costs, selected, power, cap, [True] * devices, horizon.minutes
+        )
+        peak, after = (max(power_row) / 1000 for power_row in (power @ selected, power @ fitted))
+        extra_cost = (costs * fitted).sum() / (costs * selected).sum() - 1
+        print(
+            f"{devices:>8} {cap / 1000:>7.0f} {peak:>8.0f} {after:>6.0f} {moved:>6} {dropped:>8} "
+            f"{seconds:>7.3f}s {extra_cost:>+6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
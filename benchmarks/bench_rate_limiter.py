@@ -0,0 +1,58 @@
+"""
+Microbenchmark for the per-key token-bucket RateLimiter.
+
+Every key gets one worker thread that keeps reserving and sleeping for slots
+for a fixed duration. With per-key buckets the total throughput should grow
+linearly with the number of keys (requests/s ~= keys / base_delay).
+
+Usage: python benchmarks/bench_rate_limiter.py [--delay 0.01] [--seconds 2]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.rate_limiter import RateLimiter  # noqa: E402
+
+
+def run(keys: int, base_delay: float, seconds: float) -> float:
+    limiter = RateLimiter(base_delay=base_delay)
+    counts = [0] * keys
+    deadline = time.monotonic() + seconds
+
+    def worker(index: int):
+        server = f"https://server-{index}.example"
+        while time.monotonic() < deadline:
+            limiter.wait_if_needed(server, f"token-{index}")
+            counts[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(keys)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--delay", type=float, default=0.01, help="Seconds per token")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Run time per step")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'keys':>5} {'req/s':>10} {'ideal':>10} {'scaling':>8}")
+    for keys in (1, 2, 4, 8, 16, 32):
+        throughput = run(keys, args.delay, args.seconds)
+        baseline = baseline or throughput
+        ideal = keys / args.delay
+        print(f"{keys:>5} {throughput:>10.1f} {ideal:>10.1f} {throughput / baseline:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
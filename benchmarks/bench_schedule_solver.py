@@ -0,0 +1,95 @@
+"""
+Benchmark of the run-block schedule solver against the cheapest-period planner.
+
+Builds a horizon of 15-minute prices and a fleet with random transfer prices,
+run hours, minimum runs, off-time limits and run limits, then times both
+planners on the whole fleet and compares how often the devices are switched
+on and what the planned periods cost (run-block cost over cheapest cost).
+
+Usage: python benchmarks/bench_schedule_solver.py [--devices 100 1000 10000] [--periods 192] [--repeat 3]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_cheapest_slots import LOCAL_TZ, best_of  # noqa: E402
+
+from app.cheapest_slot_planner import CheapestSlotPlanner, PriceHorizon  # noqa: E402
+from app.schedule_solver import ScheduleSolver  # noqa: E402
+
+
+def build_prices(periods: int) -> list:
+    """Prices with a morning and an evening peak plus noise, as spot prices move."""
+    rng = random.Random(periods)
+    start = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    prices = []
+    for i in range(periods):
+        hour = (12 + i / 4) % 24
+        shape = math.exp(-((hour - 7) ** 2) / 4) + 1.2 * math.exp(-((hour - 17) ** 2) / 6)
+        price = 6 + 8 * shape + rng.gauss(0, 1.5)
+        prices.append(
+            {
+                "start_time": start + timedelta(minutes=15 * i),
+                "price_kwh": Decimal(str(round(price, 5))),
+                "resolution_minutes": 15,
+            }
+        )
+    return prices
+
+
+def build_fleet(devices: int) -> list:
+    rng = random.Random(devices)
+    return [
+        (
+            Decimal(str(round(rng.uniform(2, 6), 1))),
+            Decimal(str(round(rng.uniform(1, 3), 1))),
+            rng.randint(0, 12),
+            None,
+            rng.choice([15, 30, 60, 120]),
+            rng.choice([None, 120, 240, 480]),
+            rng.choice([1, 2, 3, 4, 6, 8]),
+        )
+        for _ in range(devices)
+    ]
+
+
+def switch_ons(selected: np.ndarray) -> float:
+    """Average number of runs (off to on switches) per device."""
+    return float((np.diff(selected.astype(np.int8), axis=1, prepend=0) == 1).sum(axis=1).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--periods", type=int, default=192)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    horizon = PriceHorizon.from_rows(build_prices(args.periods), LOCAL_TZ)
+    print(
+        f"{'devices':>8} {'cheapest':>10} {'solver':>10} {'runs cheapest':>14} {'runs solver':>12} {'cost':>7}"
+    )
+    for devices in args.devices:
+        fleet = list(zip(*build_fleet(devices)))
+        cheapest_seconds, cheapest = best_of(args.repeat, CheapestSlotPlanner.select, horizon, *fleet[:4])
+        solver_seconds, blocks = best_of(args.repeat, ScheduleSolver.select, horizon, *fleet)
+
+        costs = CheapestSlotPlanner.cost_matrix(horizon, fleet[0], fleet[1])
+        extra_cost = (costs * blocks).sum() / (costs * cheapest).sum() - 1
+        print(
+            f"{devices:>8} {cheapest_seconds:>9.3f}s {solver_seconds:>9.3f}s "
+            f"{switch_ons(cheapest):>14.1f} {switch_ons(blocks):>12.1f} {extra_cost:>+6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cold-start cost of one web worker: time and peak RSS to load the WSGI application
+and every URLconf view module, as a gunicorn worker does before its first request.
+Each sample runs in a fresh interpreter against an empty SQLite file, so app
+startup skips the database work and the scheduler.
+
+Usage: python benchmarks/bench_worker_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("pandas", "numpy", "entsoe")
+
+WORKER = """
+import json, resource, sys, time
+started = time.perf_counter()
+from project.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+import app.tasks
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": sorted(m for m in %r if m in sys.modules),
+}))
+""" % (HEAVY_MODULES,)
+
+
+def worker_env(db_path: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        DJANGO_SETTINGS_MODULE="project.settings",
+        DJANGO_SQLITE_PATH=db_path,
+        DJANGO_SECRET_KEY=env.get("DJANGO_SECRET_KEY", "startup-benchmark"),
+    )
+    return env
+
+
+def sample(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER],
+        cwd=PROJECT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = worker_env(os.path.join(tmp, "empty.sqlite3"))
+        samples = [sample(env) for _ in range(args.runs)]
+
+    seconds = [s["seconds"] for s in samples]
+    rss = [s["rss_mb"] for s in samples]
+    print(f"runs:            {args.runs}")
+    print(f"cold start:      median {statistics.median(seconds):.3f} s, min {min(seconds):.3f} s")
+    print(f"peak RSS:        median {statistics.median(rss):.1f} MB")
+    print(f"heavy modules:   {', '.join(samples[-1]['heavy']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
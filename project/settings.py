@@ -197,3 +197,8 @@ APSCHEDULER_RUN_NOW_TIMEOUT = 25  # Shorter timeout for immediate jobs
 APSCHEDULER_CONNECTION_OPTIONS = {
     'isolation_level': None  # Disable transaction isolation for APScheduler
 }
+
+# ENTSO-E response cache (raw XML next to the database unless overridden)
+ENTSOE_CACHE_DIR = os.environ.get("ENTSOE_CACHE_DIR") or str(
+    Path(DATABASES["default"]["NAME"]).parent / "entsoe_cache"
+)